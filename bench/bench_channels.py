@@ -0,0 +1,93 @@
+"""Measures what each extra channel costs the bot.
+
+Run from the repository root:  python bench/bench_channels.py [1,10,50,100]
+
+For each channel count, starts one ChatNetwork with a TwitchBot per channel
+against the fake IRC server, waits until every channel is joined, sends
+!uptime (plus the active-earn write) in each channel and waits for all the replies.
+Reports IRC connections, threads, Python heap (tracemalloc) and RSS, and
+checks every reply went back to the channel it was asked in.
+"""
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from fake_twitch import FakeTwitchServer, make_privmsg
+from fake_db import StandInDatabase
+
+import db as bot_db
+from chat_network import ChatNetwork
+from chat_queue import TokenBucket
+from twitch_bot import TwitchBot
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(count: int) -> dict:
+    db = StandInDatabase(songs=100)
+    bot_db.pool = bot_db.ConnectionPool(db.connect)
+    server = FakeTwitchServer().start()
+    threads_before = threading.active_count()
+    tracemalloc.start()
+    network = ChatNetwork("127.0.0.1", server.port)
+    network.outbound.bucket = TokenBucket(10 ** 9, 1, 10 ** 9)
+    channels = [f"chan{i:03d}" for i in range(count)]
+    for channel in channels:
+        db.create_points_table(TwitchBot(channel, network).points_table)
+    thread = threading.Thread(target=network.run, daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 20
+    while len(server.channels) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Let the "now online" announcements drain before asking.
+    time.sleep(0.2)
+    asked = len(server.sent_privmsgs())
+    start = time.perf_counter()
+    for i, channel in enumerate(channels):
+        line = make_privmsg(f"viewer{i}", "!uptime", channel=channel, msg_id=i)
+        server.push_to(channel, (line + "\r\n").encode())
+    while len(server.sent_privmsgs()) - asked < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    replies = [l for _, l in server.sent_privmsgs()[asked:] if "has been live" in l]
+    misrouted = sum(1 for l in replies if not l.startswith("PRIVMSG #chan"))
+    result = {
+        "channels": count,
+        "joined": len(server.channels),
+        "connections": len(network.shards),
+        "threads": threading.active_count() - threads_before,
+        "heap_kb": heap / 1024,
+        "rss_mb": rss_mb(),
+        "replies": len(replies),
+        "misrouted": misrouted,
+        "reply_ms": elapsed * 1000,
+    }
+    network.stop()
+    thread.join(5)
+    server.stop()
+    db.close()
+    return result
+
+
+def main(counts: list) -> None:
+    print(f"{'channels':>8} {'joined':>6} {'conns':>5} {'threads':>7} {'heap KB':>9} "
+          f"{'KB/chan':>8} {'RSS MB':>7} {'replies':>7} {'all-reply ms':>12}")
+    for count in counts:
+        r = measure(count)
+        print(f"{r['channels']:>8} {r['joined']:>6} {r['connections']:>5} {r['threads']:>7} "
+              f"{r['heap_kb']:>9.0f} {r['heap_kb'] / count:>8.1f} {r['rss_mb']:>7.1f} "
+              f"{r['replies']:>7} {r['reply_ms']:>12.1f}")
+        if r["misrouted"]:
+            print(f"  {r['misrouted']} replies went to the wrong channel")
+
+
+if __name__ == "__main__":
+    main([int(c) for c in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1, 10, 50, 100])
@@ -0,0 +1,106 @@
+"""Counts database round trips spent on points earnings, before and after
+the write-behind ledger.
+
+Run from the repository root:  python bench/bench_earnings.py [chatters] [minutes]
+
+Simulates a channel where each of `chatters` viewers talks every ~20
+seconds for `minutes` minutes, earning active points at most once per
+cooldown, plus a passive payout to everyone each interval. "Before"
+writes every earning the way update_user_points used to (upsert, commit,
+SELECT); "after" feeds the same earnings to PointsLedger and flushes it on
+the configured interval of simulated time. Both run against the SQLite
+stand-in; the final balances must match.
+"""
+import random
+import sys
+import time
+
+from fake_db import StandInDatabase
+
+import db as bot_db
+from config import POINTS_ACTIVE_AMOUNT, POINTS_ACTIVE_COOLDOWN, POINTS_PASSIVE_AMOUNT, POINTS_FLUSH_INTERVAL
+from ledger import PointsLedger
+
+PASSIVE_EVERY = 600  # seconds, the default passive_earn_interval_minutes
+
+
+def earnings(chatters: int, minutes: int, seed: int = 3):
+    """Yields (second, user, amount, active) in time order."""
+    rng = random.Random(seed)
+    next_talk = {f"viewer{i}": rng.uniform(0, 20) for i in range(chatters)}
+    last_earn = {}
+    for second in range(minutes * 60):
+        for user, due in next_talk.items():
+            if due <= second:
+                next_talk[user] = second + rng.uniform(10, 30)
+                if second - last_earn.get(user, -POINTS_ACTIVE_COOLDOWN) >= POINTS_ACTIVE_COOLDOWN:
+                    last_earn[user] = second
+                    yield second, user, POINTS_ACTIVE_AMOUNT, True
+        if second and second % PASSIVE_EVERY == 0:
+            for user in next_talk:
+                yield second, user, POINTS_PASSIVE_AMOUNT, False
+
+
+def legacy_update(user: str, amount: int, is_active: bool) -> int:
+    conn = bot_db.get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            active_update_sql = ", last_active = NOW()" if is_active else ""
+            sql = f"""
+                INSERT INTO community_points (username, points, last_seen{", last_active" if is_active else ""})
+                VALUES (%s, %s, NOW(){", NOW()" if is_active else ""})
+                ON DUPLICATE KEY UPDATE points = points + %s, last_seen = NOW(){active_update_sql};
+            """
+            cursor.execute(sql, (user, max(0, amount), amount))
+            conn.commit()
+            cursor.execute("SELECT points FROM community_points WHERE username = %s", (user,))
+            result = cursor.fetchone()
+            return result['points'] if result else 0
+    finally:
+        conn.close()
+
+
+def balances(db: StandInDatabase) -> dict:
+    conn = db.connect()
+    with conn.cursor() as c:
+        c.execute("SELECT username, points FROM community_points")
+        rows = {r["username"]: r["points"] for r in c.fetchall()}
+    conn.close()
+    return rows
+
+
+def run(name: str, chatters: int, minutes: int, ledger: bool):
+    db = StandInDatabase(songs=10)
+    bot_db.pool = bot_db.ConnectionPool(db.connect)
+    book = PointsLedger(flush_interval=POINTS_FLUSH_INTERVAL)
+    count = 0
+    next_flush = POINTS_FLUSH_INTERVAL
+    start = time.perf_counter()
+    for second, user, amount, active in earnings(chatters, minutes):
+        if ledger:
+            while second >= next_flush:
+                book.flush()
+                next_flush += POINTS_FLUSH_INTERVAL
+            book.add("community_points", user, amount, active)
+        else:
+            legacy_update(user, amount, active)
+        count += 1
+    if ledger:
+        book.flush()
+    elapsed = time.perf_counter() - start
+    trips = db.statements + db.commits
+    print(f"{name:<8} {count:>9,} earnings  {db.statements:>8,} statements  {db.commits:>7,} commits  "
+          f"{trips:>8,} round trips ({trips / count:.3f}/earning)  {elapsed:6.2f}s")
+    result = balances(db)
+    db.close()
+    return result
+
+
+def main(chatters: int = 2000, minutes: int = 30) -> None:
+    before = run("before", chatters, minutes, ledger=False)
+    after = run("after", chatters, minutes, ledger=True)
+    print("balances match" if before == after else "BALANCES DIFFER")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
@@ -0,0 +1,68 @@
+"""Measures how many chat lines per second TwitchBot's transport frames and parses.
+
+Run from the repository root:  python bench/bench_irc_throughput.py [count]
+
+A local fake IRC server pushes a synthetic chat log cut at random byte
+offsets; the bot must reassemble every line intact. The old recv/split
+approach is replayed over the same chunks for comparison.
+"""
+import random
+import sys
+import threading
+import time
+
+from fake_twitch import FakeTwitchServer, synthetic_chat, chunked
+from twitch_bot import TwitchBot
+
+
+def naive_mangled(lines: list[str], seed: int = 1) -> int:
+    """Counts lines the previous `recv(2048).split('\\r\\n')` loop would have broken."""
+    data = "".join(l + "\r\n" for l in lines).encode("utf-8")
+    expected = set(lines)
+    mangled = 0
+    for chunk in chunked(data, random.Random(seed), 2048, 2048):
+        for piece in chunk.decode("utf8", "ignore").split("\r\n"):
+            if piece and piece not in expected:
+                mangled += 1
+    return mangled
+
+
+def main(count: int = 200_000) -> None:
+    lines = synthetic_chat(count)
+    server = FakeTwitchServer().start()
+    bot = TwitchBot(channel="radio", server="127.0.0.1", port=server.port)
+
+    parsed = 0
+    intact = 0
+    done = threading.Event()
+    expected = {l.rsplit(" :", 1)[1] for l in lines}
+
+    def on_message(message) -> None:
+        nonlocal parsed, intact
+        if message.command == "PRIVMSG" and message.user:
+            parsed += 1
+            intact += message.text in expected
+            if parsed == count:
+                done.set()
+
+    t = threading.Thread(target=bot.run, args=(on_message,), daemon=True)
+    t.start()
+    if not server.joined.wait(10):
+        sys.exit("bot never joined the fake server")
+
+    start = time.perf_counter()
+    server.push_lines(lines)
+    done.wait(120)
+    elapsed = time.perf_counter() - start
+    bot.stop()
+    server.stop()
+
+    print(f"lines pushed:      {count}")
+    print(f"lines parsed:      {parsed} ({intact} intact)")
+    print(f"elapsed:           {elapsed:.3f}s")
+    print(f"throughput:        {parsed / elapsed:,.0f} msg/s")
+    print(f"old loop mangled:  {naive_mangled(lines)} lines at 2048-byte recv boundaries")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
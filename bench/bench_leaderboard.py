@@ -0,0 +1,97 @@
+"""Checks the in-memory leaderboard against ORDER BY points DESC while
+points change, and counts the queries it needs.
+
+Run from the repository root:  python bench/bench_leaderboard.py [users] [minutes]
+
+`users` viewers start with long-tailed balances. Every simulated second
+some of them chat and earn through the ledger (flushed on the configured
+interval), and now and then one spends on a request, a !playnext or a
+gamble, or gives points away, through the same TwitchBot code chat uses.
+Each second the top 5 is read from the leaderboard and compared with the
+SQL it replaces.
+"""
+import random
+import sys
+import time
+
+from fake_db import StandInDatabase
+
+import db as bot_db
+import metrics
+from config import POINTS_FLUSH_INTERVAL
+from leaderboard import leaderboards
+from ledger import ledger
+from twitch_bot import TwitchBot
+
+
+def sql_top(db: StandInDatabase, k: int) -> list:
+    conn = db.connect()
+    with conn.cursor() as c:
+        c.execute(f"SELECT username, points FROM community_points ORDER BY points DESC, username LIMIT {k}")
+        rows = [(r["username"], r["points"]) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+
+def main(users: int = 100_000, minutes: int = 30, seed: int = 5) -> None:
+    rng = random.Random(seed)
+    db = StandInDatabase(songs=10)
+    bot_db.pool = bot_db.ConnectionPool(db.connect)
+    raw = db.connect()
+    with raw.cursor() as c:
+        for i in range(0, users, 5000):
+            rows = [(f"viewer{n}", int(rng.paretovariate(1.2) * 100)) for n in range(i, min(users, i + 5000))]
+            c.execute("INSERT INTO community_points (username, points) VALUES "
+                      + ", ".join(["(%s, %s)"] * len(rows)), [v for row in rows for v in row])
+    raw.commit()
+    raw.close()
+
+    bot = TwitchBot()  # the primary channel, which keeps community_points
+    bot.send = lambda *args, **kwargs: None
+    chatters = [f"viewer{n}" for n in rng.sample(range(users), min(users, 3000))]
+    whales = [name for name, _ in sql_top(db, 40)]
+
+    mismatches = reads = 0
+    memory_us = []
+    sql_ms = []
+    for second in range(minutes * 60):
+        for user in rng.sample(chatters, min(40, len(chatters))):
+            ledger.add("community_points", user, rng.choice((1, 1, 5, 50)), active=True)
+        if second % POINTS_FLUSH_INTERVAL == 0:
+            ledger.flush()
+        if rng.random() < 0.3:
+            spender = rng.choice(whales if rng.random() < 0.5 else chatters)
+            kind = rng.random()
+            if kind < 0.5:
+                bot.update_user_points(spender, -rng.choice((25, 250)))
+            elif kind < 0.8:
+                bot.update_user_points(spender, rng.choice((-1, 1)) * rng.randint(1, 500))
+            else:
+                bot.give_points(spender, rng.choice(chatters), rng.randint(1, 2000))
+
+        start = time.perf_counter()
+        top = leaderboards.top("community_points", 5)
+        memory_us.append((time.perf_counter() - start) * 1e6)
+        start = time.perf_counter()
+        expected = sql_top(db, 5)
+        sql_ms.append((time.perf_counter() - start) * 1000)
+        reads += 1
+        if top != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"  second {second}: leaderboard {top}\n             SQL {expected}")
+
+    counters = metrics.snapshot()["counters"]
+    memory_us.sort()
+    sql_ms.sort()
+    print(f"{users:,} users, {reads:,} leaderboard reads over {minutes} simulated minutes")
+    print(f"  table re-reads: {counters.get('leaderboard.seeded', 0)}, "
+          f"balance lookups: {counters.get('leaderboard.lookups', 0)}")
+    print(f"  leaderboard p50 {memory_us[len(memory_us) // 2]:.1f} µs, "
+          f"ORDER BY points DESC LIMIT 5 p50 {sql_ms[len(sql_ms) // 2]:.1f} ms")
+    print(f"  mismatches: {mismatches}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
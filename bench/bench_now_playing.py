@@ -0,0 +1,142 @@
+"""Announcement latency and queries per hour of the now-playing poller.
+
+Run from the repository root:  python bench/bench_now_playing.py [hours] [live_seconds]
+
+First a simulated broadcast of `hours` hours on a simulated clock: tracks
+of 2.5 to 7 minutes, each cut short by a crossfade of up to 6 seconds, and
+now and then skipped by the DJ partway through. The fixed 5-second read
+of the whole station state is compared with the probe-first poller,
+which waits on StationPoller.next_delay(). Latency is how long a track
+had been on air when the poller first saw it.
+
+Then `live_seconds` of the real StationPoller against the SQLite
+stand-in, with tracks a few seconds long, to check the same numbers come
+out of the station.* metrics.
+"""
+import random
+import sys
+import threading
+import time
+
+from fake_db import StandInDatabase
+
+import db as bot_db
+import metrics
+from station import StationPoller
+
+FIXED_INTERVAL = 5
+FIXED_QUERIES = 4  # recent history, next queued, newest and oldest pending requests
+
+
+def playlist(hours: float, rng: random.Random) -> list:
+    """[(start, nominal duration)] in seconds."""
+    tracks = []
+    t = 0.0
+    while t < hours * 3600:
+        duration = rng.uniform(150, 420)
+        tracks.append((t, duration))
+        if rng.random() < 0.02:
+            t += rng.uniform(30, duration)  # skipped
+        else:
+            t += duration - rng.uniform(0, 6)
+    return tracks
+
+
+def on_air(tracks: list, t: float) -> int:
+    lo, hi = 0, len(tracks) - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if tracks[mid][0] <= t:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def simulate(tracks: list, hours: float, next_delay) -> tuple:
+    """Polls through the playlist. next_delay(remaining) -> seconds. Returns (queries, latencies)."""
+    t = 0.0
+    seen = None
+    queries = 0
+    latencies = []
+    while t < hours * 3600:
+        current = on_air(tracks, t)
+        if current != seen:
+            if seen is not None:
+                latencies.append(t - tracks[current][0])
+            seen = current
+        queries += 1
+        start, duration = tracks[seen]
+        t += next_delay(start + duration - t)
+    return queries, latencies
+
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def simulated(hours: float) -> None:
+    tracks = playlist(hours, random.Random(3))
+    poller = StationPoller(interval=FIXED_INTERVAL)
+    fixed_polls, fixed_lat = simulate(tracks, hours, lambda remaining: FIXED_INTERVAL)
+    probes, probe_lat = simulate(tracks, hours, poller.next_delay)
+    changes = len(probe_lat)
+    print(f"simulated {hours:g} h, {len(tracks)} tracks")
+    print(f"{'':<22}{'queries/h':>10}{'latency p50':>13}{'p95':>8}{'max':>8}")
+    print(f"{'fixed 5 s, full read':<22}{fixed_polls * FIXED_QUERIES / hours:>10.0f}"
+          f"{pct(fixed_lat, 50):>12.1f}s{pct(fixed_lat, 95):>7.1f}s{max(fixed_lat):>7.1f}s")
+    # The probe-first poller adds one fetch of recent history per track change.
+    print(f"{'probe, duration-aware':<22}{(probes + changes) / hours:>10.0f}"
+          f"{pct(probe_lat, 50):>12.1f}s{pct(probe_lat, 95):>7.1f}s{max(probe_lat):>7.1f}s")
+
+
+def live(seconds: float) -> None:
+    db = StandInDatabase(songs=40)
+    bot_db.pool = bot_db.ConnectionPool(db.connect)
+    conn = db.connect()
+    with conn.cursor() as c:
+        c.execute("UPDATE songs SET duration = 4 + (ID % 5)")
+    conn.commit()
+
+    def play(stop: threading.Event) -> None:
+        rng = random.Random(5)
+        song = 11
+        while not stop.is_set():
+            with conn.cursor() as c:
+                c.execute("INSERT INTO history (trackID, artist, title, date_played) "
+                          "SELECT ID, artist, title, datetime('now', 'localtime') FROM songs WHERE ID = %s", (song,))
+                c.execute("SELECT duration FROM songs WHERE ID = %s", (song,))
+                duration = c.fetchone()["duration"]
+            conn.commit()
+            stop.wait(duration - rng.uniform(0, 1))
+            song = song % 40 + 1
+
+    poller = StationPoller(interval=FIXED_INTERVAL, idle_interval=30)
+    stop = threading.Event()
+    player = threading.Thread(target=play, args=(stop,), daemon=True)
+    before = metrics.snapshot()["counters"].get("station.queries", 0)
+    player.start()
+    poller.start()
+    time.sleep(seconds)
+    poller.stop()
+    stop.set()
+    player.join()
+    conn.close()
+    snap = metrics.snapshot()
+    lat = snap["histograms"].get("station.change_latency_ms", {})
+    queries = snap["counters"].get("station.queries", 0) - before
+    print(f"live {seconds:g} s against the stand-in, tracks of 4-8 s: {snap['counters'].get('station.changes', 0)} "
+          f"changes, {queries} queries ({queries / seconds * 3600:.0f}/h), latency p50 {lat.get('p50', 0)} ms, "
+          f"p99 {lat.get('p99', 0)} ms (1 s timestamps)")
+    db.close()
+
+
+def main(hours: float = 24, live_seconds: float = 30) -> None:
+    simulated(hours)
+    if live_seconds:
+        live(live_seconds)
+
+
+if __name__ == "__main__":
+    main(*(float(a) for a in sys.argv[1:3]))
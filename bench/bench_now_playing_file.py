@@ -0,0 +1,114 @@
+"""Replays the ways RadioDJ's now-playing export gets written and checks what the watcher reports.
+
+Run from the repository root:  python bench/bench_now_playing_file.py
+
+Each scenario writes a temporary file the way an exporter might: in
+chunks with pauses, truncated first, replaced by a rename, rewritten in a
+burst, or rewritten unchanged. The watcher must report exactly the
+complete tracks listed, never a half-written one, and is timed from the
+last write to the report. Runs with inotify (where available) and with
+stat() polling. Exits non-zero if any scenario reports the wrong tracks.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import fake_twitch  # noqa: F401  (puts src/ on sys.path)
+from now_playing_file import NowPlayingFile
+
+CHUNK_PAUSE = 0.03
+
+
+def write_chunks(path: str, chunks: list) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            f.flush()
+            time.sleep(CHUNK_PAUSE)
+
+
+def replace(path: str, text: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def truncate_then_write(path: str, text: str) -> None:
+    open(path, "w").close()
+    time.sleep(CHUNK_PAUSE)
+    write_chunks(path, [text])
+
+
+def burst(path: str, texts: list) -> None:
+    for text in texts:
+        write_chunks(path, [text])
+
+
+# (name, writer(path), tracks the watcher should report)
+SCENARIOS = [
+    ("chunked text", lambda p: write_chunks(p, ["Daft Pu", "nk - One More", " Time\r\n"]),
+     [("Daft Punk", "One More Time")]),
+    ("truncate, then write", lambda p: truncate_then_write(p, "Air - La Femme d'Argent"),
+     [("Air", "La Femme d'Argent")]),
+    ("replaced by rename", lambda p: replace(p, "Burial - Archangel"),
+     [("Burial", "Archangel")]),
+    ("burst of rewrites", lambda p: burst(p, ["Moby - Porcelain", "Moby - Natural Blues", "Bonobo - Kerala"]),
+     [("Bonobo", "Kerala")]),
+    ("same track rewritten", lambda p: write_chunks(p, ["Bonobo - Kerala"]),
+     []),
+    ("chunked XML", lambda p: write_chunks(p, ["<Song><Artist>Röyk", "sopp</Artist><Tit", "le>Eple</Title></Song>"]),
+     [("Röyksopp", "Eple")]),
+]
+
+
+def run(inotify: bool) -> bool:
+    directory = tempfile.mkdtemp(prefix="radiobot-nowplaying-")
+    path = os.path.join(directory, "nowplaying.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Portishead - Roads")
+    reported = []
+    arrived = threading.Condition()
+
+    def on_change(track: dict) -> None:
+        with arrived:
+            reported.append(((track["artist"], track["title"]), time.perf_counter()))
+            arrived.notify_all()
+
+    watcher = NowPlayingFile(path, on_change, debounce=0.25, inotify=inotify)
+    watcher.start()
+    ok = True
+    with arrived:
+        arrived.wait_for(lambda: reported, timeout=3)
+    print(f"-- {watcher.backend} --")
+    for name, writer, expected in SCENARIOS:
+        with arrived:
+            del reported[:]
+        writer(path)
+        written = time.perf_counter()
+        with arrived:
+            arrived.wait_for(lambda: len(reported) >= max(1, len(expected)), timeout=3)
+        time.sleep(1.2)  # anything extra (a half-written track) would show up by now
+        with arrived:
+            got = [track for track, _ in reported]
+            latency = (reported[-1][1] - written) * 1000 if reported else None
+        passed = got == expected
+        ok = ok and passed
+        print(f"{name:<22} {'ok  ' if passed else 'FAIL'} reported {got}"
+              + (f" after {latency:.0f} ms" if latency is not None else ""))
+    watcher.stop()
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+    return ok
+
+
+def main() -> int:
+    results = [run(inotify=True), run(inotify=False)]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Delivery latency of overlay pushes to many connected browser sources.
+
+Run from the repository root:  python bench/bench_overlay_push.py [clients] [changes]
+
+Starts the overlay's Socket.IO server on a free local port, connects
+`clients` Socket.IO clients (as OBS browser sources would after loading
+the page once), then changes the station `changes` times (new track, new
+request) and fires a 4:20 popup. Latency runs from the station publishing
+a snapshot to each client receiving the event. After that it sits idle
+for a few seconds to show that nothing is sent or queried while nothing
+changes. Exits non-zero if an event is lost or p95 latency reaches
+100 ms. The Python client here uses long-polling, which costs a fresh
+HTTP request per event, so the tail is worse than a browser's WebSocket.
+"""
+import logging
+import socket
+import sys
+import threading
+import time
+
+import socketio as sio
+
+from fake_db import StandInDatabase
+
+import db as bot_db
+import metrics
+from config import REFRESH
+from station import station
+from web_overlay import app, socketio, show_popup
+
+IDLE_SECONDS = 5
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def main(clients: int = 20, changes: int = 20) -> int:
+    db = StandInDatabase(songs=50)
+    bot_db.pool = bot_db.ConnectionPool(db.connect)
+    port = free_port()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    threading.Thread(target=lambda: socketio.run(app, host="127.0.0.1", port=port, allow_unsafe_werkzeug=True,
+                                                 log_output=False), daemon=True).start()
+    time.sleep(1)
+
+    received: dict = {}  # event -> [perf_counter of each delivery]
+    lock = threading.Lock()
+    connections = []
+    for _ in range(clients):
+        client = sio.Client()
+        for event in ("state", "track", "next", "requests", "popup"):
+            def record(data, event=event):
+                with lock:
+                    received.setdefault(event, []).append(time.perf_counter())
+            client.on(event, record)
+        client.connect(f"http://127.0.0.1:{port}", transports=["polling"])
+        connections.append(client)
+    time.sleep(1)
+
+    published = []
+    station.watchers.insert(0, lambda old, new: published.append(time.perf_counter()))
+    conn = db.connect()
+    latencies = {"track": [], "requests": [], "popup": []}
+    for i in range(changes):
+        for event in ("track", "requests"):
+            with lock:
+                received[event] = []
+            with conn.cursor() as c:
+                if event == "track":
+                    # a second apart, as plays never share a date_played in a real broadcast
+                    c.execute("INSERT INTO history (trackID, artist, title, date_played) "
+                              "SELECT ID, artist, title, datetime('now', 'localtime', %s) FROM songs WHERE ID = %s",
+                              (f"+{i + 1} seconds", i % 50 + 1))
+                else:
+                    c.execute("INSERT INTO requests (songID, username, requested, played) "
+                              "VALUES (%s, %s, datetime('now'), 0)", (i % 50 + 1, f"viewer{i}"))
+            conn.commit()
+            station.poll()
+            sent = published[-1]
+            deadline = time.monotonic() + 2
+            while time.monotonic() < deadline:
+                with lock:
+                    if len(received.get(event, [])) >= clients:
+                        break
+                time.sleep(0.001)
+            with lock:
+                latencies[event] += [(t - sent) * 1000 for t in received.get(event, [])]
+    for _ in range(5):
+        with lock:
+            received["popup"] = []
+        sent = time.perf_counter()
+        show_popup("It's 4:20 somewhere!")
+        time.sleep(0.5)
+        with lock:
+            latencies["popup"] += [(t - sent) * 1000 for t in received["popup"]]
+    conn.close()
+
+    statements = db.statements
+    with lock:
+        before = sum(len(v) for v in received.values())
+    time.sleep(IDLE_SECONDS)
+    with lock:
+        idle_events = sum(len(v) for v in received.values()) - before
+    idle_statements = db.statements - statements
+
+    ok = True
+    print(f"{clients} clients, {changes} track changes and {changes} new requests, 5 popups")
+    for event, values in latencies.items():
+        expected = clients * (5 if event == "popup" else changes)
+        delivered = len(values)
+        ok = ok and delivered == expected and pct(values, 95) < 100
+        print(f"  {event:<9} delivered {delivered}/{expected}  p50 {pct(values, 50):5.1f} ms  "
+              f"p95 {pct(values, 95):5.1f} ms  max {max(values, default=0):5.1f} ms")
+    print(f"  idle {IDLE_SECONDS}s: {idle_events} events, {idle_statements} DB statements "
+          f"(meta refresh every {REFRESH}s: {clients * IDLE_SECONDS // REFRESH} page renders, "
+          f"{3 * clients * IDLE_SECONDS // REFRESH} queries)")
+    print(f"  overlay.clients gauge: {metrics.snapshot()['gauges'].get('overlay.clients')}")
+    for client in connections:
+        client.disconnect()
+    db.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(a) for a in sys.argv[1:3])))
@@ -0,0 +1,139 @@
+"""Renders and response times of the overlay page under many reloading browser sources.
+
+Run from the repository root:  python bench/bench_overlay_render.py [clients] [seconds]
+
+Serves the overlay on a free local port the way services.start_overlay()
+does and has `clients` threads load "/" every RELOAD seconds, sending back
+the ETag they last got, while the station changes track every CHANGE
+seconds. Without the render cache every load re-renders the page; with it
+there should be one render per state change and mostly 304s. At the end
+every client loads the page once more and must get the bytes of the
+latest state. Exits non-zero if there were more renders than states or a
+client was left with a stale page.
+"""
+import http.client
+import logging
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from fake_db import StandInDatabase
+
+import db as bot_db
+import metrics
+from station import station
+from web_overlay import app, _render_index
+
+RELOAD = 0.25
+CHANGE = 1.0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def pct(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def load(port: int, etag: str = None) -> tuple:
+    """(status, etag, body, ms) of one GET /."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    start = time.perf_counter()
+    conn.request("GET", "/", headers={"If-None-Match": etag} if etag else {})
+    response = conn.getresponse()
+    body = response.read()
+    ms = (time.perf_counter() - start) * 1000
+    conn.close()
+    return response.status, response.getheader("ETag"), body, ms
+
+
+def main(clients: int = 50, seconds: float = 10) -> int:
+    db = StandInDatabase(songs=50)
+    bot_db.pool = bot_db.ConnectionPool(db.connect)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = free_port()
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    station.poll()
+
+    # What a render costs, for the uncached comparison.
+    snap = station.get()
+    with app.app_context():
+        start = time.perf_counter()
+        for _ in range(50):
+            _render_index(snap, None, "", "")
+    render_ms = (time.perf_counter() - start) * 1000 / 50
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    statuses: dict = {}
+    latencies = []
+    sent_bytes = [0]
+
+    def client() -> None:
+        etag = None
+        while not stop.is_set():
+            status, new_etag, new_body, ms = load(port, etag)
+            if status == 200:
+                etag = new_etag
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                latencies.append(ms)
+                sent_bytes[0] += len(new_body)
+            stop.wait(RELOAD)
+
+    def changer() -> None:
+        conn = db.connect()
+        i = 0
+        while not stop.wait(CHANGE):
+            with conn.cursor() as c:
+                c.execute("INSERT INTO history (trackID, artist, title, date_played) "
+                          "SELECT ID, artist, title, datetime('now', 'localtime', %s) FROM songs WHERE ID = %s",
+                          (f"+{i + 1} seconds", i % 50 + 1))
+            conn.commit()
+            station.poll()
+            i += 1
+        conn.close()
+
+    before = metrics.snapshot()["counters"]
+    first_version = station.version
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    threads.append(threading.Thread(target=changer, daemon=True))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    counters = metrics.snapshot()["counters"]
+    renders = counters.get("overlay.index.renders", 0) - before.get("overlay.index.renders", 0)
+    hits = counters.get("overlay.index.cache_hits", 0) - before.get("overlay.index.cache_hits", 0)
+    states = station.version - first_version + 1
+
+    latest = load(port)
+    current = station.get().now["title"]
+    final = [load(port)[1] for _ in range(clients)]
+    stale = sum(1 for etag in final if etag != latest[1]) + (0 if current.encode() in latest[2] else clients)
+    requests = sum(statuses.values())
+
+    print(f"{clients} clients reloading every {RELOAD}s for {seconds:g}s, a new track every {CHANGE}s")
+    print(f"  requests {requests} ({statuses.get(200, 0)} x 200, {statuses.get(304, 0)} x 304), "
+          f"{sent_bytes[0] / 1024:.0f} KiB of bodies, latency p50 {pct(latencies, 50):.1f} ms, "
+          f"p99 {pct(latencies, 99):.1f} ms")
+    print(f"  renders {renders} for {states} states, cache hits {hits} "
+          f"(uncached: {requests} renders, {requests * render_ms:.0f} ms at {render_ms:.2f} ms each)")
+    print(f"  final load: {clients - stale}/{clients} clients got the latest page")
+    server.shutdown()
+    db.close()
+    return 0 if renders <= states and stale == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50, float(sys.argv[2]) if len(sys.argv) > 2 else 10))
@@ -0,0 +1,70 @@
+"""Microbenchmark for the IRC line parser.
+
+Run from the repository root:  python bench/bench_parser.py [count]
+
+Compares the original TwitchBot.parse (two kv.split calls per tag, full
+dict per line) with irc.parse_line over a synthetic chat log, reading what
+the bot reads on every PRIVMSG: user, message text and the `mod` tag.
+"""
+import sys
+import time
+
+from fake_twitch import synthetic_chat
+from irc import parse_line
+
+
+def legacy_parse(line: str):
+    """The parser TwitchBot shipped with, kept here as the baseline."""
+    try:
+        tags_raw, _, message_raw = line.partition(' ')
+        if not line.startswith("@"):
+            return None, None, {}
+        tags = {kv.split('=', 1)[0]: kv.split('=', 1)[1] for kv in tags_raw[1:].split(';') if '=' in kv}
+        user = tags.get('display-name', '').lower()
+        msg_parts = message_raw.split(" :", 1)
+        msg = msg_parts[1].strip() if len(msg_parts) > 1 else ""
+        return user, msg, tags
+    except Exception:
+        return None, None, {}
+
+
+def run_legacy(lines):
+    mods = 0
+    for line in lines:
+        user, msg, tags = legacy_parse(line)
+        mods += tags.get('mod') == '1'
+    return mods
+
+
+def run_new(lines):
+    mods = 0
+    for line in lines:
+        m = parse_line(line)
+        if m.command == "PRIVMSG":
+            user, msg = m.user, m.text
+            mods += m.tag('mod') == '1'
+    return mods
+
+
+def best_of(fn, lines, rounds=5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(count: int = 200_000) -> None:
+    lines = synthetic_chat(count)
+    assert run_legacy(lines) == run_new(lines)
+    old = best_of(run_legacy, lines)
+    new = best_of(run_new, lines)
+    print(f"lines:        {count}")
+    print(f"legacy parse: {old / count * 1e9:7.0f} ns/line  ({count / old:,.0f} lines/s)")
+    print(f"parse_line:   {new / count * 1e9:7.0f} ns/line  ({count / new:,.0f} lines/s)")
+    print(f"speedup:      {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,95 @@
+"""Benchmarks !search: the in-memory index against the LIKE scan it replaces.
+
+Run from the repository root:  python bench/bench_search.py [songs]
+
+Generates a catalog of `songs` rows (default 1,000,000) with a realistic
+spread of artist and title words, builds the index, and times a mix of
+queries: exact words, a word still being typed, typos and missing
+accents. The LIKE query runs against the same rows in the SQLite
+stand-in for comparison (SQLite, like MySQL, cannot use an index for
+a leading-wildcard LIKE).
+"""
+import random
+import sqlite3
+import statistics
+import sys
+import time
+import resource
+
+import fake_twitch  # noqa: F401  (puts src/ on sys.path)
+from search_index import SongIndex
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ne", "to", "sa", "vi", "do", "re", "lu", "be", "xo", "ti", "po", "ze"]
+REAL_ARTISTS = ["Daft Punk", "Boards of Canada", "Aphex Twin", "Björk", "Massive Attack", "Portishead",
+                "Sigur Rós", "Röyksopp", "Motörhead", "Beyoncé", "Mötley Crüe", "The Prodigy"]
+COMMON = ["night", "love", "the", "you", "dream", "light", "time", "one", "fire", "heart", "world",
+          "remix", "live", "version", "feat", "blue", "summer", "girl", "dance", "home"]
+
+QUERIES = [
+    ("exact word", "teardrop"),
+    ("artist", "daft punk"),
+    ("artist + typing", "daft punk hear"),
+    ("common word", "love"),
+    ("two common words", "love night"),
+    ("typing", "portis"),
+    ("typo", "massiv atack"),
+    ("typo", "aphx twin"),
+    ("no accents", "bjork"),
+    ("no accents", "royksopp"),
+    ("no accents", "motley crue"),
+    ("nonsense", "qwzxv"),
+]
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def catalog(count: int, seed: int = 11):
+    rng = random.Random(seed)
+    artists = REAL_ARTISTS + [" ".join(word(rng).title() for _ in range(rng.randint(1, 3)))
+                              for _ in range(max(100, count // 20))]
+    vocabulary = [word(rng) for _ in range(max(1000, count // 10))] + ["teardrop", "windowlicker"]
+    for i in range(1, count + 1):
+        n = rng.randint(1, 5)
+        title = " ".join(rng.choice(COMMON) if rng.random() < 0.3 else rng.choice(vocabulary) for _ in range(n))
+        yield i, rng.choice(artists), title.title()
+
+
+def time_index(index: SongIndex, query: str, repeat: int = 200) -> tuple:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = index.search(query, 5)
+        runs.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(runs), max(runs), results
+
+
+def main(count: int = 1_000_000) -> None:
+    rows = list(catalog(count))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index = SongIndex(rows)
+    build = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"index: {len(index):,} songs, {len(index.vocabulary):,} words, built in {build:.1f}s, "
+          f"peak RSS +{(rss_after - rss_before) / 1024:.0f} MB")
+
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE songs (ID INTEGER PRIMARY KEY, artist TEXT, title TEXT, enabled INTEGER DEFAULT 1)")
+    db.executemany("INSERT INTO songs (ID, artist, title) VALUES (?, ?, ?)", rows)
+    del rows
+
+    print(f"{'kind':<17} {'query':<18} {'index p50':>10} {'max':>8} {'LIKE scan':>10}  top result")
+    for kind, query in QUERIES:
+        p50, worst, results = time_index(index, query)
+        start = time.perf_counter()
+        db.execute("SELECT ID, artist, title FROM songs WHERE (artist LIKE ? OR title LIKE ?) AND enabled=1 "
+                   "ORDER BY artist, title LIMIT 5", (f"%{query}%", f"%{query}%")).fetchall()
+        like_ms = (time.perf_counter() - start) * 1000
+        top = results[0][1] if results else "-"
+        print(f"{kind:<17} {query:<18} {p50:>8.0f}µs {worst:>6.0f}µs {like_ms:>8.0f}ms  {top}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,125 @@
+"""Fires parallel spends from one viewer and checks nobody can overdraw.
+
+Run from the repository root:  python bench/bench_spend_race.py [threads] [affordable]
+
+For each of !pick, !playnext, !give and !gamble, one viewer holds enough
+points for `affordable` of them (and a bit), then `threads` copies of the
+command are released at once against the
+SQLite stand-in (with a simulated round trip, so the requests really
+overlap). Afterwards the balance must equal the starting balance minus
+what the successful commands spent, must not be negative, and the cached
+balance must agree with the database. "legacy" runs the old check-then-
+deduct sequence the same way, to show the race this closes; it is
+expected to overdraw.
+
+Exits non-zero if any check on the atomic commands fails.
+"""
+import sys
+import threading
+
+from fake_db import StandInDatabase
+
+import db as bot_db
+from balances import balances
+from config import POINTS_REQUEST_COST, POINTS_PLAYNEXT_COST, POINTS_GIVE_TAX
+from twitch_bot import TwitchBot
+
+USER = "whale"
+GIFT = 100
+
+
+def stored(db: StandInDatabase, sql: str, params=()) -> int:
+    conn = db.connect()
+    with conn.cursor() as c:
+        c.execute(sql, params)
+        row = c.fetchone()
+    conn.close()
+    return list(row.values())[0] or 0 if row else 0
+
+
+def legacy_spend(bot: TwitchBot, cost: int) -> None:
+    """The old !pick: read the balance, then deduct on another connection."""
+    if bot.get_user_points(USER, settle=True) < cost:
+        return
+    with balances.writing():
+        conn = bot_db.get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"UPDATE {bot.points_table} SET points = points - %s WHERE username = %s",
+                               (cost, USER))
+                cursor.execute("INSERT INTO requests (songID, username) VALUES (1, %s)", (USER,))
+            conn.commit()
+            balances.apply(bot.points_table, USER, -cost)
+        finally:
+            conn.close()
+
+
+def race(name: str, threads: int, balance: int, command, expect_overdraw: bool = False) -> bool:
+    db = StandInDatabase(latency_ms=2, songs=10)
+    bot_db.pool = bot_db.ConnectionPool(db.connect, max_size=threads)
+    balances.invalidate()
+    bot = TwitchBot()  # the primary channel, which keeps community_points
+    bot.send = lambda *args, **kwargs: None
+    bot.last_results.pop = lambda key: None  # keep the search results for every parallel !pick
+    bot.last_results.set(USER, [(1, "Daft Punk - One More Time")])
+    conn = db.connect()
+    with conn.cursor() as c:
+        c.execute("INSERT INTO community_points (username, points) VALUES (%s, %s)", (USER, balance))
+    conn.commit()
+    conn.close()
+    bot.get_user_points(USER)  # warm the balance cache, as a chatting viewer would have
+
+    gate = threading.Barrier(threads)
+
+    def fire():
+        gate.wait()
+        command(bot)
+
+    workers = [threading.Thread(target=fire) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    final = stored(db, "SELECT points FROM community_points WHERE username = %s", (USER,))
+    requests = stored(db, "SELECT COUNT(*) FROM requests")
+    queued = stored(db, "SELECT COUNT(*) FROM queuelist")
+    received = stored(db, "SELECT points FROM community_points WHERE username = 'friend'")
+    gifts = received // (GIFT - int(GIFT * (POINTS_GIVE_TAX / 100)))
+    spent = requests * POINTS_REQUEST_COST + queued * POINTS_PLAYNEXT_COST + gifts * GIFT
+    cached = balances.get(bot.points_table, USER, lambda: None)
+    checks = {
+        "not overdrawn": final >= 0,
+        "balance adds up": name == "gamble" or final == balance - spent,
+        "cache agrees": cached == final,
+    }
+    ok = all(checks.values())
+    if expect_overdraw and not checks["not overdrawn"]:
+        verdict = f"{name} overdraws (expected)"
+    else:
+        verdict = "ok" if ok else "FAIL: " + ", ".join(k for k, v in checks.items() if not v)
+    print(f"{name:<9} {threads} parallel, start {balance}: final balance {final:>6}, "
+          f"requests {requests}, queued {queued}  {verdict}")
+    db.close()
+    return ok
+
+
+def main(threads: int = 32, affordable: int = 5) -> int:
+    def enough(cost: int) -> int:
+        return affordable * cost + cost // 2
+
+    stake = 100
+    results = [
+        race("!pick", threads, enough(POINTS_REQUEST_COST), lambda bot: bot.pick(USER, 1)),
+        race("!playnext", threads, enough(POINTS_PLAYNEXT_COST), lambda bot: bot.playnext(USER, 1)),
+        race("!give", threads, enough(GIFT), lambda bot: bot.give_points(USER, "friend", GIFT)),
+        race("gamble", threads, enough(stake), lambda bot: bot.gamble(USER, stake)),
+    ]
+    print("-- the old check-then-deduct, for comparison --")
+    race("legacy", threads, enough(POINTS_REQUEST_COST), lambda bot: legacy_spend(bot, POINTS_REQUEST_COST),
+         expect_overdraw=True)
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(*(int(a) for a in sys.argv[1:3])))
@@ -0,0 +1,75 @@
+"""Soak test for the chatter cooldown maps.
+
+Run from the repository root:  python bench/bench_ttl_soak.py [users]
+
+Replays the bot's per-message bookkeeping (active-earn cooldown plus a
+command cooldown for 1 in 20 messages) for `users` unique chatters on a
+simulated clock, 2,000 new chatters a second. Memory held by the TtlMap
+version should plateau once the first cooldown window has passed; the
+old dict-of-dicts version grows with every chatter.
+"""
+import sys
+import tracemalloc
+
+import fake_twitch  # noqa: F401  (puts src/ on sys.path)
+from cache import TtlMap
+
+ACTIVE_COOLDOWN = 60
+COMMAND_COOLDOWN = 30
+PER_SECOND = 2000
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def soak_ttl(users: int, report_every: int) -> list:
+    clock = Clock()
+    active = TtlMap(clock=clock)
+    cooldowns = TtlMap(clock=clock)
+    samples = []
+    tracemalloc.start()
+    for i in range(users):
+        clock.now = i / PER_SECOND
+        user = f"viewer{i}"
+        active.claim(user, ACTIVE_COOLDOWN)
+        if i % 20 == 0:
+            cooldowns.claim((user, "points"), COMMAND_COOLDOWN)
+        if (i + 1) % report_every == 0:
+            samples.append((i + 1, tracemalloc.get_traced_memory()[0], len(active) + len(cooldowns)))
+    tracemalloc.stop()
+    return samples
+
+
+def soak_dict(users: int, report_every: int) -> list:
+    last_active = {}
+    cooldowns = {}
+    samples = []
+    tracemalloc.start()
+    for i in range(users):
+        now = i / PER_SECOND
+        user = f"viewer{i}"
+        if now - last_active.get(user, 0) > ACTIVE_COOLDOWN:
+            last_active[user] = now
+        if i % 20 == 0:
+            cooldowns.setdefault(user, {})["points"] = now
+        if (i + 1) % report_every == 0:
+            samples.append((i + 1, tracemalloc.get_traced_memory()[0], len(last_active) + len(cooldowns)))
+    tracemalloc.stop()
+    return samples
+
+
+def main(users: int = 3_000_000) -> None:
+    report_every = users // 6
+    for name, fn in (("dict (before)", soak_dict), ("TtlMap (after)", soak_ttl)):
+        print(name)
+        for n, mem, live in fn(users, report_every):
+            print(f"  {n:>10,} users  {mem / 1e6:8.1f} MB  {live:>10,} live entries")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000)
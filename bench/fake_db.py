@@ -0,0 +1,100 @@
+"""A throwaway stand-in for the RadioDJ MySQL database, on the bot's SQLite backend.
+
+Each database is a temporary file seeded with songs and a little history,
+reached through src/sqlite_db.py the way [database] backend = sqlite is.
+It counts statements, commits and connections, and optional per-statement
+and per-connect delays stand in for the network round trip and the MySQL
+handshake.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import fake_twitch  # noqa: F401  (puts src/ on sys.path)
+from sqlite_db import SqliteConnection, SqliteCursor, create_schema
+
+ARTISTS = ["Daft Punk", "Boards of Canada", "Aphex Twin", "Björk", "Massive Attack", "Portishead",
+           "The Prodigy", "Moby", "Burial", "Bonobo", "Röyksopp", "Air", "Justice", "Deadmau5"]
+TITLE_WORDS = ["night", "drive", "one", "more", "time", "teardrop", "dream", "light", "around",
+               "world", "windowlicker", "glory", "box", "archangel", "roygbiv", "porcelain", "sky"]
+
+
+class StandInCursor(SqliteCursor):
+    def __init__(self, conn: "StandInConnection"):
+        super().__init__(conn)
+        self._db = conn.db
+
+    def execute(self, sql: str, params=()):
+        with self._db._lock:
+            self._db.statements += 1
+        if self._db.latency:
+            time.sleep(self._db.latency)
+        return super().execute(sql, params)
+
+
+class StandInConnection(SqliteConnection):
+    def __init__(self, db: "StandInDatabase"):
+        super().__init__(db.path)
+        self.db = db
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        with self.db._lock:
+            self.db.commits += 1
+        super().commit()
+
+
+class StandInDatabase:
+    """A temporary SQLite file shaped like the RadioDJ tables the bot touches."""
+
+    def __init__(self, latency_ms: float = 0.0, songs: int = 5000, seed: int = 7, connect_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.connect_latency = connect_ms / 1000  # TCP + auth handshake of a new connection
+        self.statements = 0
+        self.commits = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        fd, self.path = tempfile.mkstemp(prefix="radiobot-standin-", suffix=".db")
+        os.close(fd)
+        create_schema(self.path)
+        raw = sqlite3.connect(self.path)
+        rng = random.Random(seed)
+        raw.executemany(
+            "INSERT INTO songs (ID, artist, title, duration) VALUES (?, ?, ?, ?)",
+            [(i, rng.choice(ARTISTS), " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3))).title(),
+              rng.uniform(120, 420)) for i in range(1, songs + 1)],
+        )
+        raw.executemany(
+            "INSERT INTO history (trackID, artist, title) SELECT ID, artist, title FROM songs WHERE ID = ?",
+            [(i,) for i in range(1, 11)],
+        )
+        raw.commit()
+        raw.close()
+
+    def create_points_table(self, table: str) -> None:
+        """Adds another channel's points table, shaped like community_points."""
+        raw = sqlite3.connect(self.path)
+        raw.execute(f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "username TEXT PRIMARY KEY, points INTEGER NOT NULL DEFAULT 0, "
+                    "last_seen TEXT DEFAULT CURRENT_TIMESTAMP, last_active TEXT DEFAULT NULL)")
+        raw.commit()
+        raw.close()
+
+    def connect(self) -> StandInConnection:
+        with self._lock:
+            self.connections += 1
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        return StandInConnection(self)
+
+    def close(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
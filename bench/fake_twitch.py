@@ -0,0 +1,154 @@
+"""A local stand-in for irc.chat.twitch.tv used by the benchmarks.
+
+The server accepts any login, answers PING, records every line the bot sends
+and lets the benchmark push raw bytes (deliberately cut at arbitrary offsets)
+to all connected clients.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+WORDS = (
+    "banger turn it up play some dnb tonight vibes who is this track lol lmao "
+    "pog kekw love this one more time bass drop hello chat good evening radio "
+    "request please again classic never heard this before so good wow"
+).split()
+
+
+def make_privmsg(user: str, text: str, channel: str = "radio", mod: bool = False, msg_id: int = 0) -> str:
+    """Builds a PRIVMSG line carrying the tag set Twitch actually sends."""
+    display = user.capitalize()
+    tags = (
+        f"@badge-info=;badges={'moderator/1' if mod else 'premium/1'};client-nonce=0;"
+        f"color=#1E90FF;display-name={display};emotes=;first-msg=0;flags=;"
+        f"id=00000000-0000-0000-0000-{msg_id:012d};mod={1 if mod else 0};returning-chatter=0;"
+        f"room-id=12345678;subscriber=0;tmi-sent-ts={int(time.time() * 1000)};turbo=0;"
+        f"user-id={100000 + msg_id};user-type={'mod' if mod else ''}"
+    )
+    return f"{tags} :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{channel} :{text}"
+
+
+def synthetic_chat(count: int, users: int = 500, channel: str = "radio", seed: int = 420) -> list[str]:
+    """Generates a chat log of `count` PRIVMSG lines, about 5% of them commands."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        user = f"viewer{rng.randrange(users)}"
+        if rng.random() < 0.05:
+            text = rng.choice(["!points", "!uptime", "!playing", "!search daft punk", "!queue"])
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 14)))
+            if rng.random() < 0.1:
+                text += " ünïcödé 🎧"
+        lines.append(make_privmsg(user, text, channel=channel, mod=rng.random() < 0.02, msg_id=i))
+    return lines
+
+
+def chunked(data: bytes, rng: random.Random, low: int = 200, high: int = 4096):
+    """Cuts data at random offsets so lines straddle write boundaries."""
+    pos = 0
+    while pos < len(data):
+        step = rng.randint(low, high)
+        yield data[pos:pos + step]
+        pos += step
+
+
+class FakeTwitchServer:
+    """Runs an asyncio IRC server on its own thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.loop: asyncio.AbstractEventLoop = None
+        self.received: list[tuple[float, str]] = []
+        self.joined = threading.Event()
+        self.channels: dict = {}  # joined channel -> the writer it was joined on
+        self._writers: list[asyncio.StreamWriter] = []
+        self._ready = threading.Event()
+        self._server = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "FakeTwitchServer":
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def _run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _start(self) -> None:
+        self._server = await asyncio.start_server(self._client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.append(writer)
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                line = raw.decode("utf-8", "replace").rstrip("\r\n")
+                self.received.append((time.perf_counter(), line))
+                if line.startswith("PING"):
+                    writer.write(f"PONG{line[4:]}\r\n".encode())
+                elif line.startswith("NICK"):
+                    writer.write(f":tmi.twitch.tv 001 {line[5:]} :Welcome, GLHF!\r\n".encode())
+                elif line.startswith("JOIN"):
+                    for channel in line[5:].split(","):
+                        self.channels[channel.strip().lstrip("#")] = writer
+                    self.joined.set()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if writer in self._writers:
+                self._writers.remove(writer)
+            writer.close()
+
+    def push(self, data: bytes) -> None:
+        """Writes raw bytes to every connected client (thread-safe)."""
+        def write():
+            for w in list(self._writers):
+                w.write(data)
+        self.loop.call_soon_threadsafe(write)
+
+    def push_to(self, channel: str, data: bytes) -> None:
+        """Writes raw bytes only to the connection that joined `channel` (thread-safe)."""
+        def write():
+            w = self.channels.get(channel)
+            if w is not None and w in self._writers:
+                w.write(data)
+        self.loop.call_soon_threadsafe(write)
+
+    def push_lines(self, lines: list[str], seed: int = 1) -> None:
+        rng = random.Random(seed)
+        for chunk in chunked("".join(l + "\r\n" for l in lines).encode("utf-8"), rng):
+            self.push(chunk)
+
+    def sent_privmsgs(self) -> list[tuple[float, str]]:
+        return [(t, l) for t, l in self.received if " PRIVMSG " in f" {l}"]
+
+    def stop(self) -> None:
+        if not self.loop:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        for w in list(self._writers):
+            w.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,165 @@
+"""End-to-end chat load test, fully offline.
+
+Run from the repository root:
+    python bench/loadtest.py --rate 200 --duration 20
+    python bench/loadtest.py --log recorded_chat.txt --max-p99 250
+
+A fake Twitch IRC server replays PRIVMSG traffic (synthetic, or raw lines
+from a recorded log) into a real TwitchBot at a fixed rate, while the bot
+talks to a SQLite stand-in for the RadioDJ database. Each command comes
+from a fresh user so cooldowns never hide a reply, and the reply is
+matched back by its @mention. Reports command-to-reply latency, commands
+that never got an answer, and CPU use of the whole process (bot, fake
+server and load generator together).
+
+Exits non-zero when --max-p99 or --max-dropped is exceeded, so it can gate
+a deploy.
+"""
+import argparse
+import random
+import re
+import resource
+import sys
+import threading
+import time
+
+from fake_twitch import FakeTwitchServer, make_privmsg, synthetic_chat
+from fake_db import StandInDatabase
+
+import db as bot_db
+import metrics
+import search_index
+from chat_queue import TokenBucket
+from twitch_bot import TwitchBot
+
+COMMANDS = ["!points", "!search daft punk", "!gamble 1", "!search night", "!points"]
+MENTION = re.compile(r"@(\w+)")
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def build_traffic(args) -> list:
+    """Returns the PRIVMSG lines to replay, chat filler and commands interleaved."""
+    total = int(args.rate * args.duration)
+    if args.log:
+        with open(args.log, encoding="utf-8") as f:
+            filler = [l.rstrip("\r\n") for l in f if " PRIVMSG " in l]
+    else:
+        filler = synthetic_chat(total, users=args.users)
+    rng = random.Random(args.seed)
+    lines = []
+    for i in range(total):
+        if rng.random() < args.command_ratio:
+            lines.append(make_privmsg(f"load{i}", rng.choice(COMMANDS), msg_id=i))
+        else:
+            # Strip commands from the filler so only our tagged users expect replies.
+            line = filler[i % len(filler)]
+            lines.append(line if " :!" not in line else line.split(" :!", 1)[0] + " :hi")
+    return lines
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rate", type=float, default=100, help="chat lines per second")
+    ap.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    ap.add_argument("--users", type=int, default=2000, help="distinct chatters in synthetic filler")
+    ap.add_argument("--command-ratio", type=float, default=0.05)
+    ap.add_argument("--log", help="replay PRIVMSG lines from a recorded IRC log instead")
+    ap.add_argument("--db-latency-ms", type=float, default=0.5, help="simulated DB round trip")
+    ap.add_argument("--db-connect-ms", type=float, default=3.0, help="simulated MySQL connect + auth")
+    ap.add_argument("--no-pool", action="store_true",
+                    help="open a new DB connection per use, as before the connection pool")
+    ap.add_argument("--twitch-limits", action="store_true",
+                    help="keep the real outbound rate limit (expect queueing and drops)")
+    ap.add_argument("--grace", type=float, default=5, help="seconds to wait for late replies")
+    ap.add_argument("--max-p99", type=float, help="fail if p99 latency (ms) exceeds this")
+    ap.add_argument("--max-dropped", type=int, help="fail if more commands than this go unanswered")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    db = StandInDatabase(latency_ms=args.db_latency_ms, connect_ms=args.db_connect_ms)
+    if args.no_pool:
+        # Every query goes through the pool; one that keeps nothing and never
+        # makes anyone wait is a new connection per use.
+        bot_db.pool = bot_db.ConnectionPool(db.connect, max_size=10 ** 6, max_age=0)
+    else:
+        bot_db.pool = bot_db.ConnectionPool(db.connect)
+    search_index.load()
+    server = FakeTwitchServer().start()
+    bot = TwitchBot(channel="radio", server="127.0.0.1", port=server.port)
+    db.create_points_table(bot.points_table)
+    if not args.twitch_limits:
+        bot.outbound.bucket = TokenBucket(10 ** 9, 1, 10 ** 9)
+    threading.Thread(target=bot.run, daemon=True).start()
+    if not server.joined.wait(10):
+        print("bot never joined the fake server")
+        return 2
+
+    lines = build_traffic(args)
+    sent_at = {}
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+    batch = max(1, int(args.rate / 100))
+    for i in range(0, len(lines), batch):
+        due = wall_start + i / args.rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        chunk = lines[i:i + batch]
+        now = time.perf_counter()
+        for line in chunk:
+            if " :!" in line and line.split(" :", 2)[1].startswith(("load", "Load")):
+                sent_at[line.split(" :", 1)[1].split("!", 1)[0]] = now
+        server.push("".join(l + "\r\n" for l in chunk).encode("utf-8"))
+    offered = time.perf_counter() - wall_start
+    time.sleep(args.grace)
+    wall = time.perf_counter() - wall_start
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    latencies = []
+    answered = set()
+    for t, line in server.sent_privmsgs():
+        for user in MENTION.findall(line):
+            user = user.lower()
+            if user in sent_at and user not in answered:
+                answered.add(user)
+                latencies.append((t - sent_at[user]) * 1000)
+    bot.stop()
+    server.stop()
+    db.close()
+
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    dropped = len(sent_at) - len(answered)
+    print(f"chat lines offered:   {len(lines)} in {offered:.1f}s ({len(lines) / offered:,.0f}/s)")
+    print(f"commands sent:        {len(sent_at)}")
+    print(f"replies matched:      {len(answered)}")
+    print(f"dropped:              {dropped}")
+    print(f"latency p50 / p99:    {percentile(latencies, 50):.1f} / {percentile(latencies, 99):.1f} ms"
+          f" (max {max(latencies, default=0):.1f})")
+    counters = metrics.snapshot()["counters"]
+    shed = sum(v for k, v in counters.items() if k.startswith("twitch-cmd.shed"))
+    print(f"  shed by command pool: {shed}, dropped/expired by chat queue: "
+          f"{counters.get('chat.dropped', 0)}/{counters.get('chat.expired', 0)}")
+    print(f"DB statements:        {db.statements} on {db.connections} connections")
+    if not args.no_pool:
+        wait = metrics.snapshot()["histograms"].get("db.pool.wait_ms", {})
+        print(f"  pool: {bot_db.pool.stats()}, checkout wait p99 {wait.get('p99', 0)} ms")
+    print(f"CPU:                  {cpu:.2f}s over {wall:.1f}s wall ({cpu / wall * 100:.0f}% of one core)")
+
+    failed = False
+    if args.max_p99 is not None and percentile(latencies, 99) > args.max_p99:
+        print(f"FAIL: p99 above {args.max_p99} ms")
+        failed = True
+    if args.max_dropped is not None and dropped > args.max_dropped:
+        print(f"FAIL: more than {args.max_dropped} commands dropped")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
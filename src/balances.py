@@ -0,0 +1,100 @@
+import threading
+from contextlib import contextmanager
+
+from cache import LruCache
+from config import POINTS_BALANCE_CACHE_SIZE, POINTS_BALANCE_CACHE_TTL
+
+
+class BalanceCache:
+    """Per-user points balances as stored in the database, keyed by (table, user).
+
+    Filled from the database on first access and adjusted in place by every
+    points write the bot makes, so repeat reads skip the SELECT. Entries
+    expire after `ttl` seconds, which picks up changes made outside the
+    bot; invalidate() forces that sooner.
+
+    Writers wrap their transaction in writing() and call apply() after the
+    commit. A fill only lands if no write was in flight or finished while
+    its SELECT ran; otherwise it is dropped and the next read loads again,
+    so a balance read between a commit and its apply() is never cached and
+    then adjusted twice.
+
+    Anything else derived from balances can register in `watchers` to be
+    told about every committed change: observe(table, user, points) when
+    the new balance is known, adjust(table, user, delta) when only the
+    change is, and invalidate(table, user) when neither is.
+    """
+
+    def __init__(self, max_size: int = POINTS_BALANCE_CACHE_SIZE, ttl: float = POINTS_BALANCE_CACHE_TTL):
+        self._cache = LruCache(max_size, ttl, name="balances")
+        self._lock = threading.Lock()
+        self._epoch = 0   # bumped whenever a write starts or ends, or on invalidate
+        self._writes = 0  # writes in flight
+        self.watchers: list = []
+
+    def get(self, table: str, user: str, load) -> int:
+        """Returns the cached balance, calling load() -> int on a miss."""
+        key = (table, user)
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        epoch = self._epoch
+        value = load()
+        with self._lock:
+            if epoch == self._epoch and not self._writes:
+                self._cache.set(key, value)
+        return value
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def unchanged_since(self, epoch: int) -> bool:
+        """True if no points write was in flight or finished since `epoch` was read."""
+        with self._lock:
+            return epoch == self._epoch and not self._writes
+
+    @contextmanager
+    def writing(self):
+        """Marks a points write in flight; apply() its effect inside, after the commit."""
+        with self._lock:
+            self._writes += 1
+            self._epoch += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._writes -= 1
+                self._epoch += 1
+
+    def set(self, table: str, user: str, value: int) -> None:
+        """Stores a balance read back inside writing(), after the commit."""
+        self._cache.set((table, user), value)
+        for watcher in self.watchers:
+            watcher.observe(table, user, value)
+
+    def apply(self, table: str, user: str, delta: int) -> None:
+        """Adds a committed change to the cached balance, if there is one. Call inside writing()."""
+        value = self._cache.update((table, user), lambda points: points + delta)
+        for watcher in self.watchers:
+            if value is not None:
+                watcher.observe(table, user, value)
+            else:
+                watcher.adjust(table, user, delta)
+
+    def invalidate(self, table: str = None, user: str = None) -> None:
+        """Drops one user's balance, or everything, so the next read goes to the database."""
+        with self._lock:
+            self._epoch += 1
+            if user is not None:
+                self._cache.pop((table, user))
+            else:
+                self._cache.clear()
+        for watcher in self.watchers:
+            watcher.invalidate(table, user)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+balances = BalanceCache()
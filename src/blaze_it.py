@@ -5,6 +5,7 @@ import pytz
 import winsound
 import pyttsx3
 
+from chat_queue import PRIORITY_ANNOUNCE
 from utils import log
 from config import SOUND_FILE
 
@@ -133,6 +134,6 @@ def fire_420(bot_instance, test: bool = False) -> str:
     log("[420] " + msg)
 
     if bot_instance:
-        bot_instance.send(msg)
+        bot_instance.send(msg, priority=PRIORITY_ANNOUNCE)
 
     return msg
\ No newline at end of file
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# In-process maps that forget on their own, so per-chatter state on a 24/7
+# channel stays proportional to the people active right now rather than
+# everyone who ever typed.
+
+_MISSING = object()
+
+
+class TtlMap:
+    """Key -> value map whose entries disappear `ttl` seconds after they were set.
+
+    Expiry is driven by a hashed timing wheel: each entry is also filed under
+    the tick in which it expires, and every call sweeps the ticks that have
+    passed since the last one. The sweep cost is proportional to what
+    actually expired, there is no background thread, and memory tracks the
+    number of live entries.
+    """
+
+    def __init__(self, resolution: float = 1.0, clock=time.monotonic):
+        self.resolution = resolution
+        self._clock = clock
+        self._data: dict = {}   # key -> (expires_at, value)
+        self._slots: dict = {}  # tick -> [keys expiring in that tick]
+        self._cursor = int(clock() / resolution)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                return default
+            return entry[1]
+
+    def set(self, key, value, ttl: float) -> None:
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            self._put(key, value, now + ttl)
+
+    def claim(self, key, ttl: float, value=True) -> bool:
+        """Sets key only if it is absent or expired. Returns True if this call set it.
+
+        This is the check-and-mark a cooldown needs, done under one lock.
+        """
+        with self._lock:
+            now = self._clock()
+            self._advance(now)
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._put(key, value, now + ttl)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._slots.clear()
+
+    def expire(self) -> None:
+        """Sweeps expired entries now instead of on the next access."""
+        with self._lock:
+            self._advance(self._clock())
+
+    def _put(self, key, value, expires_at: float) -> None:
+        self._data[key] = (expires_at, value)
+        tick = int(expires_at / self.resolution) + 1
+        slot = self._slots.get(tick)
+        if slot is None:
+            self._slots[tick] = [key]
+        else:
+            slot.append(key)
+
+    def _advance(self, now: float) -> None:
+        tick = int(now / self.resolution)
+        if tick <= self._cursor:
+            return
+        if tick - self._cursor > len(self._slots):
+            # Idle for longer than the wheel is wide: visit only occupied ticks.
+            due = [t for t in self._slots if t <= tick]
+        else:
+            due = range(self._cursor + 1, tick + 1)
+        self._cursor = tick
+        data = self._data
+        for t in due:
+            keys = self._slots.pop(t, None)
+            if not keys:
+                continue
+            for key in keys:
+                entry = data.get(key)
+                # A key re-set later also sits in a later slot; leave it alone here.
+                if entry is not None and entry[0] <= now:
+                    del data[key]
+
+
+class LruCache:
+    """Size-bounded LRU map whose entries also expire `ttl` seconds after they were set.
+
+    Counts hits, misses, evictions (dropped to make room) and expirations,
+    both on the instance and as `{name}.*` counters in metrics.
+    """
+
+    def __init__(self, max_size: int, ttl: float, name: str = "cache", clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value), oldest use first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > self._clock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > self._clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    metrics.incr(f"{self.name}.hit")
+                    return entry[1]
+                del self._data[key]
+                self.expirations += 1
+                metrics.incr(f"{self.name}.expired")
+            self.misses += 1
+            metrics.incr(f"{self.name}.miss")
+            return default
+
+    def set(self, key, value, ttl: float = None) -> None:
+        with self._lock:
+            now = self._clock()
+            data = self._data
+            data[key] = (now + (self.ttl if ttl is None else ttl), value)
+            data.move_to_end(key)
+            if len(data) > self.max_size:
+                # Over the bound: drop from the cold end, counting entries that
+                # had already expired separately from live ones pushed out.
+                while len(data) > self.max_size:
+                    _, (expires_at, _) = data.popitem(last=False)
+                    if expires_at <= now:
+                        self.expirations += 1
+                        metrics.incr(f"{self.name}.expired")
+                    else:
+                        self.evictions += 1
+                        metrics.incr(f"{self.name}.evicted")
+            metrics.set_gauge(f"{self.name}.size", len(data))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def update(self, key, fn):
+        """Replaces a live entry's value with fn(value), keeping its expiry and LRU position.
+
+        Returns the new value, or None (leaving the cache alone) when key is
+        absent or expired. Not counted as a hit or miss.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= self._clock():
+                return None
+            value = fn(entry[1])
+            self._data[key] = (entry[0], value)
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data), "hits": self.hits, "misses": self.misses,
+            "evictions": self.evictions, "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
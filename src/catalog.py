@@ -0,0 +1,188 @@
+import threading
+import time
+from datetime import datetime
+
+import metrics
+import queries
+import search_index
+from config import CATALOG_SYNC_INTERVAL, CATALOG_SYNC_BATCH
+from utils import log
+
+SETTLE_SECONDS = 2       # edits younger than this wait for the next sync
+SWEEP_SPAN = 10000       # song IDs re-checked per sync for deletions and enable flips
+REBUILD_FRACTION = 0.2   # rebuild the index once this share of it is overlay
+NO_MODIFIED = "1970-01-01 00:00:00"
+
+
+class CatalogSync:
+    """Keeps the in-memory catalog (the !search index) in step with RadioDJ's songs table.
+
+    Each sync is a few keyset range scans of at most `batch` rows:
+    - new songs, by ID above the highest ID seen;
+    - edited songs, by (date_modified, ID) past the last pair seen. Rows
+      edited in the last SETTLE_SECONDS are left for the next sync, so an
+      edit committed late in the same second is never stepped over;
+    - a sweep of SWEEP_SPAN IDs comparing the enabled songs with the index,
+      which catches deleted rows and enable flips that left date_modified
+      alone. The sweep goes round the whole table over successive syncs.
+
+    `version` goes up whenever the catalog changes, for anything caching
+    data derived from it. Once enough of the index is overlay it is rebuilt
+    from scratch.
+    """
+
+    def __init__(self, interval: float = CATALOG_SYNC_INTERVAL, batch: int = CATALOG_SYNC_BATCH):
+        self.interval = interval
+        self.batch = max(1, batch)
+        self.version = 0
+        self.last_id = 0
+        self.last_modified = NO_MODIFIED
+        self.last_modified_id = 0
+        self._sweep_from = 0
+        self._wake = threading.Event()
+        self._thread: threading.Thread = None
+        self._running = False
+
+    def load(self) -> None:
+        """Builds the index from scratch and takes the high-water marks it covers."""
+        # Marks first: anything written during the build is read again by the next sync.
+        with queries.session() as q:
+            marks = q.song_marks() or {}
+        search_index.load()
+        self.last_id = marks.get("max_id") or 0
+        self.last_modified = marks.get("modified") or NO_MODIFIED
+        self.last_modified_id = 0
+        self._bump()
+
+    def sync(self) -> int:
+        """One incremental pass. Returns the number of songs added, changed or removed."""
+        index = search_index.current
+        if index is None:
+            self.load()
+            return len(search_index.current)
+        start = time.perf_counter()
+        rows = changed = 0
+        oldest = None
+        with queries.session() as q:
+            for batch in self._pages(q, self._new_songs):
+                self.last_id = batch[-1]["ID"]
+                rows += len(batch)
+                changed += self._apply(index, batch)
+            for batch in self._pages(q, self._edited_songs):
+                self.last_modified = batch[-1]["date_modified"]
+                self.last_modified_id = batch[-1]["ID"]
+                rows += len(batch)
+                changed += self._apply(index, batch)
+                oldest = batch[0]["date_modified"] if oldest is None else oldest
+            swept, sweep_changed = self._sweep(q, index)
+            rows += swept
+            changed += sweep_changed
+
+        metrics.observe("catalog.sync_ms", (time.perf_counter() - start) * 1000)
+        metrics.set_gauge("catalog.sync_rows", rows)
+        metrics.incr("catalog.rows", rows)
+        lag = _age(oldest)
+        if lag is not None:
+            metrics.set_gauge("catalog.lag_seconds", round(lag, 1))
+        if changed:
+            metrics.incr("catalog.changes", changed)
+            self._bump()
+            log(f"Catalog: {changed} songs added, changed or removed")
+        if index.churn > REBUILD_FRACTION * max(1, len(index)):
+            log(f"Catalog: rebuilding the search index ({index.churn} songs changed since the last build)")
+            self.load()
+        return changed
+
+    def _pages(self, q, fetch):
+        """Yields batches from fetch(q) until one comes back short."""
+        while True:
+            batch = fetch(q)
+            if batch:
+                yield batch
+            if len(batch) < self.batch:
+                return
+
+    def _new_songs(self, q) -> list:
+        return q.songs_after_id(self.last_id, self.batch)
+
+    def _edited_songs(self, q) -> list:
+        return q.songs_modified_after(self.last_modified, self.last_modified_id, SETTLE_SECONDS, self.batch)
+
+    def _sweep(self, q, index) -> tuple:
+        """Checks the next SWEEP_SPAN song IDs. Returns (rows read, songs changed)."""
+        low = self._sweep_from
+        high = low + SWEEP_SPAN - 1
+        self._sweep_from = high + 1 if high < self.last_id else 0
+        enabled = q.enabled_song_ids_between(low, high)
+        known = index.ids_between(low, high)
+        changed = sum(index.remove(song_id) for song_id in known - enabled)
+        missing = sorted(enabled - known)
+        rows = len(enabled)
+        for i in range(0, len(missing), self.batch):
+            chunk = missing[i:i + self.batch]
+            found = q.songs_by_id(chunk)
+            rows += len(found)
+            changed += self._apply(index, found)
+        return rows, changed
+
+    @staticmethod
+    def _apply(index, rows: list) -> int:
+        changed = 0
+        for r in rows:
+            if r["enabled"]:
+                changed += index.upsert(r["ID"], r["artist"], r["title"])
+            else:
+                changed += index.remove(r["ID"])
+        return changed
+
+    def _bump(self) -> None:
+        self.version += 1
+        metrics.set_gauge("catalog.version", self.version)
+
+    # ===== Sync Thread =====
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="catalog-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        if search_index.current is None:
+            try:
+                self.load()
+            except Exception as e:
+                log(f"Catalog: could not load the songs table, !search uses SQL for now: {e}")
+        while self._running:
+            self._wake.wait(self.interval)
+            if not self._running:
+                break
+            try:
+                self.sync()
+            except Exception as e:
+                log(f"Catalog: sync failed, will retry: {e}")
+
+
+def _age(modified) -> float:
+    """Seconds since a date_modified value, or None if it cannot be read."""
+    if isinstance(modified, str):
+        try:
+            modified = datetime.fromisoformat(modified)
+        except ValueError:
+            return None
+    if not isinstance(modified, datetime):
+        return None
+    return max(0.0, (datetime.now() - modified).total_seconds())
+
+
+catalog = CatalogSync()
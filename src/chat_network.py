@@ -0,0 +1,283 @@
+import asyncio
+import random
+import time
+
+from config import (
+    TWITCH_SERVER, TWITCH_PORT, TWITCH_OAUTH, TWITCH_NICK, TWITCH_CHANNELS_PER_CONNECTION,
+    TWITCH_PING_INTERVAL, TWITCH_PING_TIMEOUT,
+    TWITCH_RATE_LIMIT, TWITCH_RATE_PERIOD, TWITCH_RATE_BURST,
+    COMMAND_WORKERS, COMMAND_QUEUE_LIMIT, COMMAND_QUEUE_PER_USER
+)
+from chat_queue import OutboundQueue, PRIORITY_REPLY
+from irc import IrcConnection, IrcMessage, parse_line
+from ledger import ledger
+from utils import log
+from workers import KeyedExecutor
+import metrics
+
+# Connection states. A shard only ever moves along these edges:
+#   DISCONNECTED -> CONNECTING -> REGISTERING -> CONNECTED -> BACKOFF -> CONNECTING ...
+# with any state going to STOPPED once stop() is called.
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+REGISTERING = "registering"
+CONNECTED = "connected"
+BACKOFF = "backoff"
+STOPPED = "stopped"
+
+_LAG_TOKEN = "lag:"
+
+
+class Backoff:
+    """Exponential backoff with jitter: each delay is drawn from the upper
+    half of base * 2**attempt (capped), so shards and restarts that fail
+    together do not come back in lockstep."""
+
+    def __init__(self, base: float = 1.0, cap: float = 60.0, rng: random.Random = None):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+        self._rng = rng or random.Random()
+
+    def next(self) -> float:
+        ceiling = min(self.cap, self.base * (2 ** self.attempt))
+        self.attempt += 1
+        return ceiling / 2 + self._rng.uniform(0, ceiling / 2)
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+
+class ChatShard:
+    """One IRC connection, the channels joined over it, and its connection state."""
+
+    def __init__(self, index: int, server: str, port: int):
+        self.index = index
+        self.conn: IrcConnection = IrcConnection(server, port)
+        self.channels: list = []
+        self.state: str = DISCONNECTED
+        self.backoff: Backoff = Backoff()
+        self.first_connect: bool = True
+        self.lag_ms: float = None        # last measured PING round trip
+        self._ping_sent: dict = {}       # token -> perf_counter when sent
+
+    def set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            metrics.incr(f"twitch.state.{state}")
+
+
+class ChatNetwork:
+    """Everything the bot shares across channels: the IRC connections, the
+    outbound writer and its rate limit, and the command pool.
+
+    Channels are packed onto connections `channels_per_connection` at a time.
+    Each TwitchBot registers its channel with add(); inbound lines are routed
+    to the bot for the channel they arrived on.
+    """
+
+    def __init__(self, server: str = TWITCH_SERVER, port: int = TWITCH_PORT,
+                 channels_per_connection: int = TWITCH_CHANNELS_PER_CONNECTION):
+        self.server = server
+        self.port = port
+        self.channels_per_connection = max(1, channels_per_connection)
+        self.shards: list = []
+        self.bots: dict = {}        # channel -> TwitchBot
+        self._shard_for: dict = {}  # channel -> ChatShard
+        self.outbound: OutboundQueue = OutboundQueue(
+            self._write_privmsg, TWITCH_RATE_LIMIT, TWITCH_RATE_PERIOD, TWITCH_RATE_BURST
+        )
+        # Keyed by (channel, user): one viewer's commands in one channel run in order.
+        self.executor: KeyedExecutor = KeyedExecutor(
+            COMMAND_WORKERS, COMMAND_QUEUE_LIMIT, COMMAND_QUEUE_PER_USER, name="twitch-cmd"
+        )
+        self.loop: asyncio.AbstractEventLoop = None
+        self.running: bool = True
+        self._stop_event: asyncio.Event = None
+        self._connect_lock: asyncio.Lock = None  # one handshake at a time across shards
+
+    def add(self, bot) -> None:
+        """Registers a bot for its channel. Must be called before run()."""
+        channel = bot.channel
+        if channel in self.bots:
+            raise ValueError(f"channel #{channel} joined twice")
+        if not self.shards or len(self.shards[-1].channels) >= self.channels_per_connection:
+            self.shards.append(ChatShard(len(self.shards), self.server, self.port))
+        shard = self.shards[-1]
+        shard.channels.append(channel)
+        self._shard_for[channel] = shard
+        self.bots[channel] = bot
+
+    def send(self, channel: str, msg: str, priority: int = PRIORITY_REPLY, group: str = None) -> None:
+        self.outbound.put(channel, msg, priority, group)
+
+    def _write_privmsg(self, channel: str, msg: str) -> bool:
+        """Called by the outbound queue's writer thread only."""
+        shard = self._shard_for.get(channel)
+        return shard is not None and shard.conn.write_line(f"PRIVMSG #{channel} :{msg}")
+
+    def submit(self, key, fn, *args) -> bool:
+        return self.executor.submit(key, fn, *args)
+
+    def route(self, message: IrcMessage) -> None:
+        """Hands a message to the bot of the channel it belongs to, if any."""
+        bot = self.bots.get(message.channel)
+        if bot is not None:
+            bot.handle_message(message)
+
+    # ===== Connection Handling =====
+
+    def run(self, on_message=None) -> None:
+        """Runs every connection on one private asyncio loop until stop() is called.
+
+        on_message(IrcMessage) is called on the loop thread for every line
+        except PING, which is answered inline; it defaults to route() and must
+        hand any slow work to submit().
+        """
+        asyncio.run(self._serve_all(on_message or self.route))
+
+    async def _serve_all(self, on_message) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._connect_lock = asyncio.Lock()
+        self.outbound.start()
+        ledger.start()
+        try:
+            await asyncio.gather(*(self._supervise(shard, on_message) for shard in self.shards))
+        finally:
+            for shard in self.shards:
+                shard.set_state(STOPPED)
+            self.executor.shutdown()
+            ledger.stop()  # final flush of buffered earnings
+
+    async def _supervise(self, shard: ChatShard, on_message) -> None:
+        """Drives one shard through its states until stop(): connect, serve, back off, repeat.
+
+        A plain loop, so a long outage costs nothing but sleeps.
+        """
+        while self.running:
+            if await self._connect(shard):
+                await self._serve(shard, on_message)
+            if not self.running:
+                break
+            delay = shard.backoff.next()
+            shard.set_state(BACKOFF)
+            log(f"Twitch: reconnecting shard {shard.index} in {delay:.1f}s")
+            await self._sleep(delay)
+
+    async def _connect(self, shard: ChatShard) -> bool:
+        """Opens the shard's socket and sends the login and JOIN. Returns False on failure."""
+        async with self._connect_lock:
+            if not self.running:
+                return False
+            shard.set_state(CONNECTING)
+            try:
+                await shard.conn.open()
+            except (OSError, asyncio.TimeoutError) as e:
+                log(f"Twitch Connect Error: {e}")
+                metrics.incr("twitch.connect_failed")
+                shard.set_state(DISCONNECTED)
+                return False
+            shard.set_state(REGISTERING)
+            shard.conn.write_line("CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership")
+            shard.conn.write_line(f"PASS {TWITCH_OAUTH}")
+            shard.conn.write_line(f"NICK {TWITCH_NICK}")
+            shard.conn.write_line("JOIN " + ",".join(f"#{c}" for c in shard.channels))
+            return True
+
+    def _on_welcome(self, shard: ChatShard) -> None:
+        """RPL_WELCOME (001): the server accepted the login."""
+        shard.set_state(CONNECTED)
+        shard.backoff.reset()
+        now = time.time()
+        for channel in shard.channels:
+            bot = self.bots[channel]
+            bot.stream_start_time = now
+            if shard.first_connect:
+                bot.on_first_connect()
+        shard.first_connect = False
+        log(f"Twitch: Connected ({', '.join(shard.channels)})")
+
+    async def _sleep(self, seconds: float) -> None:
+        """Sleeps on the network's loop, waking early if stop() is called."""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _serve(self, shard: ChatShard, on_message) -> None:
+        """Reads the shard's connection until it drops, with a pinger alongside."""
+        conn = shard.conn
+        pinger = asyncio.ensure_future(self._ping_loop(shard))
+        try:
+            async for line in conn.lines():
+                message = parse_line(line)
+                command = message.command
+                if command == "PING":
+                    conn.write_line(f"PONG :{message.text}")
+                    continue
+                if command == "PONG":
+                    self._on_pong(shard, message.text)
+                    continue
+                if command == "001":
+                    self._on_welcome(shard)
+                elif command == "RECONNECT":
+                    log("Twitch: server asked us to reconnect")
+                    break
+                try:
+                    on_message(message)
+                except Exception as e:
+                    log(f"An unexpected error occurred in Twitch loop: {type(e).__name__}: {e}")
+            else:
+                if self.running:
+                    log("Twitch: Connection closed by server, reconnecting...")
+        except asyncio.TimeoutError:
+            log("Twitch: Socket timeout, reconnecting...")
+        except OSError as e:
+            log(f"Twitch Socket Error: {e}. Reconnecting...")
+        finally:
+            pinger.cancel()
+            shard._ping_sent.clear()
+            conn.close()
+            shard.set_state(DISCONNECTED)
+
+    async def _ping_loop(self, shard: ChatShard) -> None:
+        """Sends a client PING every interval; one unanswered past the timeout drops the link."""
+        while True:
+            await asyncio.sleep(TWITCH_PING_INTERVAL)
+            sent = time.perf_counter()
+            token = f"{_LAG_TOKEN}{int(sent * 1000)}"
+            shard._ping_sent[token] = sent
+            shard.conn.write_line(f"PING :{token}")
+            await asyncio.sleep(TWITCH_PING_TIMEOUT)
+            if shard._ping_sent.pop(token, None) is not None:
+                log(f"Twitch: no PONG within {TWITCH_PING_TIMEOUT}s on shard {shard.index}, reconnecting...")
+                metrics.incr("twitch.ping_timeout")
+                shard.conn.close()
+                return
+
+    def _on_pong(self, shard: ChatShard, token: str) -> None:
+        sent = shard._ping_sent.pop(token, None)
+        if sent is None:
+            return
+        shard.lag_ms = (time.perf_counter() - sent) * 1000
+        metrics.observe("twitch.lag_ms", shard.lag_ms)
+        metrics.set_gauge(f"twitch.lag_ms.shard{shard.index}", round(shard.lag_ms, 1))
+
+    @property
+    def lag_ms(self) -> float:
+        """Worst last-measured PING round trip across connected shards, or None before the first PONG."""
+        lags = [s.lag_ms for s in self.shards if s.state == CONNECTED and s.lag_ms is not None]
+        return max(lags) if lags else None
+
+    def stop(self) -> None:
+        self.running = False
+        self.outbound.stop()
+        if self.loop is not None and self._stop_event is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # loop already finished
+        for shard in self.shards:
+            shard.set_state(STOPPED)
+            shard.conn.close()
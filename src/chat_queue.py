@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+from utils import log
+
+# Lower number = sent first.
+PRIORITY_MOD = 0        # replies to moderator commands
+PRIORITY_REPLY = 1      # replies to viewer commands
+PRIORITY_ANNOUNCE = 2   # now-playing, shoutouts, 420 and other unsolicited posts
+
+# Twitch rejects PRIVMSG bodies longer than this.
+MAX_MESSAGE_LEN = 500
+# Unsolicited posts older than this are no longer worth a rate-limit token.
+ANNOUNCE_MAX_AGE = 60.0
+
+
+class TokenBucket:
+    """Token bucket that never allows more than `limit` sends in any `period` window.
+
+    A bucket of capacity b refilled at r tokens/s can release at most
+    b + r * period tokens inside one window, so the refill rate is derived
+    from the limit and the burst size rather than configured separately.
+    """
+
+    def __init__(self, limit: int, period: float, burst: int):
+        self.capacity = max(1, min(burst, limit))
+        self.rate = max(limit - self.capacity, 1) / period
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Pending:
+    __slots__ = ("channel", "text", "priority", "group", "queued_at")
+
+    def __init__(self, channel: str, text: str, priority: int, group: str):
+        self.channel = channel
+        self.text = text
+        self.priority = priority
+        self.group = group
+        self.queued_at = time.monotonic()
+
+
+class OutboundQueue:
+    """The only thing that writes chat messages to the IRC connection.
+
+    put() never blocks: it files the message under its priority and returns.
+    A single writer thread releases messages through the token bucket,
+    highest priority first, and folds queued messages that share a `group`
+    (e.g. the parts of one multi-part reply) into a single PRIVMSG.
+    """
+
+    def __init__(self, write, limit: int = 20, period: float = 30.0, burst: int = 5,
+                 max_pending: int = 100):
+        self._write = write  # write(channel, text) -> bool, False when not connected
+        self.bucket = TokenBucket(limit, period, burst)
+        self.max_pending = max_pending
+        self._queues = (deque(), deque(), deque())
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: threading.Thread = None
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues)
+
+    def put(self, channel: str, text: str, priority: int = PRIORITY_REPLY, group: str = None) -> bool:
+        """Enqueues a message. Returns False if it was shed because the queue is full."""
+        priority = min(max(priority, PRIORITY_MOD), PRIORITY_ANNOUNCE)
+        with self._cond:
+            if len(self) >= self.max_pending and not self._shed_below(priority):
+                metrics.incr("chat.dropped")
+                return False
+            self._queues[priority].append(_Pending(channel, text, priority, group))
+            metrics.set_gauge("chat.queue_depth", len(self))
+            self._cond.notify()
+        return True
+
+    def _shed_below(self, priority: int) -> bool:
+        """Drops the oldest message of the lowest priority strictly below `priority`."""
+        for p in range(PRIORITY_ANNOUNCE, priority, -1):
+            if self._queues[p]:
+                dropped = self._queues[p].popleft()
+                metrics.incr("chat.dropped")
+                log(f"Twitch: chat queue full, dropped: {dropped.text}")
+                return True
+        return False
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="twitch-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _next(self) -> tuple:
+        """Pops the next message (coalesced with its group). Caller holds the lock."""
+        now = time.monotonic()
+        announce = self._queues[PRIORITY_ANNOUNCE]
+        while announce and now - announce[0].queued_at > ANNOUNCE_MAX_AGE:
+            announce.popleft()
+            metrics.incr("chat.expired")
+        for q in self._queues:
+            if not q:
+                continue
+            head = q.popleft()
+            text = head.text
+            if head.group is not None:
+                for item in list(q):
+                    if item.group != head.group or item.channel != head.channel:
+                        continue
+                    joined = f"{text} | {item.text}"
+                    if len(joined) > MAX_MESSAGE_LEN:
+                        break
+                    text = joined
+                    q.remove(item)
+                    metrics.incr("chat.coalesced")
+            return head, text
+        return None, None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not len(self):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                wait = self.bucket.take()
+                if wait:
+                    self._cond.wait(wait)
+                    continue
+                item, text = self._next()
+                metrics.set_gauge("chat.queue_depth", len(self))
+            if item is None:
+                # Everything left had expired; give the token back.
+                self.bucket.tokens = min(self.bucket.capacity, self.bucket.tokens + 1)
+                continue
+            if self._write(item.channel, text):
+                metrics.incr("chat.sent")
+                continue
+            # Not connected: put it back at the front and wait for the reconnect.
+            with self._cond:
+                item.text = text
+                self._queues[item.priority].appendleft(item)
+                self.bucket.tokens = min(self.bucket.capacity, self.bucket.tokens + 1)
+                self._cond.wait(1.0)
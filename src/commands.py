@@ -0,0 +1,138 @@
+import time
+
+import metrics
+from chat_queue import PRIORITY_MOD, PRIORITY_REPLY
+
+
+class BadArgument(ValueError):
+    """An argument that is there but unreadable; the message is the reply, instead of the usage."""
+
+
+def username(value: str) -> str:
+    """Argument type for a chat user given as `name` or `@Name`."""
+    name = value.strip().lstrip('@').lower()
+    if not name:
+        raise BadArgument("you must specify a user to give points to.")
+    return name
+
+
+def amount(value: str) -> int:
+    """Argument type for a points amount."""
+    try:
+        return int(value)
+    except ValueError:
+        raise BadArgument("invalid amount. Please use a number.") from None
+
+
+def number(value: str) -> int:
+    """Argument type for a list number; reads the leading digits, so `3.` or `3!` is 3."""
+    digits = len(value) - len(value.lstrip("0123456789"))
+    if not digits:
+        raise ValueError("not a number")
+    return int(value[:digits])
+
+
+def text(value: str) -> str:
+    """Argument type for free text; must not be blank."""
+    value = value.strip()
+    if not value:
+        raise ValueError("empty text")
+    return value
+
+
+class Command:
+    """One chat command and everything the router needs to know before calling it."""
+    __slots__ = ("name", "handler", "args", "usage", "cooldown", "mod_only", "aliases", "exact")
+
+    def __init__(self, name, handler, args=(), usage=None, cooldown=0, mod_only=False, aliases=(), exact=False):
+        self.name = name
+        self.handler = handler
+        self.args = tuple(args)
+        self.usage = usage
+        self.cooldown = cooldown
+        self.mod_only = mod_only
+        self.aliases = tuple(aliases)
+        self.exact = exact
+
+    def parse_args(self, rest: str) -> tuple:
+        """Converts the words after the command word.
+
+        A `text` argument in last place takes the rest of the line. Otherwise
+        words past the last argument are ignored, or are a usage error when
+        the command is `exact`.
+        """
+        if not self.args:
+            return ()
+        if self.args[-1] is text:
+            parts = rest.split(None, len(self.args) - 1) if rest else []
+        else:
+            parts = rest.split()
+            if not self.exact:
+                parts = parts[:len(self.args)]
+        if len(parts) != len(self.args):
+            raise ValueError("wrong number of arguments")
+        return tuple(conv(part) for conv, part in zip(self.args, parts))
+
+
+class CommandRouter:
+    """Maps `!word` to a Command with a single dict lookup.
+
+    Permissions, per-user cooldowns and argument parsing are declared when a
+    command is registered, so handlers receive typed arguments and adding a
+    command costs nothing for chat lines that are not commands.
+    """
+
+    def __init__(self, reply, is_mod, is_on_cooldown):
+        self._reply = reply                    # reply(msg, priority=...)
+        self._is_mod = is_mod                  # is_mod(user, message) -> bool
+        self._is_on_cooldown = is_on_cooldown  # is_on_cooldown(user, name, seconds) -> bool
+        self._table: dict = {}
+        self.commands: list = []
+
+    def register(self, name: str, handler, args=(), usage: str = None, cooldown: int = 0,
+                 mod_only: bool = False, aliases=(), exact: bool = False) -> Command:
+        cmd = Command(name, handler, args, usage, cooldown, mod_only, aliases, exact)
+        for word in (name, *aliases):
+            word = "!" + word.lstrip("!").lower()
+            if word in self._table:
+                raise ValueError(f"chat command {word} registered twice")
+            self._table[word] = cmd
+        self.commands.append(cmd)
+        return cmd
+
+    def match(self, msg: str) -> tuple:
+        """Returns (command, rest-of-line) for a chat line, or (None, None)."""
+        if not msg.startswith("!"):
+            return None, None
+        word, _, rest = msg.partition(" ")
+        cmd = self._table.get(word.lower())
+        return (cmd, rest) if cmd else (None, None)
+
+    def dispatch(self, cmd: Command, user: str, rest: str, message) -> None:
+        """Checks permission and cooldown, parses arguments and runs the handler."""
+        name = cmd.name
+        priority = PRIORITY_MOD if cmd.mod_only else PRIORITY_REPLY
+        if cmd.mod_only and not self._is_mod(user, message):
+            metrics.incr(f"cmd.{name}.denied")
+            self._reply(f"@{user}, you don't have permission to use that command.", priority=priority)
+            return
+        if cmd.cooldown and self._is_on_cooldown(user, name, cmd.cooldown):
+            metrics.incr(f"cmd.{name}.cooldown")
+            return
+        try:
+            args = cmd.parse_args(rest)
+        except BadArgument as e:
+            metrics.incr(f"cmd.{name}.usage")
+            self._reply(f"@{user}, {e}", priority=priority)
+            return
+        except ValueError:
+            metrics.incr(f"cmd.{name}.usage")
+            if cmd.usage:
+                self._reply(f"@{user}, {cmd.usage}", priority=priority)
+            return
+        metrics.incr(f"cmd.{name}.count")
+        start = time.perf_counter()
+        try:
+            cmd.handler(user, *args)
+        finally:
+            metrics.observe(f"cmd.{name}.ms", (time.perf_counter() - start) * 1000)
@@ -35,12 +35,37 @@ def create_default_config():
     nick = your_twitch_username
     channel = your_twitch_channel
     oauth = oauth:xxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    rate_limit_messages = 20
+    rate_limit_seconds = 30
+    rate_limit_burst = 5
+    command_workers = 4
+    command_queue_limit = 200
+    command_queue_per_user = 3
+    extra_channels =
+    channels_per_connection = 20
+    ping_interval_seconds = 60
+    ping_timeout_seconds = 15
+    search_results_max = 5000
+    search_results_ttl_seconds = 600
 
     [database]
     host = 127.0.0.1
     user = root
     password = 
     db = radiodj
+    backend = mysql
+    sqlite_path = radiobot.db
+    pool_size = 8
+    pool_max_age_seconds = 1800
+    pool_checkout_timeout_seconds = 5
+    pool_ping_after_idle_seconds = 30
+    catalog_sync_seconds = 30
+    catalog_sync_batch = 1000
+    slow_query_ms = 250
+    now_playing_poll_seconds = 5
+    now_playing_idle_poll_seconds = 30
+    now_playing_file = 
+    now_playing_file_debounce_ms = 250
 
     [server]
     host = 127.0.0.1
@@ -56,9 +81,14 @@ def create_default_config():
     request_cost = 25
     playnext_cost = 250
     give_points_tax_percent = 5
+    earnings_flush_seconds = 5
+    balance_cache_size = 20000
+    balance_cache_seconds = 300
+    leaderboard_reseed_seconds = 600
 
     [overlay]
     max_results = 5
+    leaderboard_size = 10
 
     [style]
     background = #000000
@@ -123,10 +153,60 @@ TWITCH_OAUTH = config.get("twitch", "oauth", fallback="")
 
 STATION_NAME = config.get("twitch", "station_name", fallback="RadioBot")
 
+# Outbound chat limits: Twitch allows a regular bot account 20 messages per 30 seconds.
+TWITCH_RATE_LIMIT = safe_getint("twitch", "rate_limit_messages", 20)
+TWITCH_RATE_PERIOD = safe_getint("twitch", "rate_limit_seconds", 30)
+TWITCH_RATE_BURST = safe_getint("twitch", "rate_limit_burst", 5)
+
+# Chat command handlers run on a bounded pool, in order per user.
+COMMAND_WORKERS = safe_getint("twitch", "command_workers", 4)
+COMMAND_QUEUE_LIMIT = safe_getint("twitch", "command_queue_limit", 200)
+COMMAND_QUEUE_PER_USER = safe_getint("twitch", "command_queue_per_user", 3)
+
+# Further channels to run the bot in, each with its own commands, cooldowns and points.
+# The primary channel always comes first; channels are packed onto shared connections.
+TWITCH_CHANNELS = [TWITCH_CHANNEL.lower().lstrip("#")] + [
+    c for c in dict.fromkeys(
+        c.strip().lower().lstrip("#") for c in config.get("twitch", "extra_channels", fallback="").split(",")
+    ) if c and c != TWITCH_CHANNEL.lower().lstrip("#")
+]
+TWITCH_CHANNELS_PER_CONNECTION = safe_getint("twitch", "channels_per_connection", 20)
+
+# Client-side keepalive: PING this often to measure lag; no PONG within the timeout means a dead link.
+TWITCH_PING_INTERVAL = safe_getint("twitch", "ping_interval_seconds", 60)
+TWITCH_PING_TIMEOUT = safe_getint("twitch", "ping_timeout_seconds", 15)
+
+# Each viewer's latest !search results, kept for !pick/!playnext until used, expired or pushed out.
+SEARCH_RESULTS_MAX = safe_getint("twitch", "search_results_max", 5000)
+SEARCH_RESULTS_TTL = safe_getint("twitch", "search_results_ttl_seconds", 600)
+
 MYSQL_HOST = config.get("database", "host", fallback="localhost")
 MYSQL_USER = config.get("database", "user", fallback="root")
 MYSQL_PASS = config.get("database", "password", fallback="")
 MYSQL_DB = config.get("database", "db", fallback="radiodj")
+# "mysql" talks to RadioDJ; "sqlite" keeps the same tables in a local file, for running without MySQL.
+DB_BACKEND = config.get("database", "backend", fallback="mysql").strip().lower()
+SQLITE_PATH = os.path.join(APP_DIR, config.get("database", "sqlite_path", fallback="radiobot.db"))
+
+# Connection pool shared by the bot, the trackers and the overlay.
+DB_POOL_SIZE = safe_getint("database", "pool_size", 8)
+DB_POOL_MAX_AGE = safe_getint("database", "pool_max_age_seconds", 1800)
+DB_POOL_CHECKOUT_TIMEOUT = safe_getint("database", "pool_checkout_timeout_seconds", 5)
+DB_POOL_PING_AFTER_IDLE = safe_getint("database", "pool_ping_after_idle_seconds", 30)
+# RadioDJ edits to the songs table reach the in-memory catalog this often, in batches of this many rows.
+CATALOG_SYNC_INTERVAL = safe_getint("database", "catalog_sync_seconds", 30)
+CATALOG_SYNC_BATCH = safe_getint("database", "catalog_sync_batch", 1000)
+# Queries slower than this are logged with their SQL.
+DB_SLOW_QUERY_MS = safe_getint("database", "slow_query_ms", 250)
+# Now playing, the next queued track and pending requests are probed for changes once this often
+# for every consumer, when the track on air has no known duration.
+STATION_POLL_INTERVAL = safe_getint("database", "now_playing_poll_seconds", 5)
+# Mid-song the poller waits for the track's end, but never longer than this (requests added outside chat).
+STATION_IDLE_POLL_INTERVAL = safe_getint("database", "now_playing_idle_poll_seconds", 30)
+# RadioDJ's now-playing export (text "Artist - Title" or XML). When set, track changes are taken
+# from it as soon as it has been quiet this long, instead of waiting for the next poll.
+NOW_PLAYING_FILE = config.get("database", "now_playing_file", fallback="").strip()
+NOW_PLAYING_DEBOUNCE_MS = safe_getint("database", "now_playing_file_debounce_ms", 250)
 
 HTTP_HOST = config.get("server", "host", fallback="0.0.0.0")
 HTTP_PORT = safe_getint("server", "port", 8080)
@@ -140,9 +220,17 @@ POINTS_ACTIVE_COOLDOWN = safe_getint("points", "active_earn_cooldown_seconds", 6
 POINTS_REQUEST_COST = safe_getint("points", "request_cost", 25)
 POINTS_PLAYNEXT_COST = safe_getint("points", "playnext_cost", 250)
 POINTS_GIVE_TAX = safe_getint("points", "give_points_tax_percent", 5)
+# Earnings are buffered in memory and written in one batch this often.
+POINTS_FLUSH_INTERVAL = safe_getint("points", "earnings_flush_seconds", 5)
+# Balances are cached in memory and re-read from the database after this long.
+POINTS_BALANCE_CACHE_SIZE = safe_getint("points", "balance_cache_size", 20000)
+POINTS_BALANCE_CACHE_TTL = safe_getint("points", "balance_cache_seconds", 300)
+# The leaderboard follows points changes in memory and re-reads the top balances this often.
+POINTS_LEADERBOARD_RESEED = safe_getint("points", "leaderboard_reseed_seconds", 600)
 
 
 MAX_RESULTS = safe_getint("overlay", "max_results", 5)
+LEADERBOARD_SIZE = safe_getint("overlay", "leaderboard_size", 10)
 REFRESH = safe_getint("style", "refresh_rate", 5)
 
 BG = config.get("style", "background", fallback="#000000")
@@ -1,7 +1,21 @@
+import threading
+import time
+from collections import deque
+
 import pymysql
-from config import MYSQL_HOST, MYSQL_USER, MYSQL_PASS, MYSQL_DB
+from pymysql.constants import SERVER_STATUS
+
+import metrics
+from config import (
+    MYSQL_HOST, MYSQL_USER, MYSQL_PASS, MYSQL_DB, DB_BACKEND,
+    DB_POOL_SIZE, DB_POOL_MAX_AGE, DB_POOL_CHECKOUT_TIMEOUT, DB_POOL_PING_AFTER_IDLE
+)
+from sqlite_db import connect_sqlite
+from utils import log
 
-def get_db_connection():
+
+def connect_mysql():
+    """Opens one new, unpooled connection to the RadioDJ database."""
     return pymysql.connect(
         host=MYSQL_HOST,
         user=MYSQL_USER,
@@ -13,30 +27,184 @@ def get_db_connection():
     )
 
 
-def ensure_tables_exist():
-    """Create minimal tables used by RadioBot if they do not exist.
+class PoolTimeout(Exception):
+    """No pooled connection became free within the checkout timeout."""
 
-    Currently ensures `community_points` table exists so the bot can
-    safely update and query user points.
-    """
-    create_sql = """
-    CREATE TABLE IF NOT EXISTS community_points (
-      username VARCHAR(100) NOT NULL,
-      points INT NOT NULL DEFAULT 0,
-      last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
-      last_active DATETIME DEFAULT NULL,
-      PRIMARY KEY (username)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+class PooledConnection:
+    """What get_db_connection() hands out: the real connection, except that
+    close() gives it back to the pool instead of hanging up."""
+
+    def __init__(self, pool: "ConnectionPool", raw, created: float):
+        self._pool = pool
+        self._raw = raw
+        self._created = created
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise pymysql.err.InterfaceError("connection already returned to the pool")
+        return getattr(raw, name)
+
+    def cursor(self, *args):
+        return self._raw.cursor(*args)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, self._created)
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of database connections.
+
+    Borrowing reuses the most recently returned idle connection. Before it is
+    handed out, a connection older than `max_age` is replaced, and one idle
+    for longer than `ping_after_idle` is pinged (and replaced if dead). When
+    all `max_size` connections are out, a borrower waits up to
+    `checkout_timeout` seconds and then gets PoolTimeout. Returned
+    connections are rolled back if a transaction is still open, so the next
+    borrower never reads from a stale snapshot.
     """
-    conn = None
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as c:
-            c.execute(create_sql)
-        conn.commit()
-    except Exception:
-        # Do not raise here; calling code should handle/log exceptions.
-        pass
-    finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+
+    def __init__(self, connect, max_size: int = DB_POOL_SIZE, max_age: float = DB_POOL_MAX_AGE,
+                 checkout_timeout: float = DB_POOL_CHECKOUT_TIMEOUT,
+                 ping_after_idle: float = DB_POOL_PING_AFTER_IDLE):
+        self._connect = connect
+        self.max_size = max(1, max_size)
+        self.max_age = max_age
+        self.checkout_timeout = checkout_timeout
+        self.ping_after_idle = ping_after_idle
+        self._idle: deque = deque()  # (raw, created, returned_at), most recent on the right
+        self._cond = threading.Condition()
+        self._size = 0      # connections open or being opened, in use or idle
+        self.in_use = 0
+        self.waits = 0      # borrows that found the pool exhausted
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"size": self._size, "in_use": self.in_use, "idle": len(self._idle),
+                    "max_size": self.max_size, "waits": self.waits}
+
+    def acquire(self) -> PooledConnection:
+        start = time.perf_counter()
+        with self._cond:
+            deadline = time.monotonic() + self.checkout_timeout
+            waited = False
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.incr("db.pool.timeout")
+                    raise PoolTimeout(f"no database connection free within {self.checkout_timeout}s")
+                self._cond.wait(remaining)
+            self.in_use += 1
+            self._publish()
+        metrics.observe("db.pool.wait_ms", (time.perf_counter() - start) * 1000)
+
+        try:
+            if entry is not None:
+                raw, created = self._validate(*entry)
+            else:
+                raw, created = None, None
+            if raw is None:
+                raw, created = self._connect(), time.monotonic()
+                metrics.incr("db.pool.created")
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.in_use -= 1
+                self._publish()
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created)
+
+    def _validate(self, raw, created: float, returned_at: float):
+        """Returns (raw, created) if the idle connection is fit to hand out, else closes it and returns (None, None)."""
+        now = time.monotonic()
+        if now - created > self.max_age:
+            metrics.incr("db.pool.recycled")
+        elif now - returned_at > self.ping_after_idle:
+            try:
+                raw.ping(reconnect=False)
+                return raw, created
+            except Exception:
+                metrics.incr("db.pool.broken")
+        else:
+            return raw, created
+        self._close_quietly(raw)
+        return None, None
+
+    def _release(self, raw, created: float) -> None:
+        keep = bool(getattr(raw, "open", True)) and time.monotonic() - created <= self.max_age
+        if keep and getattr(raw, "server_status", 0) & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                raw.rollback()
+            except Exception:
+                keep = False
+        if not keep:
+            self._close_quietly(raw)
+        with self._cond:
+            self.in_use -= 1
+            if keep:
+                self._idle.append((raw, created, time.monotonic()))
+            else:
+                self._size -= 1
+            self._publish()
+            self._cond.notify()
+
+    def close_all(self) -> None:
+        """Closes the idle connections, e.g. on shutdown. Borrowed ones are unaffected."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._publish()
+        for raw, _, _ in idle:
+            self._close_quietly(raw)
+
+    def _publish(self) -> None:
+        metrics.set_gauge("db.pool.in_use", self.in_use)
+        metrics.set_gauge("db.pool.idle", len(self._idle))
+
+    @staticmethod
+    def _close_quietly(raw) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+def _backend_connect():
+    """The connect function for the configured [database] backend."""
+    if DB_BACKEND == "sqlite":
+        return connect_sqlite
+    if DB_BACKEND != "mysql":
+        log(f"Unknown database backend '{DB_BACKEND}', using mysql")
+    return connect_mysql
+
+
+pool = ConnectionPool(_backend_connect())
+
+
+def get_db_connection() -> PooledConnection:
+    """Borrows a connection from the shared pool; close() returns it."""
+    return pool.acquire()
@@ -0,0 +1,220 @@
+import asyncio
+
+from utils import log
+
+# IRC lines are capped at 512 bytes plus up to 8191 bytes of IRCv3 tags.
+# Anything longer than this without a CRLF is a broken stream, not chat.
+MAX_LINE_BYTES = 16384
+READ_CHUNK = 65536
+
+_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+
+def unescape_tag_value(value: str) -> str:
+    """Undoes IRCv3 message-tag escaping (\\: \\s \\\\ \\r \\n)."""
+    if "\\" not in value:
+        return value
+    out = []
+    i = 0
+    n = len(value)
+    while i < n:
+        c = value[i]
+        if c == "\\":
+            i += 1
+            if i < n:
+                # Unknown escapes drop the backslash, a trailing lone backslash is dropped.
+                out.append(_TAG_ESCAPES.get(value[i], value[i]))
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+class IrcMessage:
+    """One parsed IRC line.
+
+    Tags are kept as the raw string until someone reads them: tag() scans
+    for a single key, and the `tags` dict is only built on first access.
+    """
+    __slots__ = ("command", "prefix", "params", "text", "_raw_tags", "_tags")
+
+    def __init__(self, command: str, prefix: str, params: str, text: str, raw_tags: str):
+        self.command = command
+        self.prefix = prefix
+        self.params = params
+        self.text = text
+        self._raw_tags = raw_tags
+        self._tags = None
+
+    def tag(self, key: str, default: str = "") -> str:
+        """Returns one unescaped tag value without building the whole dict."""
+        if self._tags is not None:
+            return self._tags.get(key, default)
+        raw = self._raw_tags
+        if not raw:
+            return default
+        needle = key + "="
+        if raw.startswith(needle):
+            start = len(needle)
+        else:
+            start = raw.find(";" + needle)
+            if start == -1:
+                return default
+            start += len(needle) + 1
+        end = raw.find(";", start)
+        return unescape_tag_value(raw[start:] if end == -1 else raw[start:end])
+
+    @property
+    def tags(self) -> dict:
+        if self._tags is None:
+            tags = {}
+            if self._raw_tags:
+                for kv in self._raw_tags.split(";"):
+                    key, _, value = kv.partition("=")
+                    tags[key] = unescape_tag_value(value)
+            self._tags = tags
+        return self._tags
+
+    @property
+    def nick(self) -> str:
+        """The sender's login name taken from the prefix (nick!user@host)."""
+        end = self.prefix.find("!")
+        return self.prefix if end == -1 else self.prefix[:end]
+
+    @property
+    def user(self) -> str:
+        """Lowercased display name, falling back to the login name."""
+        return (self.tag("display-name") or self.nick).lower()
+
+    @property
+    def channel(self) -> str:
+        """The first parameter without its '#', for channel-scoped commands."""
+        target = self.params.split(" ", 1)[0]
+        return target[1:] if target.startswith("#") else target
+
+
+def parse_line(line: str) -> IrcMessage:
+    """Splits a raw IRC line into tags, prefix, command, params and trailing text in one pass."""
+    pos = 0
+    raw_tags = ""
+    if line.startswith("@"):
+        pos = line.find(" ")
+        if pos == -1:
+            return IrcMessage("", "", "", "", line[1:])
+        raw_tags = line[1:pos]
+        pos += 1
+    prefix = ""
+    if line.startswith(":", pos):
+        end = line.find(" ", pos)
+        if end == -1:
+            return IrcMessage("", line[pos + 1:], "", "", raw_tags)
+        prefix = line[pos + 1:end]
+        pos = end + 1
+    trail = line.find(" :", pos)
+    if trail == -1:
+        head, text = line[pos:], ""
+    else:
+        head, text = line[pos:trail], line[trail + 2:]
+    command, _, params = head.partition(" ")
+    return IrcMessage(command, prefix, params, text, raw_tags)
+
+
+class LineBuffer:
+    """Reassembles CRLF-terminated IRC lines from arbitrary recv chunks.
+
+    A message that straddles two reads is held back until its terminator
+    arrives, and decoding happens per line so multi-byte UTF-8 characters
+    are never cut in half.
+    """
+    __slots__ = ("_tail",)
+
+    def __init__(self):
+        self._tail: bytes = b""
+
+    def feed(self, data: bytes) -> list[str]:
+        if self._tail:
+            data = self._tail + data
+        parts = data.split(b"\r\n")
+        tail = parts.pop()
+        if len(tail) > MAX_LINE_BYTES:
+            log(f"IRC: discarding {len(tail)} bytes without a line terminator")
+            tail = b""
+        self._tail = tail
+        return [p.decode("utf-8", "replace") for p in parts if p]
+
+    def clear(self) -> None:
+        self._tail = b""
+
+
+class IrcConnection:
+    """A single asyncio stream to an IRC server.
+
+    Reading happens on the event loop that called open(). write_line() may be
+    called from any thread; off-loop writes are handed to the loop.
+    """
+
+    def __init__(self, host: str, port: int, read_timeout: float = 360.0):
+        self.host = host
+        self.port = port
+        self.read_timeout = read_timeout
+        self.loop: asyncio.AbstractEventLoop = None
+        self.reader: asyncio.StreamReader = None
+        self.writer: asyncio.StreamWriter = None
+        self._buffer = LineBuffer()
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def open(self, timeout: float = 10.0) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._buffer.clear()
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout
+        )
+
+    async def lines(self):
+        """Yields decoded lines until EOF. Raises asyncio.TimeoutError when the server goes quiet."""
+        while True:
+            data = await asyncio.wait_for(self.reader.read(READ_CHUNK), self.read_timeout)
+            if not data:
+                return
+            for line in self._buffer.feed(data):
+                yield line
+
+    def write_line(self, line: str) -> bool:
+        """Queues one raw IRC line for sending. Returns False when not connected."""
+        if not self.connected:
+            return False
+        data = (line + "\r\n").encode("utf-8")
+        if self._on_loop():
+            self.writer.write(data)
+        else:
+            self.loop.call_soon_threadsafe(self._write, data)
+        return True
+
+    def _write(self, data: bytes) -> None:
+        if self.connected:
+            self.writer.write(data)
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def close(self) -> None:
+        """Closes the stream; safe to call from any thread and more than once."""
+        if self.writer is None:
+            return
+        if self.loop is not None and not self._on_loop():
+            try:
+                self.loop.call_soon_threadsafe(self.close)
+            except RuntimeError:
+                pass  # loop already closed
+            return
+        writer, self.writer = self.writer, None
+        try:
+            writer.close()
+        except Exception:
+            pass
@@ -0,0 +1,196 @@
+import threading
+import time
+
+import metrics
+from balances import balances
+from config import POINTS_LEADERBOARD_RESEED
+import queries
+
+TRACKED = 50  # balances kept per table; the slack lets the leaders spend without a re-read
+LOOKUP_BATCH = 500
+
+
+class TopK:
+    """The highest balances of one points table, kept current as points change.
+
+    The top `capacity` users are held with their exact balances. Every other
+    user is known only by an upper bound: the lowest tracked balance when
+    the table was read (`floor`), plus whatever they earned since. The top
+    k can be answered from memory while the k-th tracked balance is at
+    least every such bound (`ceiling`). Users whose bound passes the lowest
+    tracked balance are `pending` a lookup, and if that is not enough the
+    table is read again.
+
+    When the read returned fewer than `capacity` rows the whole table is
+    tracked, and a user not seen yet is new with the points just earned.
+    Callers hold `lock`.
+    """
+
+    def __init__(self, rows: list, capacity: int = TRACKED):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.tracked: dict = {row["username"]: row["points"] for row in rows}
+        self.complete = len(self.tracked) < capacity
+        self.floor = 0 if self.complete else min(self.tracked.values())
+        self.ceiling = self.floor  # highest bound of any untracked user
+        self.bounds: dict = {}     # untracked user -> upper bound on their balance
+        self.pending: set = set()  # untracked users whose bound passed the cutoff
+        self.stale = False
+        self.seeded_at = time.monotonic()
+        self._ranked: list = None
+
+    def _cutoff(self):
+        return None if len(self.tracked) < self.capacity else min(self.tracked.values())
+
+    def observe(self, user: str, points: int) -> None:
+        """Records a user's exact balance."""
+        self.pending.discard(user)
+        cutoff = self._cutoff()
+        if user in self.tracked or cutoff is None or points > cutoff:
+            self.tracked[user] = points
+            self.bounds.pop(user, None)
+            self._trim()
+            self._ranked = None
+        else:
+            self.bounds[user] = points
+
+    def adjust(self, user: str, delta: int) -> None:
+        """Records a change to a balance whose new value is not known."""
+        if user in self.tracked:
+            self.tracked[user] += delta
+            self._ranked = None
+        elif self.complete and len(self.tracked) < self.capacity:
+            self.tracked[user] = delta  # not in the table when it was read
+            self._ranked = None
+        elif delta > 0:
+            bound = self.bounds.get(user, self.floor) + delta
+            self.bounds[user] = bound
+            self.ceiling = max(self.ceiling, bound)
+            if bound > self._cutoff():
+                self.pending.add(user)
+
+    def _trim(self) -> None:
+        while len(self.tracked) > self.capacity:
+            user = min(self.tracked, key=self.tracked.get)
+            points = self.tracked.pop(user)
+            self.bounds[user] = points
+            self.ceiling = max(self.ceiling, points)
+
+    def settle_bounds(self) -> None:
+        """Recomputes `ceiling` after lookups have tightened bounds."""
+        self.ceiling = max(self.bounds.values(), default=self.floor)
+        self.ceiling = max(self.ceiling, self.floor)
+
+    def ranking(self) -> list:
+        """Tracked (username, points), best first."""
+        if self._ranked is None:
+            self._ranked = sorted(self.tracked.items(), key=lambda item: (-item[1], item[0]))
+        return self._ranked
+
+    def top(self, k: int):
+        """The k highest (username, points), or None if memory alone cannot tell."""
+        if self.stale or k > self.capacity:
+            return None
+        ranked = self.ranking()
+        if len(ranked) < k:
+            return ranked if self.complete and len(ranked) < self.capacity else None
+        return ranked[:k] if ranked[k - 1][1] >= self.ceiling else None
+
+
+class Leaderboards:
+    """Top balances per points table, served from memory for !leaderboard and the overlay.
+
+    A table is read (ORDER BY points DESC) the first time it is asked for,
+    again every `reseed_interval` seconds, and whenever its TopK cannot
+    answer from memory. In between it follows every points write through
+    the balance cache's watchers.
+    """
+
+    def __init__(self, capacity: int = TRACKED, reseed_interval: float = POINTS_LEADERBOARD_RESEED):
+        self.capacity = capacity
+        self.reseed_interval = reseed_interval
+        self._boards: dict = {}  # table -> TopK
+        self._lock = threading.Lock()
+
+    def top(self, table: str, k: int = 5) -> list:
+        """The k highest (username, points) of a table, best first."""
+        board = self._boards.get(table)
+        if board is None or time.monotonic() - board.seeded_at > self.reseed_interval:
+            board = self._seed(table)
+        with board.lock:
+            rows = board.top(k)
+        if rows is None and board.pending:
+            self._look_up(table, board)
+            with board.lock:
+                rows = board.top(k)
+        if rows is None:
+            board = self._seed(table)
+            with board.lock:
+                rows = board.top(k)
+                if rows is None:
+                    rows = board.ranking()[:k]  # as just read, even if writes overlapped
+        metrics.incr("leaderboard.served")
+        return rows
+
+    def _seed(self, table: str) -> TopK:
+        """Reads the table's top balances. Retried while points writes overlap the read."""
+        for _ in range(3):
+            epoch = balances.epoch
+            with queries.session() as q:
+                rows = q.top_points(table, self.capacity)
+            board = TopK(rows, self.capacity)
+            with self._lock:
+                # Checked and installed under the lock watchers take, so no change slips between.
+                if balances.unchanged_since(epoch):
+                    self._boards[table] = board
+                    metrics.incr("leaderboard.seeded")
+                    return board
+        board.stale = True  # serve this read anyway; the next one reads again
+        with self._lock:
+            self._boards[table] = board
+        metrics.incr("leaderboard.seeded")
+        return board
+
+    def _look_up(self, table: str, board: TopK) -> None:
+        """Replaces the bounds of pending users with their balances."""
+        with board.lock:
+            users = sorted(board.pending)
+        for i in range(0, len(users), LOOKUP_BATCH):
+            chunk = users[i:i + LOOKUP_BATCH]
+            epoch = balances.epoch
+            with queries.session() as q:
+                rows = q.points_of_users(table, chunk)
+            with self._lock, board.lock:
+                if not balances.unchanged_since(epoch):
+                    return  # a write overlapped; the bounds stay and the caller re-reads
+                found = {row["username"]: row["points"] for row in rows}
+                for user in chunk:
+                    board.observe(user, found.get(user, 0))  # no row yet: nothing committed
+                board.settle_bounds()
+        metrics.incr("leaderboard.lookups", len(users))
+
+    # ===== Balance Watcher =====
+
+    def observe(self, table: str, user: str, points: int) -> None:
+        with self._lock:
+            board = self._boards.get(table)
+            if board is not None:
+                with board.lock:
+                    board.observe(user, points)
+
+    def adjust(self, table: str, user: str, delta: int) -> None:
+        with self._lock:
+            board = self._boards.get(table)
+            if board is not None:
+                with board.lock:
+                    board.adjust(user, delta)
+
+    def invalidate(self, table: str = None, user: str = None) -> None:
+        with self._lock:
+            for name, board in self._boards.items():
+                if table is None or name == table:
+                    board.stale = True
+
+
+leaderboards = Leaderboards()
+balances.watchers.append(leaderboards)
@@ -0,0 +1,154 @@
+import atexit
+import threading
+
+import metrics
+import queries
+from balances import balances
+from config import POINTS_FLUSH_INTERVAL
+from utils import log
+
+FLUSH_BATCH = 500  # rows per multi-row upsert
+
+
+class PointsLedger:
+    """Write-behind buffer for points earnings.
+
+    Active and passive earnings are added up in memory per (table, user)
+    and written every `flush_interval` seconds as one multi-row upsert per
+    table, instead of an upsert, a commit and a SELECT per earning. Anything
+    that spends points calls settle() first, which writes that one user's
+    pending delta, so balance checks never miss points still in memory.
+    A failed flush puts its deltas back for the next attempt.
+    """
+
+    def __init__(self, flush_interval: float = POINTS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: dict = {}  # (table, user) -> [delta, active]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush or settle in flight at a time
+        self._wake = threading.Event()
+        self._thread: threading.Thread = None
+        self._running = False
+        self._atexit = False
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, table: str, user: str, amount: int, active: bool = False) -> None:
+        """Records an earning (amount >= 0); cheap enough for the chat reader thread."""
+        amount = max(0, amount)
+        key = (table, user)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [amount, active]
+            else:
+                entry[0] += amount
+                entry[1] = entry[1] or active
+        metrics.incr("points.ledger.added")
+
+    def pending(self, table: str, user: str) -> int:
+        """Points earned by user that are not in the database yet."""
+        entry = self._pending.get((table, user))
+        return entry[0] if entry is not None else 0
+
+    def settle(self, table: str, user: str) -> None:
+        """Writes one user's pending delta now, ahead of a spend.
+
+        Also waits out a flush in progress, which may be carrying this user's delta.
+        """
+        with self._flush_lock:
+            with self._lock:
+                entry = self._pending.pop((table, user), None)
+            if entry is None:
+                return
+            metrics.incr("points.ledger.settled")
+            self._write({(table, user): entry})
+
+    def flush(self) -> int:
+        """Writes every pending delta. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            with metrics.timer("points.ledger.flush_ms"):
+                self._write(batch)
+        metrics.incr("points.ledger.rows", len(batch))
+        return len(batch)
+
+    def _write(self, batch: dict) -> None:
+        """Upserts (table, user) -> [delta, active] rows; on failure re-queues them and re-raises.
+
+        Called with _flush_lock held.
+        """
+        by_kind: dict = {}  # (table, active) -> [(user, delta)]
+        for (table, user), (delta, active) in batch.items():
+            if delta or active:
+                by_kind.setdefault((table, active), []).append((user, delta))
+        with balances.writing():
+            try:
+                with queries.session() as q:
+                    try:
+                        for (table, active), rows in by_kind.items():
+                            for i in range(0, len(rows), FLUSH_BATCH):
+                                q.upsert_earnings(table, active, rows[i:i + FLUSH_BATCH])
+                        q.commit()
+                    except Exception:
+                        q.rollback()
+                        raise
+            except Exception:
+                self._requeue(batch)
+                raise
+            for (table, user), (delta, _) in batch.items():
+                if delta:
+                    balances.apply(table, user, delta)
+
+    def _requeue(self, batch: dict) -> None:
+        with self._lock:
+            for key, (delta, active) in batch.items():
+                entry = self._pending.get(key)
+                if entry is None:
+                    self._pending[key] = [delta, active]
+                else:
+                    entry[0] += delta
+                    entry[1] = entry[1] or active
+        metrics.incr("points.ledger.requeued", len(batch))
+
+    # ===== Flusher Thread =====
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._wake.clear()
+        if not self._atexit:
+            atexit.register(self.stop)
+            self._atexit = True
+        self._thread = threading.Thread(target=self._run, name="points-ledger", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stops the flusher and writes whatever is still pending."""
+        if self._running:
+            self._running = False
+            self._wake.set()
+            if self._thread is not None and self._thread is not threading.current_thread():
+                self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            log(f"Points Ledger: final flush failed, {len(self._pending)} balances not saved: {e}")
+
+    def _run(self) -> None:
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            if not self._running:
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                log(f"Points Ledger: flush failed, will retry: {e}")
+
+
+ledger = PointsLedger()
@@ -0,0 +1,160 @@
+import time
+
+from db import get_db_connection
+from sqlite_db import SqliteCursor
+from utils import log
+
+SCHEMA_TABLE = "radiobot_schema"
+
+
+def _has_index(c, table: str, columns: tuple) -> bool:
+    """True if some index on table starts with these columns, whatever it is called."""
+    indexes: dict = {}
+    if isinstance(c, SqliteCursor):
+        c.execute(f"PRAGMA index_list({table})")
+        for name in [row["name"] for row in c.fetchall()]:
+            c.execute(f"PRAGMA index_info({name})")
+            indexes[name] = [row["name"].lower() for row in sorted(c.fetchall(), key=lambda r: r["seqno"])]
+    else:
+        c.execute(
+            "SELECT INDEX_NAME, COLUMN_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+            (table,),
+        )
+        for row in c.fetchall():
+            indexes.setdefault(row["INDEX_NAME"], []).append(row["COLUMN_NAME"].lower())
+    wanted = [col.lower() for col in columns]
+    return any(cols[:len(wanted)] == wanted for cols in indexes.values())
+
+
+def _add_index(c, table: str, name: str, columns: tuple) -> None:
+    if _has_index(c, table, columns):
+        log(f"Migration: {table} already has an index on ({', '.join(columns)})")
+        return
+    if isinstance(c, SqliteCursor):
+        name = f"{table}_{name}"  # SQLite index names are unique per database, not per table
+    c.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+
+# ===== Migrations =====
+# Steps must be safe to run again: MySQL commits DDL as it goes, so a step
+# that fails halfway is retried from the top on the next start.
+
+def _create_points_table(c, table: str) -> None:
+    c.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+      username VARCHAR(100) NOT NULL,
+      points INT NOT NULL DEFAULT 0,
+      last_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+      last_active DATETIME DEFAULT NULL,
+      PRIMARY KEY (username)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+    """)
+
+
+def _index_points_table(c, table: str) -> None:
+    _add_index(c, table, "idx_points", ("points",))
+    _add_index(c, table, "idx_last_active", ("last_active",))
+
+
+def _index_radiodj_tables(c, _scope: str) -> None:
+    _add_index(c, "requests", "idx_played_id", ("played", "ID"))
+    _add_index(c, "history", "idx_date_played", ("date_played",))
+    _add_index(c, "songs", "idx_date_modified", ("date_modified", "ID"))
+
+
+# (version, kind, description, step). "points" migrations run once for every
+# channel's points table, each with its own version; "radiodj" ones run once
+# against RadioDJ's tables. Append only: never renumber or edit a shipped one.
+MIGRATIONS = [
+    (1, "points", "create points table", _create_points_table),
+    (2, "points", "index points and last_active", _index_points_table),
+    (1, "radiodj", "index requests(played, ID), history(date_played), songs(date_modified, ID)",
+     _index_radiodj_tables),
+]
+
+# The bot's hot queries, with {points} standing for a points table.
+HOT_QUERIES = [
+    ("leaderboard", "SELECT username, points FROM {points} ORDER BY points DESC LIMIT 50"),
+    ("request queue", "SELECT s.artist, s.title FROM requests r JOIN songs s ON r.songID = s.ID "
+                      "WHERE r.played = 0 ORDER BY r.ID ASC LIMIT 3"),
+    ("recently played", "SELECT artist, title FROM history ORDER BY date_played DESC LIMIT 5"),
+    ("catalog edits", "SELECT ID FROM songs WHERE date_modified > '2000-01-01' "
+                      "ORDER BY date_modified, ID LIMIT 1000"),
+]
+
+
+def explain(c, points_table: str = "community_points") -> list:
+    """One line per hot query and table: the index MySQL picks and the rows it expects to read."""
+    lines = []
+    sqlite = isinstance(c, SqliteCursor)
+    for name, sql in HOT_QUERIES:
+        try:
+            c.execute(("EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN ") + sql.format(points=points_table))
+            plan = c.fetchall()
+        except Exception as e:
+            lines.append(f"{name}: cannot explain ({e})")
+            continue
+        for row in plan:
+            if sqlite:
+                lines.append(f"{name}: {row['detail']}")
+                continue
+            lines.append(f"{name}: {row.get('table')} type={row.get('type')} key={row.get('key')} "
+                         f"rows={row.get('rows')} {row.get('Extra') or ''}".rstrip())
+    return lines
+
+
+def migrate(points_tables=("community_points",)) -> int:
+    """Brings RadioDJ's tables and each points table up to the latest schema version.
+
+    Logs the plans of the hot queries before and after when anything ran.
+    Returns the number of migrations applied; raises if one fails, leaving
+    the ones before it recorded.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as c:
+            c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} (
+              scope VARCHAR(100) NOT NULL,
+              version INT NOT NULL,
+              description VARCHAR(255) NOT NULL DEFAULT '',
+              applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+              PRIMARY KEY (scope, version)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """)
+            c.execute(f"SELECT scope, MAX(version) AS version FROM {SCHEMA_TABLE} GROUP BY scope")
+            current = {row["scope"]: row["version"] for row in c.fetchall()}
+            conn.commit()
+
+            todo = []
+            for scope, kind in [("radiodj", "radiodj")] + [(table, "points") for table in points_tables]:
+                for version, migration_kind, description, step in MIGRATIONS:
+                    if migration_kind == kind and version > current.get(scope, 0):
+                        todo.append((scope, version, description, step))
+            if not todo:
+                return 0
+
+            primary = points_tables[0] if points_tables else "community_points"
+            before = explain(c, primary)
+            for scope, version, description, step in todo:
+                log(f"Migration: {scope} v{version}: {description}")
+                start = time.perf_counter()
+                try:
+                    step(c, scope)
+                    c.execute(f"INSERT INTO {SCHEMA_TABLE} (scope, version, description) VALUES (%s, %s, %s)",
+                              (scope, version, description))
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    log(f"Migration: {scope} v{version} failed: {e}")
+                    raise
+                log(f"Migration: {scope} v{version} done in {time.perf_counter() - start:.1f}s")
+            after = explain(c, primary)
+            for title, lines in (("before", before), ("after", after)):
+                log(f"Migration: query plans {title}:")
+                for line in lines:
+                    log(f"  {line}")
+            return len(todo)
+    finally:
+        conn.close()
@@ -0,0 +1,215 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from xml.etree import ElementTree
+
+import metrics
+from config import NOW_PLAYING_FILE, NOW_PLAYING_DEBOUNCE_MS
+from utils import log
+
+POLL_SECONDS = 0.5  # stat() interval where inotify is not available
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; then len bytes of name
+
+
+def parse_now_playing(text: str):
+    """{"artist", "title"} from RadioDJ's export, or None if it is empty or not whole.
+
+    XML is searched for the first <artist> and <title> elements, whatever
+    they are nested in; text is read as "Artist - Title" on its first line.
+    """
+    text = text.strip()
+    if not text:
+        return None
+    if text.startswith("<"):
+        try:
+            root = ElementTree.fromstring(text)
+        except ElementTree.ParseError:
+            return None  # half written
+        fields: dict = {}
+        for element in root.iter():
+            fields.setdefault(element.tag.lower(), (element.text or "").strip())
+        artist, title = fields.get("artist", ""), fields.get("title", "")
+    else:
+        line = text.splitlines()[0].strip()
+        artist, sep, title = line.partition(" - ")
+        if not sep:
+            artist, title = "", line
+    if not (artist or title):
+        return None
+    return {"artist": artist.strip(), "title": title.strip()}
+
+
+def _stat(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _read(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")  # RadioDJ on a non-UTF-8 Windows locale
+
+
+class _Inotify:
+    """Events for one directory, through libc's inotify calls. Raises OSError where there are none."""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("no inotify in this C library")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"cannot watch {directory}")
+
+    def wait(self, timeout: float):
+        """Names changed in the directory within timeout seconds; None for "maybe all" (queue overflow)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class NowPlayingFile:
+    """Follows RadioDJ's now-playing export and reports each new track once.
+
+    On Linux the file's directory is watched with inotify, so a file that
+    is replaced by a rename is followed too; elsewhere, or when inotify is
+    unavailable, the file is stat()ed every POLL_SECONDS. A change is read
+    only once the file has been quiet for `debounce` seconds and did not
+    change while being read, so an exporter writing in chunks is read
+    whole. on_change({"artist", "title"}) is called on the watcher thread
+    whenever the track differs from the last one, starting with the first.
+    """
+
+    def __init__(self, path: str = NOW_PLAYING_FILE, on_change=None,
+                 debounce: float = NOW_PLAYING_DEBOUNCE_MS / 1000, inotify: bool = True):
+        self.path = os.path.abspath(path) if path else ""
+        self.on_change = on_change
+        self.debounce = max(0.0, debounce)
+        self.use_inotify = inotify
+        self.backend: str = None  # "inotify" or "polling" once running
+        self.track: dict = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._running = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def start(self) -> None:
+        if self._running or not self.enabled:
+            return
+        self._running = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="now-playing-file", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        directory, name = os.path.split(self.path)
+        watcher = None
+        if self.use_inotify:
+            try:
+                watcher = _Inotify(directory)
+            except (OSError, AttributeError) as e:
+                log(f"Now playing file: inotify unavailable ({e}), checking the file every {POLL_SECONDS}s")
+        self.backend = "inotify" if watcher is not None else "polling"
+        log(f"Now playing file: following {self.path} ({self.backend})")
+        try:
+            dirty_at = time.monotonic() - self.debounce  # read what is there now
+            last_stat = _stat(self.path)
+            while self._running:
+                quiet = None if dirty_at is None else time.monotonic() - dirty_at
+                if quiet is not None and quiet >= self.debounce:
+                    dirty_at = None if self._check() else time.monotonic()
+                    continue
+                if watcher is not None:
+                    names = watcher.wait(1.0 if quiet is None else self.debounce - quiet)
+                    changed = names is None or name in names
+                else:
+                    self._stop.wait(POLL_SECONDS)
+                    st = _stat(self.path)
+                    changed, last_stat = st != last_stat, st
+                if changed:
+                    dirty_at = time.monotonic()
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def _check(self) -> bool:
+        """Reads the file if it holds still; False if it changed meanwhile."""
+        before = _stat(self.path)
+        if before is None:
+            return True  # gone; wait for it to come back
+        try:
+            text = _read(self.path)
+        except OSError:
+            return False
+        if _stat(self.path) != before:
+            return False
+        metrics.incr("nowplaying.file_reads")
+        track = parse_now_playing(text)
+        if track is None:
+            metrics.incr("nowplaying.file_unreadable")
+            return True  # the next write will bring it back
+        if track != self.track:
+            self.track = track
+            metrics.incr("nowplaying.file_changes")
+            if self.on_change is not None:
+                try:
+                    self.on_change(dict(track))
+                except Exception as e:
+                    log(f"Now playing file: change handler failed: {e}")
+        return True
+
+
+now_playing_file = NowPlayingFile()
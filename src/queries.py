@@ -0,0 +1,236 @@
+import re
+import time
+from contextlib import contextmanager
+
+import metrics
+from config import DB_SLOW_QUERY_MS
+from db import get_db_connection
+from utils import log
+
+_WHITESPACE = re.compile(r"\s+")
+_SONG_COLUMNS = "ID, artist, title, enabled, date_modified"
+
+
+class Session:
+    """A pooled connection and one cursor, reused by every query run through it.
+
+    Every query has a name. Its latency, fetch included, goes to the
+    db.query.<name>.ms histogram and the rows it returned or changed to the
+    db.query.<name>.rows counter; one slower than slow_query_ms is logged
+    with its SQL. The bot's SQL lives in the named methods below, so this
+    file is the one place to look for what the bot asks of the database.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.cursor()
+
+    # ===== Timing =====
+
+    def _timed(self, name: str, sql: str, params, fetch):
+        start = time.perf_counter()
+        self.cursor.execute(sql, params)
+        result = fetch()
+        elapsed = (time.perf_counter() - start) * 1000
+        if isinstance(result, list):
+            rows = len(result)
+        elif fetch == self.cursor.fetchone:
+            rows = 0 if result is None else 1
+        else:
+            rows = self.cursor.rowcount
+        metrics.observe(f"db.query.{name}.ms", elapsed)
+        if rows > 0:
+            metrics.incr(f"db.query.{name}.rows", rows)
+        if elapsed >= DB_SLOW_QUERY_MS:
+            metrics.incr("db.slow_queries")
+            log(f"Slow query {name}: {elapsed:.0f} ms, {max(rows, 0)} rows: {_WHITESPACE.sub(' ', sql).strip()[:300]}")
+        return result
+
+    def execute(self, name: str, sql: str, params=()) -> int:
+        """Runs a statement; returns the affected row count."""
+        return self._timed(name, sql, params, lambda: self.cursor.rowcount)
+
+    def all(self, name: str, sql: str, params=()) -> list:
+        return self._timed(name, sql, params, self.cursor.fetchall)
+
+    def one(self, name: str, sql: str, params=()):
+        return self._timed(name, sql, params, self.cursor.fetchone)
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def rollback(self) -> None:
+        self.conn.rollback()
+
+    def close(self) -> None:
+        try:
+            self.cursor.close()
+        finally:
+            self.conn.close()
+
+    # ===== Points =====
+
+    def points_of(self, table: str, user: str) -> int:
+        row = self.one("points.get", f"SELECT points FROM {table} WHERE username = %s", (user,))
+        return row["points"] if row else 0
+
+    def points_of_users(self, table: str, users: list) -> list:
+        return self.all("points.get_many",
+                        f"SELECT username, points FROM {table} "
+                        f"WHERE username IN ({', '.join(['%s'] * len(users))})", users)
+
+    def top_points(self, table: str, limit: int) -> list:
+        return self.all("points.top", f"SELECT username, points FROM {table} ORDER BY points DESC LIMIT %s",
+                        (limit,))
+
+    def add_points(self, table: str, user: str, amount: int, active: bool = False) -> None:
+        """Adds amount (may be negative) to a user's points, creating the row at max(0, amount)."""
+        # Also updates last_seen and last_active timestamps
+        active_update_sql = ", last_active = NOW()" if active else ""
+        self.execute("points.add", f"""
+            INSERT INTO {table} (username, points, last_seen{", last_active" if active else ""})
+            VALUES (%s, %s, NOW(){", NOW()" if active else ""})
+            ON DUPLICATE KEY UPDATE points = points + %s, last_seen = NOW(){active_update_sql};
+        """, (user, max(0, amount), amount))
+
+    def credit_points(self, table: str, user: str, amount: int) -> None:
+        self.execute("points.credit",
+                     f"INSERT INTO {table} (username, points, last_seen) VALUES (%s, %s, NOW()) "
+                     "ON DUPLICATE KEY UPDATE points = points + %s", (user, amount, amount))
+
+    def change_points_if_covered(self, table: str, user: str, delta: int, required: int):
+        """Adds delta to user's points only if they hold at least `required`, in one statement.
+
+        The check and the change happen in the same row update, so parallel
+        spends cannot overdraw, and LAST_INSERT_ID(expr) brings the new
+        balance back with the OK packet instead of a SELECT. Returns the new
+        balance, or None when the user is short.
+        """
+        changed = self.execute(
+            "points.change_if_covered",
+            f"UPDATE {table} SET points = LAST_INSERT_ID(points + %s) WHERE username = %s AND points >= %s",
+            (delta, user, required),
+        )
+        return self.cursor.lastrowid if changed else None
+
+    def upsert_earnings(self, table: str, active: bool, rows: list) -> None:
+        """Adds [(user, delta)] to the table in one multi-row upsert."""
+        row = "(%s, %s, NOW(), NOW())" if active else "(%s, %s, NOW())"
+        cols = "username, points, last_seen, last_active" if active else "username, points, last_seen"
+        extra = ", last_active = NOW()" if active else ""
+        self.execute(
+            "points.upsert_earnings",
+            f"INSERT INTO {table} ({cols}) VALUES {', '.join([row] * len(rows))} "
+            f"ON DUPLICATE KEY UPDATE points = points + VALUES(points), last_seen = NOW(){extra}",
+            [v for user_delta in rows for v in user_delta],
+        )
+
+    # ===== Songs =====
+
+    def search_songs(self, query: str, limit: int) -> list:
+        """Enabled songs whose artist or title contains query; a full table scan."""
+        return self.all("songs.search_like",
+                        "SELECT ID, artist, title FROM songs WHERE (artist LIKE %s OR title LIKE %s) AND enabled=1 "
+                        "ORDER BY artist, title LIMIT %s", (f"%{query}%", f"%{query}%", limit))
+
+    def enabled_songs(self) -> list:
+        return self.all("songs.enabled", "SELECT ID, artist, title FROM songs WHERE enabled=1")
+
+    def song_marks(self):
+        return self.one("songs.marks", "SELECT MAX(ID) AS max_id, MAX(date_modified) AS modified FROM songs")
+
+    def songs_after_id(self, last_id: int, limit: int) -> list:
+        return self.all("songs.after_id",
+                        f"SELECT {_SONG_COLUMNS} FROM songs WHERE ID > %s ORDER BY ID LIMIT %s",
+                        (last_id, limit))
+
+    def songs_modified_after(self, modified, after_id: int, settle_seconds: int, limit: int) -> list:
+        """Songs past (modified, after_id) in (date_modified, ID) order, leaving the last few seconds."""
+        return self.all(
+            "songs.modified_after",
+            f"SELECT {_SONG_COLUMNS} FROM songs "
+            "WHERE (date_modified > %s OR (date_modified = %s AND ID > %s)) "
+            "AND date_modified < NOW() - INTERVAL %s SECOND "
+            "ORDER BY date_modified, ID LIMIT %s",
+            (modified, modified, after_id, settle_seconds, limit),
+        )
+
+    def enabled_song_ids_between(self, low: int, high: int) -> set:
+        rows = self.all("songs.enabled_ids",
+                        "SELECT ID FROM songs WHERE ID BETWEEN %s AND %s AND enabled = 1", (low, high))
+        return {r["ID"] for r in rows}
+
+    def songs_by_id(self, ids: list) -> list:
+        return self.all("songs.by_id",
+                        f"SELECT {_SONG_COLUMNS} FROM songs WHERE ID IN ({', '.join(['%s'] * len(ids))})",
+                        ids)
+
+    # ===== History, Requests, Queue =====
+
+    def recent_history(self, limit: int) -> list:
+        """The last `limit` plays, newest first, with when they started and the song's duration."""
+        return self.all("history.recent",
+                        "SELECT h.ID, h.artist, h.title, h.date_played, s.duration "
+                        "FROM history h LEFT JOIN songs s ON s.ID = h.trackID "
+                        "ORDER BY h.date_played DESC LIMIT %s", (limit,))
+
+    def station_probe(self):
+        """The server's clock and markers that move whenever history, requests or the queue change.
+
+        Primary-key maxima and counts over small or indexed sets: no rows
+        are read, so it is cheap enough to run every second.
+        """
+        return self.one("station.probe",
+                        "SELECT NOW() AS db_now, "
+                        "(SELECT MAX(ID) FROM history) AS history_id, "
+                        "(SELECT MAX(ID) FROM requests) AS request_id, "
+                        "(SELECT COUNT(*) FROM requests WHERE played = 0 OR played IS NULL) AS pending, "
+                        "(SELECT MAX(ID) FROM queuelist) AS queue_id, "
+                        "(SELECT COUNT(*) FROM queuelist) AS queued")
+
+    def pending_requests(self, limit: int) -> list:
+        """The oldest unplayed requests, next to play first."""
+        return self.all("requests.pending",
+                        "SELECT s.artist, s.title FROM requests r JOIN songs s ON r.songID = s.ID "
+                        "WHERE r.played = 0 ORDER BY r.ID ASC LIMIT %s", (limit,))
+
+    def latest_requests(self, limit: int) -> list:
+        """The newest unplayed requests with who asked, for the overlay.
+
+        `requested` has one-second resolution; the ID puts requests made in
+        the same second in the order they came in.
+        """
+        return self.all("requests.latest",
+                        "SELECT username,artist,title "
+                        "FROM requests r JOIN songs s ON s.ID=r.songID "
+                        "WHERE played=0 OR played IS NULL "
+                        "ORDER BY requested DESC, r.ID DESC LIMIT %s", (limit,))
+
+    def add_request(self, song_id: int, user: str) -> None:
+        self.execute("requests.add",
+                     "INSERT INTO requests (songID,username,userIP,message,requested) "
+                     "VALUES (%s,%s,%s,%s,NOW())", (song_id, user, f"twitch/{user}", ""))
+
+    def next_in_queue(self):
+        return self.one("queue.next",
+                        "SELECT s.artist,s.title FROM queuelist q "
+                        "JOIN songs s ON s.ID=q.songID ORDER BY q.ID ASC LIMIT 1")
+
+    def queue_next(self, song_id: int) -> None:
+        """Injects a song into RadioDJ's playlist queue. 'S' is for Song type."""
+        self.execute("queue.add", "INSERT INTO queuelist (trackID, track_type) VALUES (%s, 'S')", (song_id,))
+
+
+@contextmanager
+def session():
+    """Borrows a connection for a few named queries; commit through the session."""
+    conn = get_db_connection()
+    try:
+        q = Session(conn)
+    except Exception:
+        conn.close()
+        raise
+    try:
+        yield q
+    finally:
+        q.close()
@@ -4,7 +4,7 @@ import sys
 import time
 import threading
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 import pytz
 
@@ -16,10 +16,11 @@ from config import (
     CONFIG_PATH, ENCODERS, HTTP_HOST, HTTP_PORT, save_config_from_gui, config
 )
 from utils import log, log_queue, TkLogHandler # noqa
-from web_overlay import format_eta, shared_state as overlay_shared_state
+from web_overlay import format_eta, show_popup, shared_state as overlay_shared_state
 from blaze_it import fire_420
 from shoutcast_encoder import get_ffmpeg_dshow_devices
 import services
+import db
 from functools import partial
 # ======================================================
 # GLOBALS / LOGGING
@@ -100,9 +101,7 @@ def restart_420() -> None:
 
 def test_420() -> None:
     msg = fire_420(services.bot_instance, test=True)
-    overlay_shared_state["last_420_message"] = msg
-    overlay_shared_state["popup_message"] = msg
-    overlay_shared_state["popup_expire_utc"] = datetime.now(pytz.utc) + timedelta(seconds=12)
+    show_popup(msg)
 # Bleep game functionality removed
 
 def handle_save_config(entries: dict) -> None:
@@ -264,6 +263,7 @@ def build_gui() -> tk.Tk:
             stop_twitch()
             for i in range(len(ENCODERS)):
                 stop_encoder(i)
+            db.pool.close_all()
             log("All services stopped. Exiting.")
             root.after(100, root.destroy) # Safely destroy the root window from the main thread
         threading.Thread(target=shutdown_thread, daemon=True).start()
@@ -0,0 +1,318 @@
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+import metrics
+import queries
+from utils import log
+
+# Folds the letters NFKD leaves alone, so "Røyksopp" and "Æther" match plain ASCII.
+_FOLD = str.maketrans({"ø": "o", "æ": "ae", "œ": "oe", "ß": "ss", "đ": "d", "ł": "l", "þ": "th", "ı": "i"})
+
+EXACT, PREFIX, FUZZY = 3, 2, 1  # score a query word earns per kind of match
+MAX_PREFIX_TERMS = 16           # expansions of a partially typed word
+MAX_FUZZY_TERMS = 3             # spelling corrections tried per word
+MIN_SIMILARITY = 0.5            # Dice coefficient over trigrams
+SCAN_LIMIT = 20000              # candidate documents looked at before settling
+FIRST_CHUNK, MAX_CHUNK = 64, 4096  # driver documents intersected at a time, doubling
+SPAN_FACTOR = 8                 # postings sliced per candidate before looking each one up
+
+
+_ASCII_PUNCT = str.maketrans({c: " " for c in map(chr, range(128)) if not c.isalnum()})
+
+
+def normalize(text: str) -> str:
+    """Lowercases, strips accents and turns punctuation into spaces."""
+    text = text.lower()
+    if text.isascii():
+        return text.translate(_ASCII_PUNCT)
+    text = unicodedata.normalize("NFKD", text.translate(_FOLD))
+    return "".join(c if c.isalnum() else " " for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list:
+    return normalize(text).split()
+
+
+def trigrams(term: str) -> set:
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _score_in(group: list, doc: int) -> int:
+    """Score of the first posting list in group holding doc, 0 if none does."""
+    for plist, score in group:
+        i = bisect_left(plist, doc)
+        if i != len(plist) and plist[i] == doc:
+            return score
+    return 0
+
+
+class SongIndex:
+    """Inverted index over the enabled RadioDJ catalog for !search.
+
+    Each word of "artist title" maps to the sorted documents containing it.
+    Documents are numbered in a fixed rank order (fewer words first, then
+    artist and title), so every posting list is already sorted best-first
+    and a search can stop as soon as it has enough perfect matches. A query
+    word matches a catalog word exactly, by prefix (the word still being
+    typed) or, when it matches nothing, through a trigram index over the
+    vocabulary that finds close spellings. Results must match every query
+    word that matches anything; words that match nothing are dropped, as
+    long as they are not most of the query.
+
+    Songs can be added, changed and removed in place (see upsert() and
+    remove()): changed and new songs are appended after the build's
+    documents, which keeps posting lists sorted but ranks them after every
+    song of the build, and removed ones are skipped at query time. `churn`
+    says how much of the index is such overlay, so the owner knows when to
+    rebuild.
+    """
+
+    def __init__(self, rows):
+        """rows: iterable of (song ID, artist, title)."""
+        docs = []
+        for song_id, artist, title in rows:
+            artist, title = artist or "", title or ""
+            count = len(tokenize(f"{artist} {title}"))
+            if count:
+                docs.append((count, artist.lower(), title.lower(), song_id, artist, title))
+        docs.sort()
+
+        self.song_ids = array("i")
+        self.artists: list = []
+        self.titles: list = []
+        postings: dict = {}
+        for doc, (_, _, _, song_id, artist, title) in enumerate(docs):
+            self.song_ids.append(song_id)
+            self.artists.append(artist)
+            self.titles.append(title)
+            for word in set(tokenize(f"{artist} {title}")):
+                plist = postings.get(word)
+                if plist is None:
+                    postings[word] = array("i", (doc,))
+                else:
+                    plist.append(doc)
+        del docs
+        # Shared artist strings: one object per artist instead of one per song.
+        interned = {}
+        self.artists = [interned.setdefault(a, a) for a in self.artists]
+
+        self.postings: dict = postings
+        self.vocabulary: list = sorted(self.postings)
+        self._by_trigram: dict = {}
+        for term in self.vocabulary:
+            for gram in trigrams(term):
+                self._by_trigram.setdefault(gram, []).append(term)
+
+        # Song ID -> document, as two parallel arrays sorted by song ID.
+        order = sorted(range(len(self.song_ids)), key=self.song_ids.__getitem__)
+        self._ids_sorted = array("i", (self.song_ids[d] for d in order))
+        self._docs_by_id = array("i", order)
+        del order
+        self._base = len(self.song_ids)
+        self._added: dict = {}      # song ID -> document appended since the build
+        self._removed: set = set()  # documents of songs changed or removed since the build
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.song_ids) - len(self._removed)
+
+    @property
+    def churn(self) -> int:
+        """Documents appended or dropped since the build."""
+        return len(self.song_ids) - self._base + len(self._removed)
+
+    def display(self, doc: int) -> str:
+        return f"{self.artists[doc]} - {self.titles[doc]}"
+
+    # ===== Query =====
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """Returns up to `limit` (song ID, "artist - title") pairs, best first."""
+        words = tokenize(query)
+        with self._lock:
+            groups = []
+            for i, word in enumerate(words):
+                group = self._expand(word, last=i == len(words) - 1)
+                if group:
+                    groups.append(group)
+            if not groups or len(groups) < len(words) / 2:
+                return []  # most of the query matched nothing in the catalog
+            return [(self.song_ids[d], self.display(d)) for d in self._rank(groups, limit)]
+
+    def _expand(self, word: str, last: bool) -> list:
+        """Catalog words a query word can stand for, as [(posting list, score)], best first."""
+        out = []
+        exact = self.postings.get(word)
+        if exact is not None:
+            out.append((exact, EXACT))
+        if last or exact is None:
+            vocab = self.vocabulary
+            i = bisect_left(vocab, word)
+            while i < len(vocab) and len(out) < MAX_PREFIX_TERMS and vocab[i].startswith(word):
+                if vocab[i] != word:
+                    out.append((self.postings[vocab[i]], PREFIX))
+                i += 1
+        if not out and len(word) >= 3:
+            for term in self._similar(word):
+                out.append((self.postings[term], FUZZY))
+        return out
+
+    def _similar(self, word: str) -> list:
+        grams = trigrams(word)
+        counts: dict = {}
+        for gram in grams:
+            for term in self._by_trigram.get(gram, ()):
+                counts[term] = counts.get(term, 0) + 1
+        scored = []
+        for term, common in counts.items():
+            if abs(len(term) - len(word)) > 2:
+                continue
+            similarity = 2 * common / (len(grams) + len(term))  # a word of n letters has n trigrams
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, term))
+        scored.sort()
+        return [term for _, term in scored[:MAX_FUZZY_TERMS]]
+
+    def _rank(self, groups: list, limit: int) -> list:
+        """Documents matching every group, by total score then rank order."""
+        # Drive from the group with the fewest postings, a chunk at a time: the
+        # chunk is intersected with the same stretch of every other group,
+        # smallest first, as sets, and only the documents left are scored.
+        groups.sort(key=lambda g: sum(len(p) for p, _ in g))
+        driver, others = groups[0], groups[1:]
+        best_possible = sum(g[0][1] for g in groups)
+        found = []  # (-score, doc)
+        perfect = 0
+        scanned = 0
+        seen = set() if len(driver) > 1 else None
+        removed = self._removed
+        for plist, score in driver:
+            start, size = 0, FIRST_CHUNK
+            while start < len(plist) and perfect < limit and scanned < SCAN_LIMIT:
+                chunk = plist[start:start + min(size, SCAN_LIMIT - scanned)]
+                start += len(chunk)
+                scanned += len(chunk)
+                size = min(size * 2, MAX_CHUNK)
+                candidates = set(chunk)
+                low, high = chunk[0], chunk[-1]
+                for group in others:
+                    spans = [(other, bisect_left(other, low), bisect_right(other, high)) for other, _ in group]
+                    if sum(j - i for _, i, j in spans) <= SPAN_FACTOR * len(candidates):
+                        present = set()
+                        for other, i, j in spans:
+                            present.update(other[i:j])
+                        candidates &= present
+                    else:
+                        # a sparse chunk spans most of a long list: look the few up instead
+                        candidates = {doc for doc in candidates if _score_in(group, doc)}
+                    if not candidates:
+                        break
+                if removed:
+                    candidates -= removed
+                if seen is not None:
+                    candidates -= seen
+                    seen.update(candidates)
+                for doc in sorted(candidates):
+                    total = score + sum(_score_in(group, doc) for group in others)
+                    found.append((-total, doc))
+                    if total == best_possible:
+                        perfect += 1
+                        if perfect >= limit:
+                            break
+            if perfect >= limit or scanned >= SCAN_LIMIT:
+                break
+        found.sort()
+        return [doc for _, doc in found[:limit]]
+
+    # ===== Updates =====
+
+    def _doc_for(self, song_id: int):
+        doc = self._added.get(song_id)
+        if doc is None:
+            i = bisect_left(self._ids_sorted, song_id)
+            if i == len(self._ids_sorted) or self._ids_sorted[i] != song_id:
+                return None
+            doc = self._docs_by_id[i]
+        return None if doc in self._removed else doc
+
+    def upsert(self, song_id: int, artist: str, title: str) -> bool:
+        """Adds a song or replaces its artist and title. Returns False if nothing changed."""
+        artist, title = artist or "", title or ""
+        with self._lock:
+            doc = self._doc_for(song_id)
+            if doc is not None:
+                if self.artists[doc] == artist and self.titles[doc] == title:
+                    return False
+                self._removed.add(doc)
+                self._added.pop(song_id, None)
+            words = set(tokenize(f"{artist} {title}"))
+            if not words:
+                return doc is not None
+            doc = len(self.song_ids)  # past every existing document, so postings stay sorted
+            self.song_ids.append(song_id)
+            self.artists.append(artist)
+            self.titles.append(title)
+            for word in words:
+                plist = self.postings.get(word)
+                if plist is None:
+                    self.postings[word] = array("i", (doc,))
+                    insort(self.vocabulary, word)
+                    for gram in trigrams(word):
+                        self._by_trigram.setdefault(gram, []).append(word)
+                else:
+                    plist.append(doc)
+            self._added[song_id] = doc
+            return True
+
+    def remove(self, song_id: int) -> bool:
+        """Drops a song from results. Returns False if it was not in the index."""
+        with self._lock:
+            doc = self._doc_for(song_id)
+            if doc is None:
+                return False
+            self._removed.add(doc)
+            self._added.pop(song_id, None)
+            return True
+
+    def ids_between(self, low: int, high: int) -> set:
+        """Song IDs in the index from low to high inclusive."""
+        with self._lock:
+            ids = self._ids_sorted
+            docs = self._docs_by_id
+            removed = self._removed
+            found = {ids[i] for i in range(bisect_left(ids, low), bisect_right(ids, high))
+                     if docs[i] not in removed}
+            found.update(song_id for song_id in self._added if low <= song_id <= high)
+            return found
+
+
+_lock = threading.Lock()
+current: SongIndex = None  # the live index, swapped whole on reload
+
+
+def load() -> SongIndex:
+    """Builds the index from the enabled songs and makes it the live one."""
+    global current
+    start = time.perf_counter()
+    with queries.session() as q:
+        rows = [(r["ID"], r["artist"], r["title"]) for r in q.enabled_songs()]
+    index = SongIndex(rows)
+    with _lock:
+        current = index
+    elapsed = time.perf_counter() - start
+    metrics.set_gauge("search.index_songs", len(index))
+    log(f"Search index: {len(index)} songs, {len(index.vocabulary)} words, built in {elapsed:.1f}s")
+    return index
+
+
+def search(query: str, limit: int):
+    """Searches the live index; None when it has not been loaded yet."""
+    index = current
+    if index is None:
+        return None
+    with metrics.timer("search.ms"):
+        return index.search(query, limit)
@@ -1,28 +1,34 @@
 import threading
 import time
-import socket
-import re
 import requests
 import random
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz
 
 from werkzeug.serving import make_server
 from tkinter import messagebox, ttk
 
+from chat_network import ChatNetwork
 from twitch_bot import TwitchBot
-from db import ensure_tables_exist
-from web_overlay import app, socketio, shared_state
+from irc import IrcMessage
+from chat_queue import PRIORITY_ANNOUNCE
+from migrations import migrate
+from catalog import catalog
+from station import station
+from now_playing_file import now_playing_file
+from web_overlay import app, socketio, shared_state, set_next_420, show_popup
 from blaze_it import compute_next_420, fire_420
 from shoutcast_encoder import ShoutcastEncoder
 from utils import log
-from config import HTTP_HOST, HTTP_PORT, ENCODERS, TWITCH_CHANNEL, POINTS_PASSIVE_INTERVAL, POINTS_PASSIVE_AMOUNT, POINTS_ACTIVE_AMOUNT, POINTS_ACTIVE_COOLDOWN
+from config import HTTP_HOST, HTTP_PORT, ENCODERS, TWITCH_CHANNEL, TWITCH_CHANNELS, POINTS_PASSIVE_INTERVAL, POINTS_PASSIVE_AMOUNT
 
 # ======================================================
 # GLOBALS / STATE
 # ======================================================
 
-bot_instance: 'TwitchBot' = None
+bot_instance: 'TwitchBot' = None  # primary channel; announcements go here
+bot_instances: dict = {}  # channel -> TwitchBot
+chat_network: 'ChatNetwork' = None
 twitch_thread: threading.Thread = None
 twitch_running: bool = False
 
@@ -37,9 +43,7 @@ tracker_thread: threading.Thread = None
 announcer_thread: threading.Thread = None
 tracker_running: bool = False
 announcer_running: bool = False
-song_tracker_thread: threading.Thread = None
 song_tracker_running: bool = False
-last_announced_song: tuple = None
 mod_tracker_thread: threading.Thread = None
 mod_tracker_running: bool = False
 shouted_mods: set = set()
@@ -56,16 +60,21 @@ encoder_running: list[bool] = [False] * 3
 # ======================================================
 
 def start_twitch() -> None:
-    global bot_instance, twitch_thread, twitch_running
+    global bot_instance, bot_instances, chat_network, twitch_thread, twitch_running
     if twitch_running:
         return
-    # Ensure minimal DB tables exist before the bot starts
+    chat_network = ChatNetwork()
+    bot_instances = {channel: TwitchBot(channel, chat_network) for channel in TWITCH_CHANNELS}
+    bot_instance = bot_instances[TWITCH_CHANNELS[0]]
+    bot_instance.shouted_mods = shouted_mods
+
+    # Create the points tables and indexes, or bring them up to date, before the bot starts
     try:
-        ensure_tables_exist()
+        migrate([bot.points_table for bot in bot_instances.values()])
     except Exception as e:
-        log(f"Warning: could not ensure DB tables exist: {e}")
+        log(f"Warning: could not migrate the database schema: {e}")
+    catalog.start()  # loads the !search index in the background, then follows RadioDJ's edits
 
-    bot_instance = TwitchBot()
     twitch_thread = threading.Thread(target=run_twitch_loop, daemon=True)
     twitch_running = True
     twitch_thread.start()
@@ -76,115 +85,38 @@ def start_twitch() -> None:
     log("Twitch: started")
 
 def stop_twitch() -> None:
-    global bot_instance, twitch_thread, twitch_running
+    global chat_network, twitch_thread, twitch_running
     if not twitch_running:
         return
-    if bot_instance:
-        bot_instance.stop()
-        # The stop() method sets bot_instance.running to False, which will cause the loop to exit.
+    if chat_network:
+        chat_network.stop()
+        # The stop() method sets chat_network.running to False, which will cause the loop to exit.
     twitch_running = False
     if twitch_thread:
         twitch_thread.join(timeout=5)
     stop_points_manager()
     stop_song_tracker()
+    catalog.stop()
     # stop_mod_tracker() intentionally not called (mod tracker not started)
     log("Twitch: stopped")
 
 def run_twitch_loop():
-    global bot_instance
-    bot_instance.connect()
-
-    # Command mapping
-    commands = {
-        "!search": bot_instance.search,
-        "!points": bot_instance.points,
-        "!uptime": bot_instance.uptime,
-        "!lastplayed": bot_instance.lastplayed,
-        "!playing": bot_instance.playing,
-        "!queue": bot_instance.queue,
-        "!gamble": bot_instance.gamble,
-        "!addpoints": bot_instance.addpoints,
-        "!leaderboard": bot_instance.leaderboard,
-        "!give": bot_instance.give_points,
-    }
-
-    while bot_instance.running:
-        try:
-            data = bot_instance.sock.recv(2048).decode("utf8", "ignore")
-            if not data:
-                if not bot_instance.running: break
-                time.sleep(1)
-                continue
-
-            for line in data.split("\r\n"):
-                if not line: continue
-                if "PING" in line:
-                    try:
-                        bot_instance.sock.sendall(b"PONG\r\n")
-                    except Exception: pass
-                if "PRIVMSG" in line:
-                    user, msg, tags = bot_instance.parse(line)
-                    if not user and "Login authentication failed" in msg:
-                        log("Twitch Error: Login authentication failed. Please check your oauth token in config.ini.")
-                        messagebox.showerror("Twitch Auth Error", "Login failed. Please check your 'oauth' token in the config and restart the bot.")
-                        # Stop the service to prevent a reconnect loop
-                        stop_twitch()
-                        return
-                    if not msg: continue
-
-                    # In-chat mod detection: announce mods when we see a PRIVMSG with mod tag (fallback to TMI)
-                    try:
-                        if tags and tags.get('mod') == '1' and user and user not in shouted_mods:
-                            bot_instance.send(f"Shoutout to moderator @{user} — thanks for keeping chat tidy!")
-                            shouted_mods.add(user)
-                    except Exception:
-                        # Non-fatal, continue processing
-                        pass
-
-                    # Active point earning
-                    now = time.time()
-                    if now - bot_instance.last_active_times.get(user, 0) > POINTS_ACTIVE_COOLDOWN:
-                        bot_instance.update_user_points(user, POINTS_ACTIVE_AMOUNT, is_active=True)
-                        bot_instance.last_active_times[user] = now
-
-                    # Command parsing
-                    command_part = msg.split(" ")[0].lower()
-                    handler = commands.get(command_part)
-                    if handler:
-                        # Pass tags to any command that might need it for permission checks
-                        if command_part in ["!addpoints"]:
-                            handler(user, msg, tags)
-                        else:
-                            handler(user, msg)
-                        continue
-
-                    m = re.match(r"!pick (\d+)", msg, re.IGNORECASE)
-                    if m:
-                        bot_instance.pick(user, int(m.group(1)))
-                        continue
-
-                    m_playnext = re.match(r"!playnext (\d+)", msg, re.IGNORECASE)
-                    if m_playnext:
-                        bot_instance.playnext(user, int(m_playnext.group(1)))
-                        continue
-
-                    # (bleep game removed)
-
-        except socket.timeout:
-            log("Twitch: Socket timeout, reconnecting...")
-            bot_instance.connect()
-        except (socket.error, BrokenPipeError) as e:
-            if not bot_instance.running: break
-            log(f"Twitch Socket Error: {e}. Reconnecting...")
-            time.sleep(3)
-            bot_instance.connect()
-        except Exception as e:
-            if not bot_instance.running: break
-            log(f"An unexpected error occurred in Twitch loop: {type(e).__name__}: {e}")
-            time.sleep(5) # Wait a bit longer on unexpected errors
+    global chat_network
+    network = chat_network
+
+    def on_message(message: IrcMessage) -> None:
+        """Runs on the bot's asyncio loop: look at the parsed line and hand off, nothing else."""
+        if message.command == "NOTICE" and "Login authentication failed" in message.text:
+            log("Twitch Error: Login authentication failed. Please check your oauth token in config.ini.")
+            messagebox.showerror("Twitch Auth Error", "Login failed. Please check your 'oauth' token in the config and restart the bot.")
+            # Stop the service to prevent a reconnect loop (from another thread, since
+            # stop_twitch joins the thread we are running on)
+            threading.Thread(target=stop_twitch, daemon=True).start()
+            return
+        network.route(message)
+
+    network.run(on_message)
     log("Twitch: Bot loop exiting")
-    if bot_instance.sock:
-        bot_instance.sock.close()
 
 # ======================================================
 # OVERLAY SERVICE
@@ -208,6 +140,7 @@ def start_overlay() -> None:
         overlay_thread = threading.Thread(target=run_server, daemon=True)
         overlay_thread.start()
         overlay_running = True
+        station.start()  # overlays are pushed the station's changes
         log(f"Overlay: http://{HTTP_HOST}:{HTTP_PORT}/")
     except Exception as e:
         log(f"Overlay start error: {e}")
@@ -223,6 +156,8 @@ def stop_overlay() -> None:
         log(f"Overlay stop error: {e}")
     overlay_thread = None
     overlay_running = False
+    if not song_tracker_running:
+        station.stop()
     log("Overlay: stopped")
 
 # ======================================================
@@ -247,85 +182,76 @@ def stop_points_manager():
 
 def run_points_manager_loop():
     """Periodically awards points to active chatters."""
-    global bot_instance
+    global bot_instances
     while points_running:
         time.sleep(POINTS_PASSIVE_INTERVAL * 60)
-        if not bot_instance or not bot_instance.running:
-            continue
-        
-        try:
-            # This is an undocumented Twitch endpoint, but it's widely used.
-            url = f"https://tmi.twitch.tv/group/user/{TWITCH_CHANNEL}/chatters"
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            chatters_data = response.json()
-            all_chatters = set(sum(chatters_data['chatters'].values(), []))
-            log(f"Points Manager: Found {len(all_chatters)} chatters. Awarding {POINTS_PASSIVE_AMOUNT} points.")
-            for user in all_chatters:
-                bot_instance.update_user_points(user, POINTS_PASSIVE_AMOUNT)
-        except Exception as e:
-            log(f"Points Manager Error: Could not fetch chatters. {e}")
+        for channel, bot in list(bot_instances.items()):
+            if not bot.running:
+                continue
+            try:
+                # This is an undocumented Twitch endpoint, but it's widely used.
+                url = f"https://tmi.twitch.tv/group/user/{channel}/chatters"
+                response = requests.get(url, timeout=5)
+                response.raise_for_status()
+                chatters_data = response.json()
+                all_chatters = set(sum(chatters_data['chatters'].values(), []))
+                log(f"Points Manager: Found {len(all_chatters)} chatters in #{channel}. Awarding {POINTS_PASSIVE_AMOUNT} points.")
+                for user in all_chatters:
+                    bot.earn(user, POINTS_PASSIVE_AMOUNT)
+            except Exception as e:
+                log(f"Points Manager Error: Could not fetch chatters for #{channel}. {e}")
 
 
 def start_song_tracker():
-    global song_tracker_thread, song_tracker_running, last_announced_song
+    global song_tracker_running
     if song_tracker_running:
         return
     song_tracker_running = True
-    song_tracker_thread = threading.Thread(target=run_song_tracker_loop, daemon=True)
-    song_tracker_thread.start()
+    if announce_song_change not in station.watchers:
+        station.watchers.append(announce_song_change)
+    station.start()
+    if now_playing_file.enabled:
+        now_playing_file.on_change = station.track_started
+        now_playing_file.start()
     log("NowPlaying Tracker: started")
 
 
 def stop_song_tracker():
-    global song_tracker_running, song_tracker_thread
+    global song_tracker_running
     if not song_tracker_running:
         return
     song_tracker_running = False
-    if song_tracker_thread:
-        song_tracker_thread.join(timeout=5)
+    now_playing_file.stop()
+    station.forget_file_track()
+    if not overlay_running:
+        station.stop()
     log("NowPlaying Tracker: stopped")
 
 
-def run_song_tracker_loop():
-    """Poll the RadioDJ `history` table and announce when the top entry changes."""
-    global bot_instance, last_announced_song, song_tracker_running
-    from db import get_db_connection
-    poll_interval = 5
-    while song_tracker_running:
+def _song_key(track) -> tuple:
+    return ((track.get('artist') or '').strip(), (track.get('title') or '').strip()) if track else None
+
+
+def announce_song_change(old, new) -> None:
+    """Station watcher: announce in chat when the track on air changes."""
+    if not song_tracker_running or old is None:
+        return  # the first snapshot is the baseline
+    cur = _song_key(new.now)
+    if cur is None or cur == _song_key(old.now):
+        return
+    if bot_instance and bot_instance.running:
         try:
-            conn = get_db_connection()
-            try:
-                with conn.cursor() as c:
-                    c.execute("SELECT artist, title FROM history ORDER BY date_played DESC LIMIT 1")
-                    row = c.fetchone()
-            finally:
-                conn.close()
-
-            if row:
-                cur = ( (row.get('artist') or '').strip(), (row.get('title') or '').strip() )
-                if last_announced_song is None:
-                    last_announced_song = cur
-                elif cur != last_announced_song:
-                    last_announced_song = cur
-                    if bot_instance and bot_instance.running:
-                        try:
-                            templates = [
-                                "Turn it up for {artist} - {title} — this one's a banger! 🔥",
-                                "Brace yourselves: {artist} - {title} is about to melt faces.",
-                                "Turn it UP — {artist} - {title}! Respect the volume.",
-                                "Lock in: {artist} - {title} — no refunds for blown minds.",
-                                "Warning: {artist} - {title} incoming. Headphones advised. 😈"
-                            ]
-                            msg = random.choice(templates).format(artist=cur[0], title=cur[1])
-                            bot_instance.send(msg)
-                        except Exception as e:
-                            log(f"Error announcing now playing: {e}")
-
-            time.sleep(poll_interval)
+            templates = [
+                "Turn it up for {artist} - {title} — this one's a banger! 🔥",
+                "Brace yourselves: {artist} - {title} is about to melt faces.",
+                "Turn it UP — {artist} - {title}! Respect the volume.",
+                "Lock in: {artist} - {title} — no refunds for blown minds.",
+                "Warning: {artist} - {title} incoming. Headphones advised. 😈"
+            ]
+            msg = random.choice(templates).format(artist=cur[0], title=cur[1])
+            bot_instance.send(msg, priority=PRIORITY_ANNOUNCE)
         except Exception as e:
-            log(f"NowPlaying Tracker Error: {e}")
-            time.sleep(poll_interval)
+            log(f"Error announcing now playing: {e}")
 
 
 def start_mod_tracker():
@@ -385,7 +311,8 @@ def run_mod_tracker_loop():
             for m in new_mods:
                 try:
                     if bot_instance and bot_instance.running:
-                        bot_instance.send(f"Shoutout to moderator @{m} — thanks for keeping chat tidy!")
+                        bot_instance.send(f"Shoutout to moderator @{m} — thanks for keeping chat tidy!",
+                                         priority=PRIORITY_ANNOUNCE)
                         shouted_mods.add(m)
                 except Exception as e:
                     log(f"Error sending mod shoutout for {m}: {e}")
@@ -420,7 +347,7 @@ def stop_420() -> None:
 
 def next_420_tracker_loop() -> None:
     while tracker_running:
-        shared_state["next_420_utc"], shared_state["next_420_city"] = compute_next_420()
+        set_next_420(*compute_next_420())
         time.sleep(60)
     log("420 Tracker: stopped")
 
@@ -431,9 +358,7 @@ def run_420_announcer_loop() -> None:
             delta = (shared_state["next_420_utc"] - datetime.now(pytz.utc)).total_seconds()
             if 0 <= delta <= 30 and last_fired_target != shared_state["next_420_utc"]:
                 msg = fire_420(bot_instance, test=False)
-                shared_state["last_420_message"] = msg
-                shared_state["popup_message"] = msg
-                shared_state["popup_expire_utc"] = datetime.now(pytz.utc) + timedelta(seconds=12)
+                show_popup(msg)
                 last_fired_target = shared_state["next_420_utc"]
         time.sleep(5)
     log("420 Announcer: stopped")
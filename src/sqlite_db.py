@@ -0,0 +1,177 @@
+import re
+import sqlite3
+import threading
+
+import pymysql
+
+from config import SQLITE_PATH
+
+# The RadioDJ tables the bot reads and writes, and the primary channel's
+# points table. Further points tables and all indexes come from migrations.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+  ID INTEGER PRIMARY KEY, artist TEXT NOT NULL DEFAULT '', title TEXT NOT NULL DEFAULT '',
+  duration REAL NOT NULL DEFAULT 0, enabled INTEGER NOT NULL DEFAULT 1,
+  date_modified TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS history (
+  ID INTEGER PRIMARY KEY AUTOINCREMENT, trackID INTEGER, artist TEXT, title TEXT,
+  duration REAL DEFAULT 0, date_played TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS requests (
+  ID INTEGER PRIMARY KEY AUTOINCREMENT, songID INTEGER, username TEXT, userIP TEXT,
+  message TEXT, requested TEXT, played INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS queuelist (
+  ID INTEGER PRIMARY KEY AUTOINCREMENT, songID INTEGER, trackID INTEGER, track_type TEXT
+);
+CREATE TABLE IF NOT EXISTS community_points (
+  username TEXT PRIMARY KEY, points INTEGER NOT NULL DEFAULT 0,
+  last_seen TEXT DEFAULT (datetime('now', 'localtime')), last_active TEXT DEFAULT NULL
+);
+"""
+
+# Applied to every connection. WAL lets the overlay and trackers read while
+# chat writes; NORMAL sync is durable across crashes of the bot (not the OS)
+# and skips an fsync per commit.
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -32000",     # KiB
+    "PRAGMA mmap_size = 268435456",
+]
+
+# The MySQL-only constructs in the bot's SQL and their SQLite spelling. MySQL's
+# NOW() is local time, so SQLite's timestamps are taken in local time too.
+_REWRITES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"NOW\(\) - INTERVAL \? SECOND"), "datetime('now', 'localtime', '-' || ? || ' seconds')"),
+    (re.compile(r"NOW\(\)"), "datetime('now', 'localtime')"),
+    (re.compile(r"DEFAULT CURRENT_TIMESTAMP"), "DEFAULT (datetime('now', 'localtime'))"),
+    (re.compile(r"\)\s*ENGINE=\w+[^;]*;?\s*$"), ")"),
+    (re.compile(r"ON DUPLICATE KEY UPDATE"), "ON CONFLICT(username) DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)"), r"excluded.\1"),
+]
+
+# MySQL's UPDATE ... SET col = LAST_INSERT_ID(expr) hands the new value back
+# as the statement's insert ID; SQLite gets RETURNING col instead.
+_LAST_INSERT_ID = re.compile(r"SET (\w+) = LAST_INSERT_ID\((.*?)\) WHERE")
+_RETURNING = re.compile(r" RETURNING \w+$")
+
+_schema_lock = threading.Lock()
+_schema_ready: set = set()  # paths whose schema exists
+
+
+def to_sqlite(sql: str) -> str:
+    for pattern, repl in _REWRITES:
+        sql = pattern.sub(repl, sql)
+    match = _LAST_INSERT_ID.search(sql)
+    if match:
+        sql = _LAST_INSERT_ID.sub(r"SET \1 = \2 WHERE", sql) + f" RETURNING {match.group(1)}"
+    return sql
+
+
+class SqliteCursor:
+    """The slice of pymysql's DictCursor the bot uses, over a sqlite3 cursor."""
+
+    def __init__(self, conn: "SqliteConnection"):
+        self._cur = conn.raw.cursor()
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql: str, params=()) -> int:
+        sql = to_sqlite(sql)
+        try:
+            self._cur.execute(sql, tuple(params or ()))
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(str(e)) from e
+        if _RETURNING.search(sql):
+            returned = self._cur.fetchall()
+            self.rowcount = len(returned)
+            self.lastrowid = returned[0][0] if returned else 0
+        else:
+            self.rowcount = self._cur.rowcount
+            self.lastrowid = self._cur.lastrowid
+        return self.rowcount
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return dict(row) if row is not None else None
+
+    def fetchall(self) -> list:
+        return [dict(r) for r in self._cur.fetchall()]
+
+    def close(self) -> None:
+        self._cur.close()
+
+
+class SqliteConnection:
+    """A sqlite3 connection that looks like a pymysql one to the pool and the queries.
+
+    Like pymysql with autocommit off, a transaction opens with the first
+    write and stays open until commit() or rollback().
+    """
+
+    def __init__(self, path: str):
+        self.raw = sqlite3.connect(path, timeout=5, isolation_level="DEFERRED", check_same_thread=False)
+        self.raw.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            self.raw.execute(pragma)
+
+    @property
+    def open(self) -> bool:
+        return self.raw is not None
+
+    @property
+    def server_status(self) -> int:
+        """pymysql's status flags; only SERVER_STATUS_IN_TRANS (1) is emulated."""
+        return 1 if self.raw is not None and self.raw.in_transaction else 0
+
+    def ping(self, reconnect: bool = False) -> None:
+        if self.raw is None:
+            raise pymysql.err.InterfaceError("connection closed")
+        self.raw.execute("SELECT 1")
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self)
+
+    def commit(self) -> None:
+        self.raw.commit()
+
+    def rollback(self) -> None:
+        self.raw.rollback()
+
+    def close(self) -> None:
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+
+
+def create_schema(path: str) -> None:
+    """Creates the tables in the file at path, if they are not there yet."""
+    raw = sqlite3.connect(path, timeout=5)
+    try:
+        raw.execute("PRAGMA journal_mode = WAL")  # persistent: set once for the file
+        raw.executescript(SCHEMA)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def connect_sqlite(path: str = SQLITE_PATH) -> SqliteConnection:
+    """Opens one new, unpooled connection to the SQLite database, creating its tables the first time."""
+    if sqlite3.sqlite_version_info < (3, 35):
+        raise RuntimeError(f"the SQLite backend needs SQLite 3.35 or later, this Python has {sqlite3.sqlite_version}")
+    with _schema_lock:
+        if path not in _schema_ready:
+            create_schema(path)
+            _schema_ready.add(path)
+    return SqliteConnection(path)
@@ -0,0 +1,268 @@
+import threading
+import time
+from datetime import datetime
+
+import metrics
+import queries
+from config import STATION_POLL_INTERVAL, STATION_IDLE_POLL_INTERVAL
+from utils import log
+
+HISTORY_SIZE = 5    # plays kept, the current one first
+REQUESTS_SIZE = 10  # newest pending requests, for the overlay
+UP_NEXT_SIZE = 3    # oldest pending requests, for !queue
+
+FAST_INTERVAL = 1.0    # seconds between probes while the next track is due
+NEAR_END_SECONDS = 10  # probe fast from this long before the track on air should end (crossfades start early)
+OVERDUE_SECONDS = 30   # a track running this far past its duration is paused or live: back to the base interval
+
+
+class Snapshot:
+    """What the station was doing as of one poll. The rows never change once published.
+
+    `recent` holds the last plays newest first, so recent[0] is on air.
+    `requests` are the newest pending requests with who asked, `up_next`
+    the oldest ones, which play first. Rows are dicts as the queries
+    return them.
+    """
+    __slots__ = ("version", "recent", "next", "requests", "up_next", "polled_at")
+
+    def __init__(self, version: int, recent: list, next_track, requests: list, up_next: list):
+        self.version = version
+        self.recent = recent
+        self.next = next_track
+        self.requests = requests
+        self.up_next = up_next
+        self.polled_at = time.monotonic()
+
+    @property
+    def now(self):
+        """The track on air, or None when nothing has played yet."""
+        return self.recent[0] if self.recent else None
+
+    def same_as(self, other: "Snapshot") -> bool:
+        return (other is not None and self.recent == other.recent and self.next == other.next
+                and self.requests == other.requests and self.up_next == other.up_next)
+
+
+class StationPoller:
+    """One poller for the now-playing state everything else reads.
+
+    Each poll is one probe query: the server's clock and a few markers
+    (highest history, request and queue IDs, pending and queued counts).
+    Only the parts whose markers moved are fetched again, and published
+    with the rest as a new Snapshot. `version` only goes up when something
+    changed, and then every callable in `watchers` is called with (old,
+    new) on the poller thread; old is None for the first snapshot.
+
+    The poller thread waits according to the track on air: until
+    NEAR_END_SECONDS before it should end (at most `idle_interval`), then
+    FAST_INTERVAL until the next one shows up. Without a duration, or well
+    past it, it probes every `interval` seconds.
+
+    A track reported by RadioDJ's now-playing file (track_started()) is
+    published on the spot and stays on air ahead of the database's history
+    until the file reports another; while the file
+    is followed, polls only keep requests and the queue fresh, every
+    `idle_interval`.
+
+    get() never waits for the thread: when it has not run yet (or is not
+    running and the snapshot is older than `interval` or nudged) it polls
+    in place. nudge() asks for a poll now, after the bot changed something.
+    """
+
+    def __init__(self, interval: float = STATION_POLL_INTERVAL, idle_interval: float = STATION_IDLE_POLL_INTERVAL):
+        self.interval = max(1, interval)
+        self.idle_interval = max(self.interval, idle_interval)
+        self.snapshot: Snapshot = None
+        self.remaining: float = None  # seconds the track on air has left as of the last poll, if known
+        self.file_track: dict = None  # latest track from the now-playing file, while it is followed
+        self._marks: tuple = None
+        self._queries = 0
+        self._started_at = time.monotonic()
+        self.watchers: list = []
+        self._nudged = False
+        self._poll_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread = None
+        self._running = False
+
+    @property
+    def version(self) -> int:
+        snap = self.snapshot
+        return snap.version if snap else 0
+
+    def get(self) -> Snapshot:
+        """The latest snapshot, polling first if there is none or it is stale and nobody else polls."""
+        if self._needs_poll():
+            with self._poll_lock:
+                if self._needs_poll():
+                    return self._poll()
+        return self.snapshot
+
+    def _needs_poll(self) -> bool:
+        snap = self.snapshot
+        if snap is None:
+            return True
+        return not self._running and (self._nudged or time.monotonic() - snap.polled_at > self.interval)
+
+    def nudge(self) -> None:
+        """Asks for a poll now, e.g. after a request was added."""
+        self._nudged = True
+        self._wake.set()
+
+    def poll(self) -> Snapshot:
+        """Reads the station state now and publishes it. Raises if the database cannot be read."""
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self) -> Snapshot:
+        self._nudged = False
+        start = time.perf_counter()
+        old = self.snapshot
+        with queries.session() as q:
+            probe = q.station_probe()
+            marks = (probe["history_id"], probe["request_id"], probe["pending"], probe["queue_id"], probe["queued"])
+            was = self._marks if old is not None else None
+            statements = 1
+            if was is None or marks[0] != was[0]:
+                recent = q.recent_history(HISTORY_SIZE)
+                statements += 1
+            else:
+                recent = old.recent
+            if was is None or marks[1:3] != was[1:3]:
+                requests, up_next = q.latest_requests(REQUESTS_SIZE), q.pending_requests(UP_NEXT_SIZE)
+                statements += 2
+            else:
+                requests, up_next = old.requests, old.up_next
+            if was is None or marks[3:] != was[3:]:
+                next_track = q.next_in_queue()
+                statements += 1
+            else:
+                next_track = old.next
+        self._marks = marks
+        self._count(statements, start)
+
+        db_now = _as_datetime(probe["db_now"])
+        if self.file_track is not None:
+            recent = _with_head(self.file_track, recent)
+        snap = Snapshot(self.version, recent, next_track, requests, up_next)
+        self.remaining = _remaining(snap.now, db_now)
+        if snap.same_as(old):
+            old.polled_at = snap.polled_at  # still current
+            return old
+        if old is not None and _key(snap.now) != _key(old.now):
+            started = _as_datetime(snap.now.get("date_played")) if snap.now else None
+            if started and db_now:
+                # How long the new track had been on air when the change was seen.
+                metrics.observe("station.change_latency_ms", max(0.0, (db_now - started).total_seconds()) * 1000)
+        return self._publish(old, snap)
+
+    def track_started(self, track: dict) -> None:
+        """Puts a track reported outside the database (the now-playing file) on air."""
+        with self._poll_lock:
+            self.file_track = track
+            old = self.snapshot
+            if old is not None and _key(old.now) != _key(track):
+                snap = Snapshot(self.version, _with_head(track, old.recent), old.next, old.requests, old.up_next)
+                self.remaining = None
+                self._publish(old, snap)
+        self.nudge()  # the history row, and the queue and requests it changed
+
+    def forget_file_track(self) -> None:
+        """Back to the database alone, when the now-playing file is no longer followed."""
+        self.file_track = None
+
+    def _publish(self, old: Snapshot, snap: Snapshot) -> Snapshot:
+        snap.version += 1
+        self.snapshot = snap
+        metrics.incr("station.changes")
+        metrics.set_gauge("station.version", snap.version)
+        for watcher in list(self.watchers):
+            try:
+                watcher(old, snap)
+            except Exception as e:
+                log(f"Station: watcher failed: {e}")
+        return snap
+
+    def _count(self, statements: int, start: float) -> None:
+        self._queries += statements
+        hours = max(time.monotonic() - self._started_at, 60) / 3600
+        metrics.observe("station.poll_ms", (time.perf_counter() - start) * 1000)
+        metrics.incr("station.polls")
+        metrics.incr("station.queries", statements)
+        metrics.set_gauge("station.queries_per_hour", round(self._queries / hours))
+
+    def next_delay(self, remaining: float = None) -> float:
+        """Seconds to wait before the next probe, given how long the track on air has left (None: unknown)."""
+        if self.file_track is not None:
+            return self.idle_interval  # the file says when the track changes
+        if remaining is None or remaining < -OVERDUE_SECONDS:
+            return self.interval
+        if remaining <= NEAR_END_SECONDS:
+            return FAST_INTERVAL
+        return min(self.idle_interval, remaining - NEAR_END_SECONDS)
+
+    # ===== Poller Thread =====
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._started_at = time.monotonic()
+        self._queries = 0
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="station-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                self.poll()
+            except Exception as e:
+                metrics.incr("station.poll_errors")
+                log(f"Station: poll failed, will retry: {e}")
+                self.remaining = None
+            self._wake.wait(self.next_delay(self.remaining))
+            self._wake.clear()
+
+
+def _key(track) -> tuple:
+    return ((track.get("artist") or "").strip(), (track.get("title") or "").strip()) if track else None
+
+
+def _with_head(track: dict, recent: list) -> list:
+    """recent with track on air first, unless it already is."""
+    if recent and _key(recent[0]) == _key(track):
+        return recent
+    return [track] + recent[:HISTORY_SIZE - 1]
+
+
+def _as_datetime(value):
+    """A DATETIME as the driver returns it (datetime, or text from SQLite), or None."""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, datetime) else None
+
+
+def _remaining(track, db_now) -> float:
+    """Seconds until track should end by the server's clock, or None if its start or duration is unknown."""
+    if not track or not track.get("duration") or db_now is None:
+        return None
+    started = _as_datetime(track.get("date_played"))
+    if started is None:
+        return None
+    return float(track["duration"]) - (db_now - started).total_seconds()
+
+
+station = StationPoller()
@@ -1,275 +1,299 @@
-import socket
 import time
 import re
 import random
 
 from config import ( # noqa
-    TWITCH_SERVER, TWITCH_PORT, TWITCH_OAUTH, TWITCH_NICK, TWITCH_CHANNEL, MAX_RESULTS, config,
-    POINTS_CURRENCY, POINTS_REQUEST_COST, POINTS_PLAYNEXT_COST, POINTS_GIVE_TAX
+    TWITCH_SERVER, TWITCH_PORT, TWITCH_CHANNEL, MAX_RESULTS, config,
+    POINTS_CURRENCY, POINTS_REQUEST_COST, POINTS_PLAYNEXT_COST, POINTS_GIVE_TAX,
+    POINTS_ACTIVE_AMOUNT, POINTS_ACTIVE_COOLDOWN, SEARCH_RESULTS_MAX, SEARCH_RESULTS_TTL
 )
-from db import get_db_connection
+import commands
+import queries
+import search_index
+from cache import LruCache, TtlMap
+from chat_network import ChatNetwork
+from chat_queue import PRIORITY_MOD, PRIORITY_REPLY, PRIORITY_ANNOUNCE
+from irc import IrcMessage
+from balances import balances
+from leaderboard import leaderboards
+from ledger import ledger
+from station import station
 from utils import log
 import pymysql
 
+_CHANNEL_NAME = re.compile(r"^[a-z0-9_]{1,25}$")
+
+
+def points_table_for(channel: str) -> str:
+    """The points table for a channel: the primary channel keeps community_points."""
+    channel = channel.lower().lstrip("#")
+    if channel == TWITCH_CHANNEL.lower():
+        return "community_points"
+    if not _CHANNEL_NAME.match(channel):
+        raise ValueError(f"invalid Twitch channel name: {channel!r}")
+    return f"community_points_{channel}"
+
+
 class TwitchBot:
-    def __init__(self):
-        self.sock: socket.socket = None
-        self.running: bool = True
-        self.reconnect_delay: int = 5  # Exponential backoff starting point
-        self.first_connect: bool = True  # Flag to track first connection
+    """The bot as seen by one channel: its commands, cooldowns, search results and points.
+
+    Connections, the outbound rate limit and the command pool belong to the
+    ChatNetwork shared by all channels; a bot created without one gets a
+    private network, which is what a single-channel setup uses.
+    """
+
+    def __init__(self, channel: str = TWITCH_CHANNEL, network: ChatNetwork = None,
+                 server: str = TWITCH_SERVER, port: int = TWITCH_PORT):
+        self.channel: str = channel.lower().lstrip("#")
+        self.points_table: str = points_table_for(self.channel)
+        self.network: ChatNetwork = network if network is not None else ChatNetwork(server, port)
         self.stream_start_time: float = time.time()
-        self.last_results: dict = {}
-        self.command_cooldowns: dict = {} # For user-specific command cooldowns
-        self.last_active_times: dict = {} # For active point earning cooldown
-
-    def connect(self) -> None:
-        if not self.running:
-            return
-        try:
-            self.sock = socket.socket()
-            self.sock.settimeout(10)  # Added timeout to prevent hangs
-            self.sock.connect((TWITCH_SERVER, TWITCH_PORT))
-            self.sock.sendall(
-                b"CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership\r\n"
-            )
-            self.sock.sendall(f"PASS {TWITCH_OAUTH}\r\n".encode())
-            self.sock.sendall(f"NICK {TWITCH_NICK}\r\n".encode())
-            self.sock.sendall(f"JOIN #{TWITCH_CHANNEL}\r\n".encode())
-            if self.first_connect:
-                station_name = config.get("twitch", "station_name", fallback="Radio420")
-                self.send(f"🎧 {station_name} is now online & taking requests - use !search <song/artist>")
-                self.first_connect = False
-            self.stream_start_time = time.time()
-            log("Twitch: Connected")
-            self.reconnect_delay = 5  # Reset delay on success
-        except Exception as e:
-            log(f"Twitch Connect Error: {e}")
-            time.sleep(self.reconnect_delay)
-            self.reconnect_delay = min(self.reconnect_delay * 2, 60)  # Exponential backoff
-            if self.running:
-                self.connect()
+        # user -> [(song ID, 'artist - title'), ...] from their latest !search, for !pick/!playnext
+        self.last_results: LruCache = LruCache(SEARCH_RESULTS_MAX, SEARCH_RESULTS_TTL, name="search_results")
+        self.command_cooldowns: TtlMap = TtlMap() # (user, command) -> marker, until the cooldown ends
+        self.last_active_times: TtlMap = TtlMap() # user -> marker, until they can earn active points again
+        self.shouted_mods: set = set()
+        self.router: commands.CommandRouter = self._build_router()
+        self.network.add(self)
+
+    @property
+    def outbound(self):
+        return self.network.outbound
+
+    @property
+    def running(self) -> bool:
+        return self.network.running
+
+    def on_first_connect(self) -> None:
+        """Called by the network the first time this channel's connection comes up."""
+        station_name = config.get("twitch", "station_name", fallback="Radio420")
+        self.send(f"🎧 {station_name} is now online & taking requests - use !search <song/artist>",
+                  priority=PRIORITY_ANNOUNCE)
+
+    def send(self, msg: str, priority: int = PRIORITY_REPLY, group: str = None) -> None:
+        """Queues a chat message and returns immediately. Safe to call from any thread.
+
+        Messages sharing a `group` that are still queued together are sent as one PRIVMSG.
+        """
+        self.network.send(self.channel, msg, priority, group)
 
-    def send(self, msg: str) -> None:
-        try:
-            if self.sock:
-                self.sock.sendall(f"PRIVMSG #{TWITCH_CHANNEL} :{msg}\r\n".encode())
-        except Exception as e:
-            log(f"Twitch Send Error: {e}")
-            self.connect()  # Attempt reconnect on send failure
+    def submit(self, user: str, fn, *args) -> bool:
+        """Queues fn(*args) on the command pool behind the user's earlier commands in this channel.
 
-    def parse(self, line: str) -> tuple[str, str, dict]:
-        try:
-            tags_raw, _, message_raw = line.partition(' ')
-            if not line.startswith("@"):
-                return None, None, {}
-            
-            tags = {kv.split('=', 1)[0]: kv.split('=', 1)[1] for kv in tags_raw[1:].split(';') if '=' in kv}
-            user = tags.get('display-name', '').lower()
-            
-            msg_parts = message_raw.split(" :", 1)
-            msg = msg_parts[1].strip() if len(msg_parts) > 1 else ""
-            return user, msg, tags
-        except Exception:
-            return None, None, {}
+        Never blocks the reader; returns False when the pool sheds the work.
+        """
+        return self.network.submit((self.channel, user), fn, *args)
 
     def _is_on_cooldown(self, user: str, command: str, cooldown_seconds: int) -> bool:
         """Checks if a user is on cooldown for a specific command."""
-        now = time.time()
-        user_cooldowns = self.command_cooldowns.setdefault(user, {})
-        last_used = user_cooldowns.get(command, 0)
-        if now - last_used < cooldown_seconds:
-            return True
-        user_cooldowns[command] = now
-        return False
+        return not self.command_cooldowns.claim((user, command), cooldown_seconds)
 
-    def is_mod(self, user: str, tags: dict) -> bool:
+    def is_mod(self, user: str, message: IrcMessage) -> bool:
         """Checks if a user is a mod or the broadcaster based on tags."""
-        is_mod = tags.get('mod') == '1'
-        is_broadcaster = user.lower() == TWITCH_CHANNEL.lower()
+        is_mod = message.tag('mod') == '1'
+        is_broadcaster = user.lower() == self.channel
         return is_mod or is_broadcaster
 
+    # ===== Chat Dispatch =====
+
+    def _build_router(self) -> commands.CommandRouter:
+        router = commands.CommandRouter(self.send, self.is_mod, self._is_on_cooldown)
+        router.register("search", self.search, args=(commands.text,), cooldown=30,
+                        usage="usage: !search <song or artist>")
+        router.register("pick", self.pick, args=(commands.number,))
+        router.register("playnext", self.playnext, args=(commands.number,))
+        router.register("points", self.points, cooldown=15)
+        router.register("uptime", self.uptime, cooldown=30)
+        router.register("lastplayed", self.lastplayed, cooldown=20)
+        router.register("playing", self.playing, cooldown=8)
+        router.register("queue", self.queue, cooldown=20)
+        router.register("gamble", self.gamble, args=(int,), cooldown=10,
+                        usage="please specify how many points to gamble. Usage: !gamble <amount>")
+        router.register("addpoints", self.addpoints, args=(commands.username, commands.amount), mod_only=True,
+                        exact=True, usage="usage: !addpoints <username> <amount>")
+        router.register("syncpoints", self.syncpoints, mod_only=True)
+        router.register("leaderboard", self.leaderboard, cooldown=60)
+        router.register("give", self.give_points, args=(commands.username, commands.amount), cooldown=30,
+                        exact=True, usage="usage: !give <username> <amount>")
+        return router
+
+    def handle_message(self, message: IrcMessage) -> None:
+        """Handles one parsed line on the reader loop: cheap checks here, real work on the pool."""
+        if message.command != "PRIVMSG":
+            return
+        user, msg = message.user, message.text.strip()
+        if not user or not msg:
+            return
+
+        # In-chat mod detection: announce mods when we see a PRIVMSG with mod tag
+        if message.tag('mod') == '1' and user not in self.shouted_mods:
+            self.send(f"Shoutout to moderator @{user} — thanks for keeping chat tidy!",
+                      priority=PRIORITY_ANNOUNCE)
+            self.shouted_mods.add(user)
+
+        # Active point earning: claim the cooldown here, the ledger batches the DB write
+        if self.last_active_times.claim(user, POINTS_ACTIVE_COOLDOWN):
+            self.earn(user, POINTS_ACTIVE_AMOUNT, active=True)
+
+        cmd, rest = self.router.match(msg)
+        if cmd is not None:
+            self.submit(user, self.router.dispatch, cmd, user, rest, message)
+
     # ===== Points System Methods =====
 
-    def get_user_points(self, user: str) -> int:
-        """Gets points for a user from the database."""
-        conn = get_db_connection()
+    def earn(self, user: str, amount: int, active: bool = False) -> None:
+        """Credits earned points through the write-behind ledger; no DB work here."""
+        ledger.add(self.points_table, user, amount, active)
+
+    def get_user_points(self, user: str, settle: bool = False) -> int:
+        """Gets points for a user: the (cached) database balance plus earnings not yet flushed.
+
+        Pass settle=True before spending, so the pending earnings are in the
+        row the spend's UPDATE will change.
+        """
+        if settle:
+            ledger.settle(self.points_table, user)
+        stored = balances.get(self.points_table, user, lambda: self._load_points(user))
+        return stored + ledger.pending(self.points_table, user)
+
+    def _load_points(self, user: str) -> int:
+        with queries.session() as q:
+            return q.points_of(self.points_table, user)
+
+    def _settle(self, user: str, reply: str = None) -> bool:
+        """Writes user's pending earnings ahead of a spend; on failure logs, sends reply and returns False.
+
+        Called before the spend borrows its connection: settling borrows one
+        of its own, and a spend holding two could run the pool dry.
+        """
         try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT points FROM community_points WHERE username = %s", (user,))
-                result = cursor.fetchone()
-                return result['points'] if result else 0
-        finally:
-            conn.close()
+            ledger.settle(self.points_table, user)
+            return True
+        except Exception as e:
+            log(f"Error settling points for {user}: {e}")
+            if reply:
+                self.send(reply)
+            return False
 
     def update_user_points(self, user: str, amount: int, is_active: bool = False) -> int:
         """
         Updates a user's points. Can be a positive or negative amount.
         Returns the new point total.
         """
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cursor:
-                # Use INSERT ... ON DUPLICATE KEY UPDATE to handle new and existing users
-                # Also updates last_seen and last_active timestamps
-                active_update_sql = ", last_active = NOW()" if is_active else ""
-                sql = f"""
-                    INSERT INTO community_points (username, points, last_seen{", last_active" if is_active else ""})
-                    VALUES (%s, %s, NOW(){", NOW()" if is_active else ""})
-                    ON DUPLICATE KEY UPDATE points = points + %s, last_seen = NOW(){active_update_sql};
-                """
-                # The initial amount for an insert should not be negative.
-                insert_amount = max(0, amount)
-                cursor.execute(sql, (user, insert_amount, amount))
-                conn.commit()
-                
+        if not self._settle(user):
+            return None
+        with balances.writing(), queries.session() as q:
+            try:
+                # Handles new and existing users; the row is created at max(0, amount)
+                q.add_points(self.points_table, user, amount, is_active)
+                q.commit()
+
                 # Get the new total
-                cursor.execute("SELECT points FROM community_points WHERE username = %s", (user,))
-                result = cursor.fetchone()
-                return result['points'] if result else 0
-        except Exception as e:
-            log(f"Error updating points for {user}: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+                stored = q.points_of(self.points_table, user)
+                balances.set(self.points_table, user, stored)
+                return stored + ledger.pending(self.points_table, user)
+            except Exception as e:
+                log(f"Error updating points for {user}: {e}")
+                q.rollback()
+                balances.invalidate(self.points_table, user)
 
     # ===== Command Handlers =====
 
-    def points(self, user: str, msg: str) -> None:
+    def points(self, user: str) -> None:
         """!points - Checks the user's point balance."""
-        if self._is_on_cooldown(user, 'points', 15): return
         current_points = self.get_user_points(user)
         self.send(f"@{user}, you have {current_points} {POINTS_CURRENCY}.")
 
-    def uptime(self, user: str, msg: str) -> None:
+    def uptime(self, user: str) -> None:
         """!uptime - Shows how long the stream has been live."""
-        if self._is_on_cooldown(user, 'uptime', 30): return
         duration_seconds = int(time.time() - self.stream_start_time)
         hours, remainder = divmod(duration_seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
         self.send(f"The stream has been live for {hours}h {minutes}m {seconds}s.")
 
-    def lastplayed(self, user: str, msg: str) -> None:
+    def lastplayed(self, user: str) -> None:
         """!lastplayed - Shows the last 3 played songs."""
-        if self._is_on_cooldown(user, 'lastplayed', 20): return
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as c:
-                c.execute("SELECT artist, title FROM history ORDER BY date_played DESC LIMIT 3")
-                rows = c.fetchall()
-                if not rows:
-                    self.send("No songs have been played recently.")
-                    return
-                history_str = " | ".join([f"{row['artist']} - {row['title']}" for row in rows])
-                self.send(f"Last Played: {history_str}")
-        finally:
-            conn.close()
+        rows = station.get().recent[:3]
+        if not rows:
+            self.send("No songs have been played recently.")
+            return
+        history_str = " | ".join([f"{row['artist']} - {row['title']}" for row in rows])
+        self.send(f"Last Played: {history_str}")
 
-    def playing(self, user: str, msg: str) -> None:
+    def playing(self, user: str) -> None:
         """!playing - Shows the currently playing song (most recent history entry)."""
-        if self._is_on_cooldown(user, 'playing', 8):
-            return
-        conn = get_db_connection()
         try:
-            with conn.cursor() as c:
-                c.execute("SELECT artist, title FROM history ORDER BY date_played DESC LIMIT 1")
-                row = c.fetchone()
-                if not row:
-                    self.send("Nothing is playing right now.")
-                    return
-                self.send(f"Now Playing: {row['artist']} - {row['title']}")
+            now = station.get().now
         except Exception as e:
             log(f"Error fetching now playing for !playing: {e}")
-        finally:
-            conn.close()
-
-    def queue(self, user: str, msg: str) -> None:
-        """!queue - Shows the next 3 pending requests."""
-        if self._is_on_cooldown(user, 'queue', 20): return
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as c:
-                c.execute("SELECT s.artist, s.title FROM requests r JOIN songs s ON r.songID = s.ID WHERE r.played = 0 ORDER BY r.ID ASC LIMIT 3")
-                rows = c.fetchall()
-                if not rows:
-                    self.send("The request queue is empty.")
-                    return
-                queue_str = " | ".join([f"{row['artist']} - {row['title']}" for row in rows])
-                self.send(f"Up Next: {queue_str}")
-        finally:
-            conn.close()
-
-    def search(self, user: str, q: str) -> None:
-        if self._is_on_cooldown(user, 'search', 30): return
-
-        # Extract the actual search query from the chat message (strip the command)
-        parts = q.split(' ', 1)
-        if len(parts) < 2 or not parts[1].strip():
-            self.send(f"@{user}, usage: !search <song or artist>")
             return
-        query = parts[1].strip()
-
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as c:
-                c.execute(
-                    "SELECT ID, artist, title FROM songs WHERE (artist LIKE %s OR title LIKE %s) AND enabled=1 ORDER BY artist, title LIMIT %s",
-                    (f"%{query}%", f"%{query}%", MAX_RESULTS)
-                )
-                rows = c.fetchall()
-        finally:
-            conn.close()
+        if not now:
+            self.send("Nothing is playing right now.")
+            return
+        self.send(f"Now Playing: {now['artist']} - {now['title']}")
 
+    def queue(self, user: str) -> None:
+        """!queue - Shows the next 3 pending requests."""
+        rows = station.get().up_next
         if not rows:
+            self.send("The request queue is empty.")
+            return
+        queue_str = " | ".join([f"{row['artist']} - {row['title']}" for row in rows])
+        self.send(f"Up Next: {queue_str}")
+
+    def search(self, user: str, query: str) -> None:
+        """!search <query> - Finds songs by artist or title."""
+        results = search_index.search(query, MAX_RESULTS)
+        if results is None:
+            # The in-memory index is still loading: fall back to scanning the table.
+            with queries.session() as q:
+                results = [(r['ID'], f"{r['artist']} - {r['title']}") for r in q.search_songs(query, MAX_RESULTS)]
+
+        if not results:
             return self.send(f"@{user} No results")
 
-        self.last_results[user.lower()] = rows
-        out = [f"{i}. {r['artist']} - {r['title']}" for i, r in enumerate(rows, 1)]
-        self.send(f"@{user} " + " | ".join(out))
-        self.send(f"Pick using !pick <number> (e.g., !pick 1)")
+        self.last_results.set(user.lower(), results)
+        out = [f"{i}. {display}" for i, (_, display) in enumerate(results, 1)]
+        self.send(f"@{user} " + " | ".join(out), group=f"search:{user}")
+        self.send("Pick using !pick <number> (e.g., !pick 1)", group=f"search:{user}")
     
     def pick(self, user: str, i: int) -> None:
         try:
             u = user.lower()  # Standardize username
-            log(f"DEBUG: !pick called by {u} for index {i}")
 
-            if u not in self.last_results:
+            rows = self.last_results.get(u)
+            if rows is None:
                 self.send(f"@{user}, please use !search for a song before trying to !pick one.")
                 return
 
-            current_points = self.get_user_points(u)
-            if current_points < POINTS_REQUEST_COST:
-                self.send(f"@{user}, you don't have enough points to make a request! It costs {POINTS_REQUEST_COST} {POINTS_CURRENCY}, but you only have {current_points}.")
-                return
-
-            rows = self.last_results[u]
             if not 1 <= i <= len(rows):
                 self.send(f"@{user}, that's not a valid number. Please pick a number from your search results.")
                 return
 
-            track = rows[i - 1]
-            conn = get_db_connection()
-            try:
-                with conn.cursor() as cursor:
+            song_id, display = rows[i - 1]
+            if not self._settle(u, f"@{user}, an error occurred. Your points were not deducted."):
+                return
+            with balances.writing(), queries.session() as q:
+                try:
                     # Perform both actions in a single transaction
-                    cursor.execute("UPDATE community_points SET points = points - %s WHERE username = %s", (POINTS_REQUEST_COST, u))
-
-                    cursor.execute(
-                        "INSERT INTO requests (songID,username,userIP,message,requested) "
-                        "VALUES (%s,%s,%s,%s,NOW())",
-                        (track["ID"], user, f"twitch/{user}", ""),
-                    )
-                conn.commit()  # Commit both changes
-                self.send(f"@{user} spent {POINTS_REQUEST_COST} {POINTS_CURRENCY} to request → {track['artist']} - {track['title']}")
-                del self.last_results[u]  # Clear search results after successful pick
-            except pymysql.err.IntegrityError:
-                conn.rollback()
-                self.send(f"@{user}, that song has already been requested recently! Your points were not deducted.")
-            except Exception as e:
-                conn.rollback()
-                log(f"Error during !pick transaction: {e}")
-                self.send(f"@{user}, an error occurred. Your points were not deducted.")
-            finally:
-                conn.close()
+                    stored = q.change_points_if_covered(self.points_table, u, -POINTS_REQUEST_COST, POINTS_REQUEST_COST)
+                    if stored is None:
+                        q.rollback()
+                        self.send(f"@{user}, you don't have enough points to make a request! It costs {POINTS_REQUEST_COST} {POINTS_CURRENCY}, but you only have {self.get_user_points(u)}.")
+                        return
+                    q.add_request(song_id, user)
+                    q.commit()  # Commit both changes
+                    balances.set(self.points_table, u, stored)
+                    station.nudge()
+                    self.send(f"@{user} spent {POINTS_REQUEST_COST} {POINTS_CURRENCY} to request → {display}")
+                    self.last_results.pop(u)  # Clear search results after successful pick
+                except pymysql.err.IntegrityError:
+                    q.rollback()
+                    self.send(f"@{user}, that song has already been requested recently! Your points were not deducted.")
+                except Exception as e:
+                    q.rollback()
+                    log(f"Error during !pick transaction: {e}")
+                    self.send(f"@{user}, an error occurred. Your points were not deducted.")
         except Exception as e:
             log(f"Unhandled error in pick handler for user {user}: {e}")
             try:
@@ -277,97 +301,69 @@ class TwitchBot:
             except Exception:
                 pass
 
-    def gamble(self, user: str, msg: str) -> None:
+    def gamble(self, user: str, amount_to_gamble: int) -> None:
         """!gamble <amount> - Gamble your points!"""
-        if self._is_on_cooldown(user, 'gamble', 10): return
-        
-        try:
-            amount_to_gamble = int(msg.split()[1])
-        except (IndexError, ValueError):
-            self.send(f"@{user}, please specify how many points to gamble. Usage: !gamble <amount>")
-            return
-
         if amount_to_gamble <= 0:
             self.send(f"@{user}, you must gamble at least 1 point.")
             return
 
-        current_points = self.get_user_points(user)
-        if amount_to_gamble > current_points:
-            self.send(f"@{user}, you don't have that many points to gamble! You have {current_points} {POINTS_CURRENCY}.")
+        roll = random.randint(1, 100)
+        won = roll > 50
+        if not self._settle(user, f"@{user}, an error occurred. Your points were not changed."):
             return
+        with balances.writing(), queries.session() as q:
+            try:
+                # The stake must be covered either way; the roll only decides the sign.
+                delta = amount_to_gamble if won else -amount_to_gamble
+                stored = q.change_points_if_covered(self.points_table, user, delta, amount_to_gamble)
+                q.commit()
+            except Exception as e:
+                q.rollback()
+                log(f"Error during !gamble for {user}: {e}")
+                balances.invalidate(self.points_table, user)
+                self.send(f"@{user}, an error occurred. Your points were not changed.")
+                return
+            if stored is not None:
+                balances.set(self.points_table, user, stored)
 
-        roll = random.randint(1, 100)
-        if roll > 50: # Win
-            new_total = self.update_user_points(user, amount_to_gamble)
+        if stored is None:
+            self.send(f"@{user}, you don't have that many points to gamble! You have {self.get_user_points(user)} {POINTS_CURRENCY}.")
+            return
+        new_total = stored + ledger.pending(self.points_table, user)
+        if won:
             self.send(f"@{user} rolled a {roll} and won {amount_to_gamble} {POINTS_CURRENCY}! You now have {new_total} {POINTS_CURRENCY}.")
-        else: # Lose
-            new_total = self.update_user_points(user, -amount_to_gamble)
+        else:
             self.send(f"@{user} rolled a {roll} and lost {amount_to_gamble} {POINTS_CURRENCY}. You now have {new_total} {POINTS_CURRENCY}.")
 
-    def addpoints(self, user: str, msg: str, tags: dict) -> None:
+    def addpoints(self, user: str, target_user: str, amount: int) -> None:
         """!addpoints <user> <amount> - Mod command to give points."""
-        # Permission check: only mods or the broadcaster can use this
-        if not self.is_mod(user, tags):
-            self.send(f"@{user}, you don't have permission to use that command.")
-            return
+        # update_user_points returns the new total
+        new_total = self.update_user_points(target_user, amount)
+        self.send(f"Gave {amount} {POINTS_CURRENCY} to {target_user}. They now have {new_total} {POINTS_CURRENCY}.", priority=PRIORITY_MOD)
 
-        parts = msg.split()
-        if len(parts) != 3:
-            self.send(f"@{user}, usage: !addpoints <username> <amount>")
-            return
+    def syncpoints(self, user: str) -> None:
+        """!syncpoints - Mod command to re-read balances after they were edited outside the bot."""
+        stats = balances.stats()
+        balances.invalidate()
+        self.send(f"Points re-synced: dropped {stats['size']} cached balances "
+                  f"(hit rate {stats['hit_rate']:.0%}).", priority=PRIORITY_MOD)
 
-        try:
-            target_user = parts[1].lower().lstrip('@')
-            amount = int(parts[2])
-        except ValueError:
-            self.send(f"@{user}, invalid amount. Please use a number.")
+    def leaderboard(self, user: str) -> None:
+        """!leaderboard - Shows the top 5 users with the most points."""
+        rows = leaderboards.top(self.points_table, 5)
+        if not rows:
+            self.send("The leaderboard is empty!")
             return
 
-        if not target_user:
-            self.send(f"@{user}, you must specify a user to give points to.")
-            return
+        leaderboard_entries = []
+        for i, (username, points) in enumerate(rows, 1):
+            leaderboard_entries.append(f"{i}. {username} ({points})")
 
-        # update_user_points returns the new total
-        new_total = self.update_user_points(target_user, amount)
-        self.send(f"Gave {amount} {POINTS_CURRENCY} to {target_user}. They now have {new_total} {POINTS_CURRENCY}.")
+        self.send(f"🏆 Top 5 Point Leaders: {' | '.join(leaderboard_entries)}")
 
-    def leaderboard(self, user: str, msg: str) -> None:
-        """!leaderboard - Shows the top 5 users with the most points."""
-        if self._is_on_cooldown(user, 'leaderboard', 60): return
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT username, points FROM community_points ORDER BY points DESC LIMIT 5")
-                rows = cursor.fetchall()
-                if not rows:
-                    self.send("The leaderboard is empty!")
-                    return
-                
-                leaderboard_entries = []
-                for i, row in enumerate(rows, 1):
-                    leaderboard_entries.append(f"{i}. {row['username']} ({row['points']})")
-                
-                self.send(f"🏆 Top 5 Point Leaders: {' | '.join(leaderboard_entries)}")
-        finally:
-            conn.close()
-
-    def give_points(self, user: str, msg: str) -> None:
+    def give_points(self, user: str, receiver: str, amount: int) -> None:
         """!give <user> <amount> - Give your points to another user."""
-        if self._is_on_cooldown(user, 'give', 30): return
-
         sender = user.lower()
-        parts = msg.split()
-        if len(parts) != 3:
-            self.send(f"@{user}, usage: !give <username> <amount>")
-            return
-
-        try:
-            receiver = parts[1].lower().lstrip('@')
-            amount = int(parts[2])
-        except ValueError:
-            self.send(f"@{user}, invalid amount. Please use a number.")
-            return
-
         if sender == receiver:
             self.send(f"@{user}, you can't give points to yourself.")
             return
@@ -375,78 +371,69 @@ class TwitchBot:
             self.send(f"@{user}, you must give at least 1 {POINTS_CURRENCY}.")
             return
 
-        sender_points = self.get_user_points(sender)
-        if sender_points < amount:
-            self.send(f"@{user}, you don't have enough points to give away! You only have {sender_points} {POINTS_CURRENCY}.")
-            return
-
         # Calculate tax
         tax = int(amount * (POINTS_GIVE_TAX / 100))
         amount_after_tax = amount - tax
 
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cursor:
-                # Subtract from sender
-                cursor.execute("UPDATE community_points SET points = points - %s WHERE username = %s", (amount, sender))
+        if not self._settle(sender, f"@{user}, an error occurred during the transfer."):
+            return
+        with balances.writing(), queries.session() as q:
+            try:
+                # Subtract from sender, if they have it
+                stored = q.change_points_if_covered(self.points_table, sender, -amount, amount)
+                if stored is None:
+                    q.rollback()
+                    self.send(f"@{user}, you don't have enough points to give away! You only have {self.get_user_points(sender)} {POINTS_CURRENCY}.")
+                    return
                 # Add to receiver
-                cursor.execute(
-                    "INSERT INTO community_points (username, points, last_seen) VALUES (%s, %s, NOW()) ON DUPLICATE KEY UPDATE points = points + %s",
-                    (receiver, amount_after_tax, amount_after_tax)
-                )
-            conn.commit()
-            self.send(f"@{user} gave {amount_after_tax} {POINTS_CURRENCY} to {receiver}! ({tax} {POINTS_CURRENCY} tax paid)")
-        except Exception as e:
-            conn.rollback()
-            log(f"Error during !give transaction: {e}")
-            self.send(f"@{user}, an error occurred during the transfer.")
-        finally:
-            conn.close()
+                q.credit_points(self.points_table, receiver, amount_after_tax)
+                q.commit()
+                balances.set(self.points_table, sender, stored)
+                balances.apply(self.points_table, receiver, amount_after_tax)
+                self.send(f"@{user} gave {amount_after_tax} {POINTS_CURRENCY} to {receiver}! ({tax} {POINTS_CURRENCY} tax paid)")
+            except Exception as e:
+                q.rollback()
+                log(f"Error during !give transaction: {e}")
+                self.send(f"@{user}, an error occurred during the transfer.")
 
     def playnext(self, user: str, i: int) -> None:
         """!playnext <number> - Spends a lot of points to inject a song at the top of the playlist."""
         u = user.lower()
-        if u not in self.last_results:
+        rows = self.last_results.get(u)
+        if rows is None:
             self.send(f"@{user}, please use !search for a song first.")
             return
 
-        current_points = self.get_user_points(u)
-        if current_points < POINTS_PLAYNEXT_COST:
-            self.send(f"@{user}, you need {POINTS_PLAYNEXT_COST} {POINTS_CURRENCY} to use !playnext. You have {current_points}.")
-            return
-
-        rows = self.last_results[u]
         if not 1 <= i <= len(rows):
             self.send(f"@{user}, that's not a valid number from your search results.")
             return
 
-        track = rows[i - 1]
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cursor:
-                # Deduct points
-                cursor.execute("UPDATE community_points SET points = points - %s WHERE username = %s", (POINTS_PLAYNEXT_COST, u))
-                # Inject into queuelist. 'S' is for Song type.
-                cursor.execute("INSERT INTO queuelist (trackID, track_type) VALUES (%s, 'S')", (track['ID'],))
-            conn.commit()
-            self.send(f"🔥 @{user} spent {POINTS_PLAYNEXT_COST} {POINTS_CURRENCY} to play next: {track['artist']} - {track['title']} 🔥")
-            del self.last_results[u]
-        except Exception as e:
-            conn.rollback()
-            log(f"Error during !playnext transaction: {e}")
-            self.send(f"@{user}, an error occurred. Your points were not deducted.")
-        finally:
-            conn.close()
-
+        song_id, display = rows[i - 1]
+        if not self._settle(u, f"@{user}, an error occurred. Your points were not deducted."):
+            return
+        with balances.writing(), queries.session() as q:
+            try:
+                # Deduct points, if they have them
+                stored = q.change_points_if_covered(self.points_table, u, -POINTS_PLAYNEXT_COST, POINTS_PLAYNEXT_COST)
+                if stored is None:
+                    q.rollback()
+                    self.send(f"@{user}, you need {POINTS_PLAYNEXT_COST} {POINTS_CURRENCY} to use !playnext. You have {self.get_user_points(u)}.")
+                    return
+                # Inject into queuelist
+                q.queue_next(song_id)
+                q.commit()
+                balances.set(self.points_table, u, stored)
+                station.nudge()
+                self.send(f"🔥 @{user} spent {POINTS_PLAYNEXT_COST} {POINTS_CURRENCY} to play next: {display} 🔥")
+                self.last_results.pop(u)
+            except Exception as e:
+                q.rollback()
+                log(f"Error during !playnext transaction: {e}")
+                self.send(f"@{user}, an error occurred. Your points were not deducted.")
 
-    def run(self) -> None:
-        # This method is now managed by the services.py logic
-        pass
+    def run(self, on_message=None) -> None:
+        """Runs the bot's network until stop() is called; see ChatNetwork.run."""
+        self.network.run(on_message)
 
     def stop(self) -> None:
-        self.running = False
-        try:
-            if self.sock:
-                self.sock.close()
-        except Exception:
-            pass
\ No newline at end of file
+        self.network.stop()
@@ -1,13 +1,19 @@
-from flask import Flask, render_template_string, render_template
-from flask_socketio import SocketIO
+from flask import Flask, Response, request, render_template_string, render_template, jsonify
+from flask_socketio import SocketIO, emit
 from datetime import datetime, timedelta
 import pytz
+import hashlib
+import json
 import logging
 import os
+import threading
+import time
 
-from db import get_db_connection
+import metrics
+from leaderboard import leaderboards
+from station import station
 from utils import log
-from config import REFRESH, BG, COLOR, TITLECOL, FSIZE
+from config import REFRESH, BG, COLOR, TITLECOL, FSIZE, LEADERBOARD_SIZE
 
 app = Flask(__name__)
 # Prevent Flask's default logger from conflicting with our setup
@@ -31,7 +37,6 @@ HTML = r"""
 <!DOCTYPE html>
 <html>
 <head>
-<meta http-equiv="refresh" content="{{ refresh }}">
 <style>
 body{
     background:{{bg}};
@@ -66,6 +71,9 @@ body{
 }
 
 /* 420 popup, fixed 600px width, below main overlay */
+.popup420[hidden]{
+    display:none;
+}
 .popup420{
     margin:25px auto 0 auto;
     width:600px;
@@ -101,17 +109,20 @@ body{
 <body>
 
 <div class="title">Now Playing</div>
-<div class="now">{{ now.artist|default('Nothing playing') }} - {{ now.title|default('') }}</div>
+<div class="now" id="now">{{ now.artist|default('Nothing playing') }} - {{ now.title|default('') }}</div>
 
 <div class="title">Up Next</div>
-<div class="item">{{ nxt.artist|default('Nothing queued') }} - {{ nxt.title|default('') }}</div>
+<div class="item" id="next">{{ nxt.artist|default('Nothing queued') }} - {{ nxt.title|default('') }}</div>
 
 <div class="title">History</div>
+<div id="history">
 {% for h in history %}
   <div class="item">{{h.artist}} - {{h.title}}</div>
 {% endfor %}
+</div>
 
 <div class="title">Requests</div>
+<div id="requests">
 {% if requests %}
   {% for r in requests %}
     <div class="item {% if loop.first %}highlight{% endif %}">
@@ -121,54 +132,110 @@ body{
 {% else %}
   <div class="item">No pending requests.</div>
 {% endif %}
+</div>
 
 <div class="title">🌿 Next Blaze Time 🌿</div>
-<div class="item">{{ next_city }}{% if next_eta %} — {{ next_eta }}{% endif %}</div>
+<div class="item" id="blaze" data-city="{{ next_city }}" data-utc="{{ next_utc }}">{{ next_city }}</div>
 
-{% if popup_text %}
-<div class="popup420">
+<div class="popup420" id="popup" {% if not popup_text %}hidden{% endif %}>
   <div class="popup420-title">🌿🔥 4:20 BLAZE IT 🔥🌿</div>
-  <div class="popup420-text">{{ popup_text }}</div>
+  <div class="popup420-text" id="popup-text">{{ popup_text }}</div>
 </div>
-{% endif %}
+
+<!-- Loaded once; after that the server pushes only what changed. The 4.x client
+     speaks Socket.IO protocol v5 / Engine.IO v4, which requirements.txt pins on the server. -->
+<script src="https://cdn.socket.io/4.7.5/socket.io.min.js" crossorigin="anonymous"></script>
+<script>
+(function () {
+  var refresh = {{ refresh|int }};
+  function $(id) { return document.getElementById(id); }
+
+  // The countdown runs here; the server only says when the target changes.
+  var blaze = {city: $("blaze").dataset.city, utc: $("blaze").dataset.utc || null};
+  function eta(ms) {
+    var total = Math.floor(ms / 1000);
+    if (total <= 0) return "any moment";
+    var h = Math.floor(total / 3600), m = Math.floor(total % 3600 / 60), s = total % 60, out = [];
+    if (h > 0) out.push(h + "h");
+    if (m > 0 || h > 0) out.push(m + "m");
+    out.push(s + "s");
+    return out.join(" ");
+  }
+  function tick() {
+    $("blaze").textContent = blaze.city && blaze.utc ? blaze.city + " — " + eta(Date.parse(blaze.utc) - Date.now()) : "";
+  }
+  function onBlaze(d) { blaze = d; tick(); }
+  tick();
+  setInterval(tick, 1000);
+
+  if (typeof io === "undefined") {
+    // No Socket.IO client (offline browser source): fall back to reloading the page.
+    setTimeout(function () { location.reload(); }, refresh * 1000);
+    return;
+  }
+  function line(t, empty) { return t && (t.artist || t.title) ? t.artist + " - " + t.title : empty; }
+  function item(text, cls) {
+    var div = document.createElement("div");
+    div.className = cls ? "item " + cls : "item";
+    div.textContent = text;
+    return div;
+  }
+  function fill(id, nodes) { $(id).replaceChildren.apply($(id), nodes); }
+  function replay(el, cls) { el.classList.remove(cls); void el.offsetWidth; el.classList.add(cls); }
+
+  function onTrack(d) {
+    $("now").textContent = line(d.now, "Nothing playing");
+    fill("history", d.history.map(function (h) { return item(line(h, "")); }));
+  }
+  function onNext(d) { $("next").textContent = line(d.next, "Nothing queued"); }
+  var firstRequest = null;
+  function onRequests(d) {
+    var first = d.requests.length ? JSON.stringify(d.requests[0]) : null;
+    var added = first !== null && first !== firstRequest;
+    firstRequest = first;
+    if (!d.requests.length) { fill("requests", [item("No pending requests.")]); return; }
+    fill("requests", d.requests.map(function (r, i) {
+      return item("🎧 " + r.username + " → " + r.artist + " - " + r.title, i === 0 && added ? "highlight" : "");
+    }));
+  }
+
+  var popupTimer = null;
+  function onPopup(d) {
+    clearTimeout(popupTimer);
+    if (!d.text || d.seconds <= 0) { $("popup").hidden = true; return; }
+    $("popup-text").textContent = d.text;
+    $("popup").hidden = false;
+    replay($("popup"), "popup420");
+    popupTimer = setTimeout(function () { $("popup").hidden = true; }, d.seconds * 1000);
+  }
+
+  var socket = io();
+  socket.on("state", function (d) { onTrack(d); onNext(d); onRequests(d); onBlaze(d.blaze); onPopup(d.popup); });
+  socket.on("track", onTrack);
+  socket.on("next", onNext);
+  socket.on("requests", onRequests);
+  socket.on("blaze", onBlaze);
+  socket.on("popup", onPopup);
+})();
+</script>
 
 </body>
 </html>
 """
 
-def get_data() -> tuple:
-    try:
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as c:
-                # NOW + HISTORY
-                c.execute("SELECT artist,title FROM history ORDER BY date_played DESC LIMIT 5")
-                r = c.fetchall()
-                now_t = r[0] if r else {"artist": "", "title": ""}
-                history = [{"artist": x["artist"], "title": x["title"]} for x in r[1:]]
-
-                # NEXT
-                c.execute(
-                    "SELECT s.artist,s.title FROM queuelist q "
-                    "JOIN songs s ON s.ID=q.songID ORDER BY q.ID ASC LIMIT 1"
-                )
-                nxt = c.fetchone() or {"artist": "", "title": ""}
-
-                # REQUESTS
-                c.execute(
-                    "SELECT username,artist,title "
-                    "FROM requests r JOIN songs s ON s.ID=r.songID "
-                    "WHERE played=0 OR played IS NULL "
-                    "ORDER BY requested DESC LIMIT 10"
-                )
-                req = c.fetchall()
-
-            return now_t, nxt, history, req
-        finally:
-            conn.close()
-    except Exception as e:
-        log(f"DB Query Error in Overlay: {e}")
+def get_data(snap) -> tuple:
+    """(now, next, history, requests) from a station snapshot; blanks without one."""
+    if snap is None:
         return {}, {}, [], []
+    # NOW + HISTORY
+    now_t = snap.now or {"artist": "", "title": ""}
+    history = [{"artist": x["artist"], "title": x["title"]} for x in snap.recent[1:]]
+
+    # NEXT
+    nxt = snap.next or {"artist": "", "title": ""}
+
+    # REQUESTS
+    return now_t, nxt, history, snap.requests
 
 def format_eta(delta: timedelta) -> str:
     total = int(delta.total_seconds())
@@ -185,32 +252,69 @@ def format_eta(delta: timedelta) -> str:
     out.append(f"{s}s")
     return " ".join(out)
 
-@app.route("/")
-def index():
-    now_utc = datetime.now(pytz.utc)
+# ===== Render cache =====
+# A route's response is rendered once per state it depends on and kept with
+# a strong ETag (a hash of the bytes). Every browser source asking in the
+# same state gets those bytes, or a 304 if it sends the ETag back in
+# If-None-Match, so N overlays cost one render per change rather than N per
+# refresh. Nothing rendered may depend on the clock: the 4:20 countdown runs
+# in the page.
 
-    popup_text = ""
-    ncity = ""
-    neta = ""
+class RenderCache:
+    """The latest rendering of one route and the key of the state it was rendered from."""
 
-    if shared_state["next_420_utc"] and shared_state["next_420_city"]:
-        delta = shared_state["next_420_utc"] - now_utc
-        ncity = shared_state["next_420_city"]
-        neta = format_eta(delta)
+    def __init__(self, name: str):
+        self.name = name
+        self._entry = None  # (key, body, etag), replaced whole
+        self._lock = threading.Lock()
 
-    if shared_state["popup_expire_utc"] and now_utc < shared_state["popup_expire_utc"]:
-        popup_text = shared_state["popup_message"]
+    def get(self, key, render) -> tuple:
+        """(body, etag) for key; render() -> str runs only when key differs from the cached one.
+
+        Requests that arrive together after a change wait for the one render.
+        """
+        entry = self._entry
+        if entry is None or entry[0] != key:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry[0] != key:
+                    start = time.perf_counter()
+                    body = render().encode("utf-8")
+                    entry = (key, body, hashlib.sha1(body).hexdigest())
+                    self._entry = entry
+                    metrics.observe(f"overlay.{self.name}.render_ms", (time.perf_counter() - start) * 1000)
+                    metrics.incr(f"overlay.{self.name}.renders")
+                    return entry[1], entry[2]
+        metrics.incr(f"overlay.{self.name}.cache_hits")
+        return entry[1], entry[2]
+
+
+index_cache = RenderCache("index")
+leaderboard_cache = RenderCache("leaderboard")
 
-    now_t, nxt, history, req = get_data()
 
+def _cached(cache: RenderCache, key, render, mimetype: str = "text/html") -> Response:
+    body, etag = cache.get(key, render)
+    if etag in request.if_none_match:
+        metrics.incr(f"overlay.{cache.name}.not_modified")
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate, so a change shows on the next load
+    return response
+
+
+def _render_index(snap, next_utc, next_city: str, popup_text: str) -> str:
+    now_t, nxt, history, req = get_data(snap)
     return render_template_string(
         HTML,
         now=now_t,
         nxt=nxt,
         history=history,
         requests=req,
-        next_city=ncity,
-        next_eta=neta,
+        next_city=next_city,
+        next_utc=next_utc.isoformat() if next_utc else "",
         popup_text=popup_text,
         refresh=REFRESH,
         bg=BG,
@@ -219,4 +323,135 @@ def index():
         fsize=FSIZE,
     )
 
+
+@app.route("/")
+def index():
+    try:
+        snap = station.get()
+    except Exception as e:
+        log(f"DB Query Error in Overlay: {e}")
+        snap = station.snapshot  # the last state read, if any
+
+    popup_text = ""
+    next_utc, next_city = shared_state["next_420_utc"], shared_state["next_420_city"]
+    if not (next_utc and next_city):
+        next_utc, next_city = None, ""
+
+    if shared_state["popup_expire_utc"] and datetime.now(pytz.utc) < shared_state["popup_expire_utc"]:
+        popup_text = shared_state["popup_message"]
+
+    key = (snap.version if snap else None, next_utc, next_city, popup_text)
+    return _cached(index_cache, key, lambda: _render_index(snap, next_utc, next_city, popup_text))
+
+# ===== Push =====
+# Overlays load the page once and then get Socket.IO events: "state" (all of
+# it) on connect, then "track", "next" and "requests" when the station
+# snapshot changes those parts, "blaze" when the next 4:20 moves and "popup"
+# when one fires. Nothing is polled per client.
+
+POPUP_SECONDS = 12
+_clients = 0
+_clients_lock = threading.Lock()
+
+
+def _track(row) -> dict:
+    return {"artist": row.get("artist") or "", "title": row.get("title") or ""} if row else None
+
+
+def _station_state(snap) -> dict:
+    if snap is None:
+        return {"now": None, "history": [], "next": None, "requests": []}
+    return {
+        "now": _track(snap.now),
+        "history": [_track(row) for row in snap.recent[1:]],
+        "next": _track(snap.next),
+        "requests": [dict(_track(row), username=row.get("username") or "") for row in snap.requests],
+    }
+
+
+def _blaze_state() -> dict:
+    utc = shared_state["next_420_utc"]
+    return {"city": shared_state["next_420_city"] or "", "utc": utc.isoformat() if utc else None}
+
+
+def _popup_state() -> dict:
+    expire = shared_state["popup_expire_utc"]
+    seconds = (expire - datetime.now(pytz.utc)).total_seconds() if expire else 0
+    return {"text": shared_state["popup_message"] if seconds > 0 else "", "seconds": max(0.0, seconds)}
+
+
+def _push(event: str, data: dict) -> None:
+    socketio.emit(event, data)
+    metrics.incr("overlay.pushes")
+
+
+def push_station_change(old, new) -> None:
+    """Station watcher: sends overlays the parts of the snapshot that changed."""
+    before, after = _station_state(old), _station_state(new)
+    if before["now"] != after["now"] or before["history"] != after["history"]:
+        _push("track", {"now": after["now"], "history": after["history"]})
+    if before["next"] != after["next"]:
+        _push("next", {"next": after["next"]})
+    if before["requests"] != after["requests"]:
+        _push("requests", {"requests": after["requests"]})
+
+
+def set_next_420(utc, city) -> None:
+    """Records the next 4:20 target; overlays are told only when it moves."""
+    if (utc, city) == (shared_state["next_420_utc"], shared_state["next_420_city"]):
+        return
+    shared_state["next_420_utc"], shared_state["next_420_city"] = utc, city
+    _push("blaze", _blaze_state())
+
+
+def show_popup(message: str, seconds: float = POPUP_SECONDS) -> None:
+    """Shows a 4:20 message on every overlay for a few seconds."""
+    shared_state["last_420_message"] = message
+    shared_state["popup_message"] = message
+    shared_state["popup_expire_utc"] = datetime.now(pytz.utc) + timedelta(seconds=seconds)
+    _push("popup", _popup_state())
+
+
+@socketio.on("connect")
+def on_connect():
+    global _clients
+    with _clients_lock:
+        _clients += 1
+        metrics.set_gauge("overlay.clients", _clients)
+    try:
+        state = _station_state(station.get())
+    except Exception as e:
+        log(f"DB Query Error in Overlay: {e}")
+        state = _station_state(station.snapshot)
+    emit("state", dict(state, blaze=_blaze_state(), popup=_popup_state()))
+
+
+@socketio.on("disconnect")
+def on_disconnect(*args):
+    global _clients
+    with _clients_lock:
+        _clients -= 1
+        metrics.set_gauge("overlay.clients", _clients)
+
+
+station.watchers.append(push_station_change)
+
+@app.route("/leaderboard")
+def leaderboard_json():
+    """Top point holders of the primary channel, for an overlay widget; no DB query in the usual case."""
+    try:
+        rows = leaderboards.top("community_points", LEADERBOARD_SIZE)
+    except Exception as e:
+        log(f"DB Query Error in Overlay: {e}")
+        rows = []
+    key = tuple(rows)
+    return _cached(leaderboard_cache, key,
+                   lambda: json.dumps([{"username": username, "points": points} for username, points in key]),
+                   mimetype="application/json")
+
+@app.route("/metrics")
+def metrics_json():
+    """Counters, gauges and latency summaries from every service in this process."""
+    return jsonify(metrics.snapshot())
+
 # Bleep game removed: /bleep route disabled
\ No newline at end of file
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+
+import metrics
+from utils import log
+
+
+class KeyedExecutor:
+    """A fixed pool of threads that runs tasks one at a time per key, in submission order.
+
+    Chat commands are keyed by user, so one viewer's !search and !pick always
+    run in the order they were typed while different viewers run in parallel.
+    submit() never blocks: when the pool is backed up past `max_pending`, or a
+    single key has `max_per_key` tasks waiting, the new task is shed instead.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 200, max_per_key: int = 3,
+                 name: str = "worker"):
+        self.name = name
+        self.max_pending = max_pending
+        self.max_per_key = max_per_key
+        self._cond = threading.Condition()
+        self._pending: dict = {}     # key -> deque of (fn, args, queued_at)
+        self._ready: deque = deque()  # keys with work that no thread is running
+        self._active: set = set()     # keys a thread is running right now
+        self._depth = 0
+        self._running = True
+        self._last_shed_log = 0.0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def submit(self, key, fn, *args) -> bool:
+        """Queues fn(*args) behind any earlier tasks for `key`. Returns False if shed."""
+        with self._cond:
+            if not self._running:
+                return False
+            tasks = self._pending.get(key)
+            if self._depth >= self.max_pending:
+                return self._shed("full")
+            if tasks is not None and len(tasks) >= self.max_per_key:
+                return self._shed("per_key")
+            if tasks is None:
+                tasks = self._pending[key] = deque()
+            tasks.append((fn, args, time.perf_counter()))
+            self._depth += 1
+            if len(tasks) == 1 and key not in self._active:
+                self._ready.append(key)
+                self._cond.notify()
+            metrics.set_gauge(f"{self.name}.queue_depth", self._depth)
+        return True
+
+    def _shed(self, reason: str) -> bool:
+        """Counts a rejected task. Caller holds the lock."""
+        metrics.incr(f"{self.name}.shed.{reason}")
+        now = time.monotonic()
+        if now - self._last_shed_log > 10:
+            self._last_shed_log = now
+            log(f"{self.name}: overloaded ({self._depth} queued), shedding work ({reason})")
+        return False
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                key = self._ready.popleft()
+                fn, args, queued_at = self._pending[key].popleft()
+                self._active.add(key)
+                self._depth -= 1
+                metrics.set_gauge(f"{self.name}.queue_depth", self._depth)
+            metrics.observe(f"{self.name}.wait_ms", (time.perf_counter() - queued_at) * 1000)
+            try:
+                fn(*args)
+            except Exception as e:
+                log(f"Error in {self.name} task {getattr(fn, '__name__', fn)}: {type(e).__name__}: {e}")
+            with self._cond:
+                self._active.discard(key)
+                if self._pending[key]:
+                    self._ready.append(key)
+                    self._cond.notify()
+                else:
+                    del self._pending[key]
+
+    def shutdown(self, wait: bool = False, timeout: float = 5.0) -> None:
+        """Stops the workers. Queued tasks that have not started are discarded."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                if t is not threading.current_thread():
+                    t.join(timeout)